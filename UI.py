@@ -2,25 +2,32 @@ import tkinter as tk
 from tkinter import filedialog, messagebox,ttk
 import periodictable
 import json
-import pandas as pd
 from matplotlib.figure import Figure
 import numpy as np
 from matplotlib.backends.backend_tkagg import (FigureCanvasTkAgg,NavigationToolbar2Tk)
+import copy
 import os
 import subprocess
 import sys
 from datetime import datetime
 import threading
+import queue
+import time
 import traceback
 from typing import Sequence, Literal
 
-from class_models import Element, Layer, Target
+from class_models import Element, Layer, Target, compile_target, target_signature, Job, CalculationCancelled
+from config import get_settings
 import UI_geometry
+import broadarchive
+import plotdecimate
+from broadarchive import ArchiveWriter
 import mod2
 import mod3 
 import mod4        
+import mod5
 
-def count_datapoints(df_raw: pd.DataFrame, header_row: int) -> int:
+def count_datapoints(df_raw: "pandas.DataFrame", header_row: int) -> int:
     # Count consecutive non-empty rows after the header
     count = 0
     for i in range(header_row + 1, len(df_raw)):
@@ -36,7 +43,7 @@ class GUI_App(tk.Tk):
         super().__init__()
 
         self.script_dir = os.path.dirname(os.path.abspath(__file__)) 
-        self.settings_path = os.path.join(self.script_dir, 'settings.json')
+        self.settings = get_settings()
         self.timestamp = datetime.now().strftime("%Y-%m-%d %H-%M-%S")
 
         self.title("HyProC")
@@ -49,10 +56,17 @@ class GUI_App(tk.Tk):
         self.style.configure("Working.TButton", background="orange", foreground="black")
 
         # Load settings for constants
-        self.Z2 = self.load_Z2(self.settings_path)
+        self.Z2 = self.load_Z2()
         self.Z2_profile = None
+        self.settings.subscribe(self.settings_changed)
 
         self.runNbr = 0
+        self.response_cache = None  # Response matrix of the last full calculation (see Calculation)
+        self.segmented_target = None  # Slabs of the target used by the last full calculation, self.target keeps the layers entered by the user
+        self.energy_grid = None  # (e_min, e_max, nbr_points, adaptive) of the generated curve, asked when there is no experimental curve
+        self.job = None  # Calculation running on a worker thread (see start_job)
+        self.sim_line = None  # Line artist of the simulated curve, updated while the curve is calculated (see stream_points)
+        self.stream = None
 
         self.target = Target()
         self.selected_layer_index = 0
@@ -60,6 +74,7 @@ class GUI_App(tk.Tk):
 
         self.std_target = Target()
         self.selected_Std_index = 0
+        self.std_energy = 6525  # keV, energy at which the standard is measured
 
         self.start_ctr = 0
         self.visible_count = 9
@@ -73,15 +88,22 @@ class GUI_App(tk.Tk):
         self.update_chi_plot()
         self.protocol("WM_DELETE_WINDOW", self.on_close)
 
-    def load_Z2(self, settings_path)->int:
+    def load_Z2(self)->int:
         """
         Loads Z2 (target atomic number) from settings.
         """
-        with open(settings_path, 'r', encoding="utf-8") as f:
-            settings = json.load(f)
-        Z2 = int(settings["reaction"]["Z2"])
+        Z2 = int(self.settings["reaction"]["Z2"])
         return Z2
 
+    def settings_changed(self, settings, changed: set[str])->None:
+        """
+        Called when the settings change (see config.Settings.subscribe): the response matrix of the last calculation
+        no longer applies if the reaction, resonance or stopping powers changed.
+        """
+        self.Z2 = self.load_Z2()
+        if changed & {"reaction", "resonance", "stopping", "SRIM_path"}:
+            self.response_cache = None
+
     def update_chi_plot(self)->None:
         self.ax1.clear()
         visible_values = self.chi_val[self.start_ctr:self.start_ctr + self.visible_count]
@@ -139,11 +161,14 @@ class GUI_App(tk.Tk):
         )
         
         if check1:
-            self.ax0.scatter(self.exp_energy, self.ec_yield, label='Exp', marker='.', color='tab:blue')
-            self.ax0.errorbar(self.exp_energy, self.ec_yield, self.ec_yErr, fmt='none', color='tab:blue')
+            # Large curves are drawn decimated to the resolution of the plot (see plotdecimate)
+            plotdecimate.plot(self.ax0, self.exp_energy, self.ec_yield, label='Exp', linestyle='none', marker='.', color='tab:blue')
+            plotdecimate.errorbar(self.ax0, self.exp_energy, self.ec_yield, self.ec_yErr, color='tab:blue')
         
+        self.sim_line = None
+        self.stream = None
         if check2:
-            self.ax0.plot(self.sim_energy, self.sim_curve, label='Sim', linestyle='--', marker='.', color='tab:orange')
+            self.sim_line = plotdecimate.plot(self.ax0, self.sim_energy, self.sim_curve, label='Sim', linestyle='--', marker='.', color='tab:orange')
         
         if check1 or check2:  # Only add legend if at least one curve is plotted
             self.ax0.legend(loc='best')
@@ -154,6 +179,70 @@ class GUI_App(tk.Tk):
         self.ax0.grid(alpha=0.4)
         self.canvas.draw()       
 
+    def start_stream(self, energies: list[float])->None:
+        """
+        Prepares the plot for a simulated curve calculated point by point: the previous simulated curve is removed
+        and the line of the new one is animated, i.e. redrawn alone over a saved background (blitting).
+        """
+        self.sim_energy = []
+        self.sim_curve = []
+        if self.sim_line is None or self.sim_line.axes is None:
+            self.sim_line = plotdecimate.plot(self.ax0, [], [], label='Sim', linestyle='--', marker='.', color='tab:orange')
+            self.ax0.legend(loc='best')
+        self.sim_line.set_data([], [])
+        self.sim_line.set_animated(True)
+        if not self.ax0.collections:  # No experimental curve: the x range is that of the simulated energies
+            margin = 0.02*(max(energies) - min(energies)) or 1.0
+            self.ax0.set_xlim(min(energies) - margin, max(energies) + margin)
+        self.stream = {"background": None, "last_draw": 0.0, "dirty": False}
+        self.redraw_stream_background()
+
+    def redraw_stream_background(self)->None:
+        """
+        Draws the whole figure without the streamed line and saves it as background.
+        """
+        self.canvas.draw()
+        self.stream["background"] = self.canvas.copy_from_bbox(self.ax0.bbox)
+        self.stream["dirty"] = True
+
+    def stream_points(self, energies: list[float], values: list[float])->None:
+        """
+        Adds newly calculated points to the simulated curve. The plot is updated by flush_stream.
+        """
+        if self.stream is None:
+            return
+        self.sim_energy.extend(energies)
+        self.sim_curve.extend(values)
+        self.stream["dirty"] = True
+
+    def flush_stream(self, interval: float = 0.25)->None:
+        """
+        Redraws the streamed line at most every ``interval`` seconds: only the line is drawn over the saved background and blitted,
+        unless the new points are out of the y range, in which case the axis is extended and the background redrawn.
+        """
+        if self.stream is None or not self.stream["dirty"] or time.perf_counter() - self.stream["last_draw"] < interval:
+            return
+        self.sim_line.set_data(self.sim_energy, self.sim_curve)  # Sorted by the line: points of an adaptive sampling come unsorted
+        if self.sim_curve and max(self.sim_curve) > self.ax0.get_ylim()[1]:
+            self.ax0.set_ylim(0, 1.1*max(self.sim_curve))
+            self.redraw_stream_background()
+        self.canvas.restore_region(self.stream["background"])
+        self.ax0.draw_artist(self.sim_line)
+        self.canvas.blit(self.ax0.bbox)
+        self.stream["dirty"] = False
+        self.stream["last_draw"] = time.perf_counter()
+
+    def end_stream(self)->None:
+        """
+        Turns the streamed line back into a normal artist (e.g. after a cancelled calculation, the partial curve stays on the plot).
+        """
+        if self.stream is None:
+            return
+        self.flush_stream(interval=0.0)
+        self.sim_line.set_animated(False)
+        self.stream = None
+        self.canvas.draw_idle()
+
     # -------------------------------------------
     # GUI updates in top frames
     def refresh_layer_list(self)->None:
@@ -214,7 +303,19 @@ class GUI_App(tk.Tk):
 
     # -------------------------------------------
     # Target Config Commands
+    def editing_locked(self)->bool:
+        """
+        Whether a job is running: the target, the standard and the curves can't be edited until it ends
+        (the entries are reset to the values in use when it ends, see poll_job).
+        """
+        if self.job is None:
+            return False
+        self.progress_label.config(text=f"{self.job.name} running: editing is locked until it ends.")
+        return True
+
     def on_add_layer_click(self)->None:
+        if self.editing_locked():
+            return
         self.target.add_layer()
         self.selected_layer_index = len(self.target["layers"]) - 1
         self.selected_el_index = 0
@@ -222,6 +323,8 @@ class GUI_App(tk.Tk):
         self.refresh_element_list()
 
     def on_remove_layer_click(self)->None:
+        if self.editing_locked():
+            return
         self.target.remove_layer(self.selected_layer_index)
         self.selected_layer_index = max(0, self.selected_layer_index - 1)
         self.selected_el_index = 0
@@ -229,18 +332,24 @@ class GUI_App(tk.Tk):
         self.refresh_element_list()
 
     def on_duplicate_layer_click(self)->None:
+        if self.editing_locked():
+            return
         self.target.duplicate_layer(self.selected_layer_index)
         self.selected_layer_index = self.selected_layer_index + 1
         self.refresh_layer_list()
         self.refresh_element_list()
 
     def on_move_layer_up_click(self)->None:
+        if self.editing_locked():
+            return
         self.target.move_layer_up(self.selected_layer_index)
         self.selected_layer_index -= 1 if self.selected_layer_index > 0 else 0
         self.refresh_layer_list()
         self.refresh_element_list()
 
     def on_move_layer_down_click(self)->None:
+        if self.editing_locked():
+            return
         self.target.move_layer_down(self.selected_layer_index)
         self.selected_layer_index += 1 if self.selected_layer_index < len(self.target["layers"]) - 1 else 0
         self.refresh_layer_list()
@@ -248,6 +357,8 @@ class GUI_App(tk.Tk):
 
 
     def on_add_element_click(self, target_type: Literal['target', 'std'] = 'target')->None:
+        if self.editing_locked():
+            return
         try:
             if target_type == 'target':
                 self.target["layers"][self.selected_layer_index].add_element()
@@ -262,6 +373,8 @@ class GUI_App(tk.Tk):
             pass 
 
     def on_remove_element_click(self, target_type: Literal['target', 'std'] = 'target')->None:
+        if self.editing_locked():
+            return
         if target_type == 'target':
             self.target["layers"][self.selected_layer_index].remove_element(self.selected_el_index)
             self.selected_el_index = max(0, self.selected_el_index - 1)
@@ -273,6 +386,8 @@ class GUI_App(tk.Tk):
             self.refresh_Std_list()                
 
     def on_lock_and_normalize_click(self, target_type: Literal['target', 'std'] = 'target')->None:
+        if self.editing_locked():
+            return
         if target_type=='target':
             current_layer = self.target["layers"][self.selected_layer_index]
             index = self.selected_el_index
@@ -312,6 +427,8 @@ class GUI_App(tk.Tk):
         """
         Updates the layer listbox when values in the text entries are modified
         """
+        if self.editing_locked():
+            return
         selected = self.layer_listbox.curselection()
         if not selected:
             return
@@ -349,6 +466,8 @@ class GUI_App(tk.Tk):
         """
         Updates the element listbox when values in the text entries are modified
         """
+        if self.editing_locked():
+            return
         selected = self.elem_listbox.curselection()  # Get selected element in the list
         if not selected:
             return
@@ -392,6 +511,8 @@ class GUI_App(tk.Tk):
         """
         Updates the standard listbox when one of the text entry is changed
         """
+        if self.editing_locked():
+            return
         selected = self.Std_elem_listbox.curselection()  # Get Std selected element in the list
         if not selected:
             return
@@ -418,6 +539,10 @@ class GUI_App(tk.Tk):
 
     # -------------------------------------------  
     def load_curve(self)->None:
+        if self.editing_locked():
+            return
+        import pandas as pd  # Slow import, only needed when a curve is loaded
+
         file_path = filedialog.askopenfilename(
             title="Load Excitation Curve",
             filetypes=[
@@ -430,8 +555,7 @@ class GUI_App(tk.Tk):
         if not file_path:
             return 
         try:
-            with open(self.settings_path, 'r', encoding="utf-8") as f:
-                config = json.load(f)["import_curve"]["columns"]
+            config = self.settings["import_curve"]["columns"]
 
             ext = os.path.splitext(file_path)[1].lower()
             if ext in [".xlsx", ".xls"]:
@@ -544,7 +668,7 @@ class GUI_App(tk.Tk):
         popup.wait_window()  # Blocks until popup is closed
         return result[0]
 
-    def ask_table(self, df_raw: pd.DataFrame, header_rows: list[int], cols: list[str])-> tuple[int, int]:
+    def ask_table(self, df_raw: "pandas.DataFrame", header_rows: list[int], cols: list[str])-> tuple[int, int]:
         popup = tk.Toplevel()
         popup.transient(self)
         popup.grab_set()
@@ -579,6 +703,8 @@ class GUI_App(tk.Tk):
         return result[0]
     
     def load_std(self)->None:
+        if self.editing_locked():
+            return
         file_path = filedialog.askopenfilename(title="Load Standard", filetypes=[("JSON files", "*.json")])
         if not file_path:
             return
@@ -599,7 +725,7 @@ class GUI_App(tk.Tk):
             self.std_target["layers"] = [selected_layer]
             self.std_target["layers"][0]["areal_density"] = 1500.0
 
-            if not mod2.check_srim_path(self.settings_path):
+            if mod2.backend_name == "srim" and not mod2.check_srim_path():
                 messagebox.showerror("Loading standard failed", "SRIM path not found.\n\nPlease check your settings.")
                 return
             self.std_target["layers"][0]["stopping"] = mod2.calc_stopping_power(self.std_target["layers"][0], 6385)
@@ -658,6 +784,8 @@ class GUI_App(tk.Tk):
         return result[0]
 
     def load_target(self)->None:
+        if self.editing_locked():
+            return
         file_path = filedialog.askopenfilename(title="Load Target", filetypes=[("JSON files", "*.json")])
         if not file_path:
             return
@@ -673,6 +801,8 @@ class GUI_App(tk.Tk):
         self.TargetStd_notebook.select(self.target_frame)  # Switch to the relevent tab
 
     def generate_exp_curve(self)->None:
+        if self.editing_locked():
+            return
         if not hasattr(self, "sim_curve"):
             messagebox.showerror("Generate curve","No simulation curve data to load as experimental curve.")
             return
@@ -681,6 +811,8 @@ class GUI_App(tk.Tk):
         self.update_exc_plot()
     
     def on_remove_exp(self)->None:
+        if self.editing_locked():
+            return
         self.ec_yield = []
         self.ec_yErr = []
         self.update_exc_plot()
@@ -688,6 +820,7 @@ class GUI_App(tk.Tk):
     def on_remove_sim(self)->None:
         self.sim_curve = []
         self.sim_energy = []
+        self.energy_grid = None  # Without experimental curve, the next run asks the energy range again
         self.update_exc_plot()
 
     def reset_chi_history(self)->None:
@@ -702,8 +835,7 @@ class GUI_App(tk.Tk):
         popup.title("Settings")
         popup.columnconfigure(1, weight=1)
 
-        with open(self.settings_path, 'r', encoding="utf-8") as f:
-            config = json.load(f)
+        config = self.settings
 
         label_width = 25
         entry_width = 40
@@ -748,18 +880,65 @@ class GUI_App(tk.Tk):
         yield_err_entry.insert(0, config["import_curve"]["columns"]["yield_err"])
         yield_err_entry.grid(row=4, column=1, columnspan=2, padx=10, pady=(0,5), sticky="ew")
 
+        # Reaction and resonance
+        fields = [
+            ("reaction", "Z1", "Beam ion Z1:"),
+            ("reaction", "A1", "Beam ion mass number A1:"),
+            ("reaction", "Z2", "Profiled element Z2:"),
+            ("reaction", "A2", "Profiled element mass number A2:"),
+            ("resonance", "E_R", "Resonance energy (keV):"),
+            ("resonance", "Gamma", "Resonance width (keV):"),
+            ("resonance", "Sigma", "Resonance cross section (mb):"),
+        ]
+        field_entries = {}
+        for i, (section, key, text) in enumerate(fields):
+            pady = (5,0) if i in (0, 4) else 0
+            ttk.Label(popup, text=text,width=label_width).grid(row=5+i, column=0, padx=10, pady=pady, sticky="w")
+            entry = ttk.Entry(popup, width=entry_width+browse_width)
+            entry.insert(0, config[section][key])
+            entry.grid(row=5+i, column=1, columnspan=2, padx=10, pady=pady, sticky="ew")
+            field_entries[(section, key)] = entry
+
+        # Stopping power source
+        row = 5+len(fields)
+        ttk.Label(popup, text="Stopping powers:",width=label_width).grid(row=row, column=0, padx=10, pady=(5,0), sticky="w")
+        backend_combobox = ttk.Combobox(popup, values=["srim", "table", "analytic"], state="readonly", width=entry_width)
+        backend_combobox.set(config["stopping"].get("backend", "srim"))
+        backend_combobox.grid(row=row, column=1, columnspan=2, padx=10, pady=(5,0), sticky="ew")
+        ttk.Label(popup, text="srim: SRIM's SR Module. table: stopping tables saved from SRIM runs.\n"
+                              "analytic: approximate built-in formulas, for tests on machines without SRIM (not for results).",
+                  foreground="gray").grid(row=row+1, column=0, columnspan=3, padx=10, pady=(0,5), sticky="w")
+
         def save_settings():
-            config["SRIM_path"] = srim_entry.get()
-            config["save_path"] = save_entry.get()
-            config["import_curve"]["columns"]["energy"] = energy_entry.get()
-            config["import_curve"]["columns"]["yield"] = yield_entry.get()
-            config["import_curve"]["columns"]["yield_err"] = yield_err_entry.get()
-            with open(self.settings_path, 'w', encoding="utf-8") as f:
-                json.dump(config, f, indent=4)
-            self.Z2 = self.load_Z2(self.settings_path)
+            if self.job is not None:
+                messagebox.showwarning("Settings", "The settings cannot be changed while a calculation is running.")
+                return
+            try:
+                reaction = {key: str(int(field_entries[("reaction", key)].get())) for key in ("Z1", "A1", "Z2", "A2")}
+                for Z, A in ((reaction["Z1"], reaction["A1"]), (reaction["Z2"], reaction["A2"])):
+                    periodictable.elements[int(Z)][int(A)].mass
+                resonance = {key: float(field_entries[("resonance", key)].get()) for key in ("E_R", "Gamma", "Sigma")}
+                if resonance["E_R"] <= 0 or resonance["Gamma"] <= 0 or resonance["Sigma"] <= 0:
+                    raise ValueError
+            except (ValueError, KeyError):
+                messagebox.showerror("Invalid settings", "Invalid reaction or resonance.\n\nThe ions must be existing isotopes (Z, A) and the resonance values positive numbers.")
+                return
+            changes = {
+                "SRIM_path": srim_entry.get(),
+                "save_path": save_entry.get(),
+                "import_curve": {"columns": {"energy": energy_entry.get(), "yield": yield_entry.get(), "yield_err": yield_err_entry.get()}},
+                "reaction": reaction,
+                "resonance": resonance,
+                "stopping": {"backend": backend_combobox.get()},
+            }
+            try:
+                self.settings.apply(changes)  # Saved, and the modules are notified (see config)
+            except OSError as e:
+                messagebox.showerror("Settings", f"The settings could not be saved.\n\n{e}")
+                return
             popup.destroy()
 
-        ttk.Button(popup, text="Save", command=save_settings).grid(row=5, column=0, columnspan=3, pady=10)
+        ttk.Button(popup, text="Save", command=save_settings).grid(row=row+2, column=0, columnspan=3, pady=10)
 
         popup.withdraw()
         popup.update_idletasks()
@@ -767,7 +946,7 @@ class GUI_App(tk.Tk):
         y = self.winfo_y() + (self.winfo_height() // 2) - (popup.winfo_height() // 2)
         popup.geometry(f"+{x}+{y}")
         popup.deiconify()
-        popup.minsize(400, 175)
+        popup.minsize(400, 360)
 
     def open_manual(self):
         manual_path = os.path.join(self.script_dir, "HyProC_Manual.pdf")
@@ -778,7 +957,11 @@ class GUI_App(tk.Tk):
         else:
             subprocess.run(["xdg-open", manual_path])
 
-    def ask_energy_range(self) -> tuple[float, float] | None:
+    def ask_energy_range(self) -> tuple[float, float, int, bool] | None:
+        """
+        Asks the energy range and number of points of a simulated curve, and whether the energies are chosen adaptively
+        (see mod4.adaptive_layer_masses, the number of points is then a maximum).
+        """
         popup = tk.Toplevel()
         popup.withdraw()  # Hide the window until it's properly sized and positioned
         popup.transient(self)
@@ -803,6 +986,9 @@ class GUI_App(tk.Tk):
         nbr_entry.insert(0, str(getattr(self, "nbr_points", 150)))
         nbr_entry.grid(row=3, column=1, padx=10, pady=5)
 
+        adaptive_var = tk.BooleanVar(value=getattr(self, "adaptive_sampling", False))
+        ttk.Checkbutton(popup, text="Adaptive sampling (number of points is a maximum)", variable=adaptive_var).grid(row=4, column=0, columnspan=2, padx=10, pady=5, sticky="w")
+
         result = [None]
 
         def generate():
@@ -813,7 +999,7 @@ class GUI_App(tk.Tk):
                     messagebox.showerror("Invalid Range", "Minimum energy must be less than maximum energy.")
                     return
                 nbr = int(nbr_entry.get())
-                result[0] = (e_min, e_max, nbr)
+                result[0] = (e_min, e_max, nbr, adaptive_var.get())
                 popup.destroy()
             except ValueError:
                 messagebox.showerror("Invalid Input", "Please enter valid numeric values for both energies.")
@@ -823,7 +1009,7 @@ class GUI_App(tk.Tk):
             popup.destroy()
 
         btn_frame = ttk.Frame(popup)
-        btn_frame.grid(row=4, column=0, columnspan=2, pady=10)
+        btn_frame.grid(row=5, column=0, columnspan=2, pady=10)
         ttk.Button(btn_frame, text="Cancel", command=cancel).pack(side="left", padx=5)
         ttk.Button(btn_frame, text="Generate", command=generate).pack(side="left", padx=5)
 
@@ -841,66 +1027,144 @@ class GUI_App(tk.Tk):
     # -------------------------------------------
     def start_calc(self)->None:
         """
-        Prevents the GUI from freezing under load.
+        Checks the calculation inputs, then runs the calculation on a worker thread so that the GUI does not freeze (see start_job).
+        """
+        if self.job is not None:
+            return
+        params = self.get_calc_parameters()
+        if params is None:
+            return
+        # Checking settings: Can save path be accessed?
+        if not os.path.exists(self.settings["save_path"]):
+            messagebox.showerror("Calculation failed", "Save path not found.\n\nPlease check your settings.")
+            return
+        options = {
+            "SaveBroadData": self.broadSave_bool.get(),
+            "trackTargetChange": self.TrackTargetChange_bool.get(),
+            "FastZ2": self.FastZ2_bool.get(),
+            "adaptive": False,
+            "grid": None,
+        }
+
+        # If no experimental curve loaded, ask for energy range to generate a simulated curve (kept for the next runs, until the simulated curve is removed)
+        if not hasattr(self, "ec_yield") or not self.ec_yield:
+            if getattr(self, "ec_yield", []) is not None or self.energy_grid is None:
+                result = self.ask_energy_range()
+                if result is None:
+                    return
+                self.energy_grid = result
+                self.e_min, self.e_max, self.nbr_points, self.adaptive_sampling = result
+                self.exp_energy = list(np.linspace(self.e_min, self.e_max, self.nbr_points))  # Replaced by the chosen energies with adaptive sampling
+            options["grid"] = self.energy_grid
+            options["adaptive"] = self.energy_grid[3] and not options["SaveBroadData"]
+            self.ec_yield = None  # No experimental yield
+
+        if self.std_target["layers"][0].normalize():
+            self.refresh_Std_list()
+            print("Standard layer normalised.")
+        self.target.normalize_all_layers()
+        # The worker only reads copies: the target and the energies are those of the run even if they change meanwhile
+        self.start_job("Calculation", self.Calculation, params, options, copy.deepcopy(self.target), list(self.exp_energy))
+
+    def start_job(self, name: str, function, *args, text: str = "Working...")->None:
+        """
+        Runs ``function(job, *args)`` on a worker thread. The worker must not touch the widgets: it posts its GUI updates
+        and progress to the job, which are applied on the main thread by poll_job.
+        """
+        self.job = Job(name)
+        self.run_button.config(text=text, style="Working.TButton", state="disabled")
+        self.cancel_button.config(state="normal")
+        self.progress_bar.config(value=0)
+        self.progress_label.config(text="")
+        self.job.start(function, *args)
+        self.after(100, self.poll_job)
+
+    def poll_job(self)->None:
+        """
+        Applies the GUI updates and the progress posted by the running job, until the job ends.
         """
-        threading.Thread(target=self.Calculation).start() 
+        job = self.job
+        while True:
+            try:
+                message = job.queue.get_nowait()
+            except queue.Empty:
+                break
+            if message[0] == "call":
+                function, args = message[1:]
+                function(*args)
+            else:
+                phase, done, total, eta = message[1:]
+                if job.cancelled:
+                    continue
+                if total:
+                    self.progress_bar.config(value=100*done/total)
+                    text = f"{phase}: {done}/{total}"
+                    if eta is not None and done < total:
+                        text += f", {eta:.0f} s left" if eta < 120 else f", {eta/60:.0f} min left"
+                else:
+                    self.progress_bar.config(value=0)
+                    text = f"{phase}: {done}" if done else f"{phase}..."
+                self.progress_label.config(text=text)
+
+        self.flush_stream()
+
+        if job.running() or not job.queue.empty():
+            self.after(100, self.poll_job)
+            return
+        self.end_stream()
+        # Unlocking the "Run Calculation" button
+        self.job = None
+        self.run_button.config(text="Run calculation",style="Default.TButton", state="normal")
+        self.cancel_button.config(state="disabled")
+        self.progress_bar.config(value=0)
+        self.progress_label.config(text="Cancelled" if job.cancelled else "")
+        # Entries typed in while editing was locked
+        self.refresh_layer_list()
+        self.refresh_element_list()
+        self.refresh_Std_list()
+        for function in job.on_finish:
+            function()
 
-    def std_calc(self, yield_value:float, beamWidth:float, DopplerYesNo:bool, straggling_model:str)->float:
+    def cancel_job(self)->None:
+        """
+        Stops the running job at the next energy point (or layer, or fit evaluation).
+        """
+        if self.job is not None:
+            self.job.cancel()
+            self.cancel_button.config(state="disabled")
+            self.progress_label.config(text="Cancelling...")
+
+    def std_calc(self, yield_value:float, beamWidth:float, DopplerYesNo:bool, straggling_model:str, stopping:float | None = None, kernel:str="convolve")->float:
         """
         Calculates the K factor (experimental set-up detection efficiency) based on the standard description.
+        The stopping power of the standard can be given if it was already computed (e.g. on a SRIM worker).
+        kernel selects how the broadening profile is built ("convolve" or "voigt", see mod3.broadening).
         """      
-        energy = 6525 
-        self.std_target["layers"][0]["stopping"] = mod2.calc_stopping_power(self.std_target["layers"][0], energy)
-        xc,x,y, layers_contribution, outOfTarget = mod3.broadening(energy, self.std_target, beamWidth, DopplerYesNo, straggling_model, False, None)
-
-        #print(f"DEBUG: Broadening output shapes: x={np.array(x).shape}, y={np.array(y).shape}")
-        #print(f"DEBUG: x range: [{np.min(x):.3f}, {np.max(x):.3f}], y range: [{np.min(y):.6f}, {np.max(y):.6f}]")
-        #print(f"DEBUG: x finite: {np.all(np.isfinite(x))}, y finite: {np.all(np.isfinite(y))}")
-        
-        try:
-            value = mod4.compute_yield(self.std_target, x, y)
-        except ValueError as e:
-            print(f"DEBUG: compute_yield raised ValueError: {e}")
-            raise
-        
-        #print(f"DEBUG: Computed yield value: {value}, finite: {np.isfinite(value)}")
-        if not np.isfinite(value) or value == 0.0:
-            raise ValueError(f"Standard yield integral is invalid (value={value}). Check target and broadening data.")
-        K = yield_value / value
-        #print(self.std_target)
+        K = mod4.compute_k_factor(self.std_target, yield_value, beamWidth, DopplerYesNo, straggling_model, kernel, self.std_energy, stopping)
         print("K calculated: ", K)
         return K        
 
-    def Calculation(self)->None:
+    def get_calc_parameters(self, title:str="Calculation failed")->dict | None:
         """
-        Generates a simulated excitation curve.
+        Checks the SRIM path and the standard, and retrieves the calculation parameters from the GUI.
+        Shows an error and returns None if something is missing.
         """
-        # Checking settings: Can SRIM & save paths can be accessed?
-        if not mod2.check_srim_path(self.settings_path):
-            messagebox.showerror("Calculation failed", "SRIM path not found.\n\nPlease check your settings.")
-            return
-        with open(self.settings_path, 'r', encoding="utf-8") as f:
-            path = json.load(f)["save_path"]
-            found = os.path.exists(path)
-        if not found:
-            messagebox.showerror("Calculation failed", "Save path not found.\n\nPlease check your settings.")
-            return
-        
+        # Checking settings: Can SRIM path be accessed?
+        if mod2.backend_name == "srim" and not mod2.check_srim_path():
+            messagebox.showerror(title, "SRIM path not found.\n\nPlease check your settings.")
+            return None
+
         # Retrieving info from GUI
         try:
             beamWidth = float(self.beamSD_entry.get())
         except:
-            messagebox.showerror("Calculation failed", "No beam width value was entered.")
-            return 
+            messagebox.showerror(title, "No beam width value was entered.")
+            return None
         try:
             std_yield = float(self.std_Yield_entry.get())
         except:
-            messagebox.showerror("Calculation failed", "No standard yield value was entered.")
-            return
-        DopplerYesNo = self.Doppler_bool.get()
-        SaveBroadData = self.broadSave_bool.get()
-        trackTargetChange = self.TrackTargetChange_bool.get()
-        straggling_model = self.straggling_model_combobox.get()
+            messagebox.showerror(title, "No standard yield value was entered.")
+            return None
         try:
             offset = float(self.offset_entry.get())
         except:
@@ -909,42 +1173,81 @@ class GUI_App(tk.Tk):
         # Check for the element of interest in the standard
         percent_at = self.std_target["layers"][0].find_element(Z=self.Z2)
         if percent_at is None or percent_at == 0:
-            messagebox.showerror("Calculation failed", f"Standard calculation error.\n\nNo {periodictable.elements[self.Z2].name.capitalize()} in the standard.")
-            return
-
-        # If no experimental curve loaded, ask for energy range to generate a simulated curve
-        if not hasattr(self, "ec_yield") or not self.ec_yield:
-            result = self.ask_energy_range()
-            if result is None:
-                return
-            self.e_min, self.e_max, self.nbr_points = result
-            self.exp_energy = list(np.linspace(self.e_min, self.e_max, self.nbr_points))
-            self.ec_yield = None  # No experimental yield
-
-        # Calculating K factor
-        try:
-            print("*-*-*-*-*-*-* Starting Calculation *-*-*-*-*-*-*")  
-            if self.std_target["layers"][0].normalize():
-                self.refresh_Std_list()
-                print("Standard layer normalised.")
-            K = self.std_calc(std_yield, beamWidth, DopplerYesNo, straggling_model)
-        except:
-            messagebox.showerror("Calculation failed", "Standard calculation error.\n\nMake sure all the standards information were correctly entered.")
-            raise Exception("Standard calculation failed.")
-        
+            messagebox.showerror(title, f"Standard calculation error.\n\nNo {periodictable.elements[self.Z2].name.capitalize()} in the standard.")
+            return None
+
+        return {
+            "beamWidth": beamWidth,
+            "std_yield": std_yield,
+            "Doppler": self.Doppler_bool.get(),
+            "kernel": "voigt" if self.Voigt_bool.get() else "convolve",
+            "straggling_model": self.straggling_model_combobox.get(),
+            "offset": offset,
+        }
+
+    def response_key(self, params: dict, target: Target, energies: list[float], grid: tuple | None = None)-> tuple:
+        """
+        Describes everything the response matrix of the target depends on: the run parameters, the standard, the energies
+        and the target except the Z2 content of its layers (only the proportions between the other elements are kept).
+        A generated curve is described by the energy range asked (``grid``, see start_calc) rather than by its energies,
+        which adaptive sampling chooses from the curve.
+        """
+        layers = []
+        for layer in target["layers"]:
+            others = [(el["Z"], el["percent_at"]) for el in layer["elements"] if el["Z"] != self.Z2]
+            total = sum(pct for Z, pct in others)
+            layers.append((layer["areal_density"], tuple((Z, round(pct/total, 9) if total > 0 else 0.0) for Z, pct in others)))
+        return (tuple(layers), tuple(sorted(params.items())), grid if grid is not None else tuple(energies), target_signature(self.std_target),
+                self.std_energy, self.Z2, mod2.backend_name)
+
+    def Calculation(self, job: Job, params: dict, options: dict, target: Target, exp_energy: list[float])->None:
+        """
+        Generates a simulated excitation curve. Runs on the worker thread of ``job`` (see start_calc): the widgets are only updated through job.post.
+        When only the Z2 content of the layers changed since the last run (and fast updates are enabled), the curve is obtained
+        from the response matrix of that run (yield = K * R @ cH), at its energies: the stopping powers and straggling of the last run are reused as is.
+        The layers are cut into slabs of nearly constant stopping power (mod2.segment_target) for the calculation only:
+        self.target keeps the layers entered by the user and the response matrix has one column per layer.
+        ``target`` and ``exp_energy`` are copies made by start_calc: the worker never reads the target or the energies being edited.
+        """
+        beamWidth = params["beamWidth"]
+        std_yield = params["std_yield"]
+        DopplerYesNo = params["Doppler"]
+        kernel = params["kernel"]
+        straggling_model = params["straggling_model"]
+        offset = params["offset"]
+        SaveBroadData = options["SaveBroadData"]
+        trackTargetChange = options["trackTargetChange"]
+        grid = options["grid"]
+
+        print("*-*-*-*-*-*-* Starting Calculation *-*-*-*-*-*-*")  
         try:
-            self.run_button.config(text="Working...", style="Working.TButton", state="disabled")
-
-            # Normalising target
-            self.target.normalize_all_layers()
-            size_before = len(self.target["layers"])
-            self.target = mod2.assign_stopping(self.target, max(self.exp_energy))
-            self.refresh_layer_list()
-            self.refresh_element_list()            
+            slabs_before = None if self.segmented_target is None else len(self.segmented_target["layers"])
+
+            # Only the Z2 content changed since the last run: stopping powers, K factor and response matrix are reused
+            fast_path = options["FastZ2"] and not SaveBroadData and self.response_cache is not None and self.response_cache["key"] == self.response_key(params, target, exp_energy, grid)
+            if fast_path:
+                print("Only the Z2 content of the target changed: using the response matrix of the last run.")
+                K = self.response_cache["K"]
+                if grid is not None and exp_energy != self.response_cache["energies"]:
+                    exp_energy = self.response_cache["energies"]  # Same range asked: energies chosen by the adaptive sampling of that run
+                    job.post(self.set_generated_energies, exp_energy)
+            else:
+                # The standard's stopping power is computed on a SRIM worker while the target is being segmented
+                job.phase("Stopping powers")
+                if mod2.backend_name == "srim" and mod2.table_mode:
+                    mod2.prepare_stopping_tables(target["layers"] + self.std_target["layers"], max(max(exp_energy), self.std_energy))
+                std_stopping = mod2.submit_stopping_power(self.std_target["layers"][0], self.std_energy)
+                self.segmented_target, parents = mod2.segment_target(target, max(exp_energy), job.progress)
+
+                # Calculating K factor
+                try:
+                    K = self.std_calc(std_yield, beamWidth, DopplerYesNo, straggling_model, std_stopping.result(), kernel)
+                except:
+                    job.post(messagebox.showerror, "Calculation failed", "Standard calculation error.\n\nMake sure all the standards information were correctly entered.")
+                    raise Exception("Standard calculation failed.")
 
             # Generating paths for saving data
-            with open(self.settings_path, 'r', encoding="utf-8") as f:
-                path = os.path.join(json.load(f)["save_path"], "HyProC")
+            path = os.path.join(self.settings["save_path"], "HyProC")
             if self.runNbr == 0:
                 self.session_dir = os.path.join(path, "Session "+ self.timestamp)
             if SaveBroadData or trackTargetChange:
@@ -952,62 +1255,106 @@ class GUI_App(tk.Tk):
                 target_dir = os.path.join(self.session_dir, f"Run {self.runNbr}")
                 os.mkdir(target_dir)
                 if trackTargetChange:
-                    self.save_json(savepath=target_dir+'/_target.json')
+                    self.save_json(savepath=target_dir+'/_target.json', target=target)
 
-            self.sim_energy = []
-            self.sim_curve = []
+            sim_energy = []
+            sim_curve = []
             countE = 0
 
-            # Actual calculation loop
-            for energy in self.exp_energy:
-                if SaveBroadData:
-                    sub_dir = f'datapoint{countE}'
-                    savepath = os.path.join(target_dir, sub_dir)
-                    os.mkdir(savepath)
-                    with open(os.path.join(savepath,f'_E={energy:.1f}kev.dat'),'w') as f:
-                        pass
+            job.phase("Broadening")
+            if fast_path:
+                R = self.response_cache["R"]
+                sim_energy = [energy+offset for energy in exp_energy]
+                sim_curve = list(K*R @ compile_target(target, self.Z2).Z2_fraction)
+            elif not SaveBroadData:
+                compiled_target = compile_target(self.segmented_target, self.Z2)  # NumPy form shared by all the energies
+                # Response matrix: broadening mass of each layer at each energy, the energies being shared between the worker processes set in the settings
+                # The points are plotted as they are calculated
+                job.post(self.start_stream, [energy+offset for energy in exp_energy])
+                def partial(energies: np.ndarray, rows: np.ndarray)->None:
+                    job.post(self.stream_points, list(energies+offset), list(K*rows @ compiled_target.Z2_fraction))
+                if options["adaptive"]:
+                    # Generated curve: energies refined where the curve bends (the number of points is a maximum)
+                    e_min, e_max, nbr_points = grid[:3]
+                    energies, R = mod4.adaptive_layer_masses(compiled_target, e_min, e_max, beamWidth, DopplerYesNo, straggling_model, kernel,
+                                                             max_points=nbr_points, progress=job.progress, partial=partial)
+                    exp_energy = list(energies)
+                    job.post(self.set_generated_energies, exp_energy)
+                    print(f"Adaptive sampling: {len(energies)} energies calculated (maximum {nbr_points}).")
                 else:
-                    savepath = None
-
-                xc, x, y, layers_contribution, outOfTarget = mod3.broadening(energy, self.target, beamWidth, DopplerYesNo, straggling_model, SaveBroadData, savepath)
-                #print(f"DEBUG: Broadening output shapes: x={np.array(x).shape}, y={np.array(y).shape}")
-                #print(f"DEBUG: x range: [{np.min(x):.3f}, {np.max(x):.3f}], y range: [{np.min(y):.6f}, {np.max(y):.6f}]")
-
-                integral_yield = mod4.compute_yield(self.target, x, y)
-                #print('K*integral_yield: ', K, '*', integral_yield, '=', K * integral_yield)
-                value = K*integral_yield
-                self.sim_energy.append(energy+offset)
-                self.sim_curve.append(value)
-                
-                countE+=1 # Datapoint number
-
-            self.update_exc_plot()
-            if hasattr(self, 'exp_energy') and self.exp_energy is not None and hasattr(self, 'ec_yield') and self.ec_yield is not None:
-                self.chi_val.append(round(mod4.chi_squared_test(self.exp_energy, self.ec_yield, self.sim_energy, self.sim_curve), 2))
+                    R = mod4.layer_masses_curve(compiled_target, exp_energy, beamWidth, DopplerYesNo, straggling_model, kernel, progress=job.progress, partial=partial)
+                sim_energy = [energy+offset for energy in exp_energy]
+                sim_curve = list(K*R @ compiled_target.Z2_fraction)
             else:
-                self.chi_val.append(-1.0)
-            if len(self.chi_val) > self.visible_count:
-                self.scroll_down()
-            self.update_chi_plot()
+                compiled_target = compile_target(self.segmented_target, self.Z2)
+                R = np.zeros((len(exp_energy), compiled_target.n_layers))
+                job.post(self.start_stream, [energy+offset for energy in exp_energy])
+                # Actual calculation loop, the broadening data of all the energies going to a single archive written in the background
+                archive = ArchiveWriter(os.path.join(target_dir, broadarchive.ARCHIVE_NAME))
+                try:
+                    for energy in exp_energy:
+                        xc, x, y, layers_contribution, outOfTarget = mod3.broadening(energy, compiled_target, beamWidth, DopplerYesNo, straggling_model, SaveBroadData, None, kernel, archive=archive)
+                        #print(f"DEBUG: Broadening output shapes: x={np.array(x).shape}, y={np.array(y).shape}")
+                        #print(f"DEBUG: x range: [{np.min(x):.3f}, {np.max(x):.3f}], y range: [{np.min(y):.6f}, {np.max(y):.6f}]")
+
+                        R[countE] = mod4.layer_masses(compiled_target, x, y)
+                        integral_yield = float(R[countE] @ compiled_target.Z2_fraction)  # Same as mod4.compute_yield
+                        #print('K*integral_yield: ', K, '*', integral_yield, '=', K * integral_yield)
+                        value = K*integral_yield
+                        sim_energy.append(energy+offset)
+                        sim_curve.append(value)
+                        job.post(self.stream_points, [energy+offset], [value])
+                    
+                        countE+=1 # Datapoint number
+                        job.progress(countE, len(exp_energy))
+                finally:
+                    archive.close()  # Also indexes the points of a cancelled run
+            if not fast_path:
+                # Slabs back to the layer they were cut from
+                self.response_cache = {"key": self.response_key(params, target, exp_energy, grid), "energies": exp_energy,
+                                       "R": mod4.parent_masses(R, parents, len(target["layers"])), "K": K}
+
+            job.post(self.show_results, sim_energy, sim_curve)
 
             if trackTargetChange or SaveBroadData:
                 print(f"Run data saved in: {target_dir}")
 
             self.runNbr+=1 # Run number
 
-            if len(self.target["layers"]) != size_before:
-                messagebox.showinfo("Calculations","At least one layer has been segmented to more accurately describe stopping powers.")
+            slabs = len(self.segmented_target["layers"])
+            if slabs > len(target["layers"]) and slabs != slabs_before:
+                job.post(messagebox.showinfo, "Calculations","At least one layer has been segmented to more accurately describe stopping powers.")
 
             print("*-*-*-*-*-*-* Calculation completed *-*-*-*-*-*-*") 
+        except CalculationCancelled:
+            print("*-*-*-*-*-*-* Calculation cancelled *-*-*-*-*-*-*")
         except Exception as e:
             print(f"An error occurred: {type(e).__name__}: {e}")
             traceback.print_exc()
             tb = traceback.extract_tb(e.__traceback__)
             for frame in tb:
                 print(f"File : {frame.filename}, line : {frame.lineno}, code : {frame.line}")
-        
-        # Unlocking the "Run Calculation" button
-        self.run_button.config(text="Run calculation",style="Default.TButton", state="normal")
+
+    def set_generated_energies(self, energies: list[float])->None:
+        """
+        Keeps the energies chosen by the adaptive sampling as the energies of the generated curve (main thread).
+        """
+        self.exp_energy = energies
+
+    def show_results(self, sim_energy: list[float], sim_curve: list[float])->None:
+        """
+        Plots a simulated curve and adds its chi-squared to the history (main thread).
+        """
+        self.sim_energy = sim_energy
+        self.sim_curve = sim_curve
+        self.update_exc_plot()
+        if hasattr(self, 'exp_energy') and self.exp_energy is not None and hasattr(self, 'ec_yield') and self.ec_yield is not None:
+            self.chi_val.append(round(mod4.chi_squared_test(self.exp_energy, self.ec_yield, self.sim_energy, self.sim_curve), 2))
+        else:
+            self.chi_val.append(-1.0)
+        if len(self.chi_val) > self.visible_count:
+            self.scroll_down()
+        self.update_chi_plot()
 
     def _close_Z2_profile(self)->None:
         self.Z2_profile.destroy()
@@ -1088,11 +1435,67 @@ class GUI_App(tk.Tk):
         self.Z2_profile.canvas.draw_idle()
 
     def Autofit(self)->None:
-        print("Not implemented yet")  
+        """
+        Runs the profile fitting on a worker thread, like the calculation.
+        """
+        if self.job is not None:
+            return
+        if not hasattr(self, "ec_yield") or not self.ec_yield:
+            messagebox.showerror("Autofit failed", "No experimental excitation curve was loaded.")
+            return
+        params = self.get_calc_parameters("Autofit failed")
+        if params is None:
+            return
+        if self.std_target["layers"][0].normalize():
+            self.refresh_Std_list()
+            print("Standard layer normalised.")
+        self.target.normalize_all_layers()
+        self.start_job("Autofit", self.run_autofit, params, copy.deepcopy(self.target), list(self.exp_energy), list(self.ec_yield),
+                       None if self.ec_yErr is None else list(self.ec_yErr), text="Fitting...")
 
-    def save_json(self, target_type: Literal['target', 'std'] = 'target', savepath: str | None = None) -> None:
+    def run_autofit(self, job: Job, params: dict, target: Target, exp_energy: list[float], ec_yield: list[float], ec_yErr: list[float] | None)->None:
         """
-        Saves the current target or standard configuration as a JSON file.
+        Fits the Z2 content and the areal density of the target layers to the loaded excitation curve (see mod5.fit_profile),
+        then runs a calculation with the fitted target. The layers entered by the user are fitted: mod5 segments them
+        into slabs for the calculation and sums the response of the slabs back into their layer.
+        The target and the curve are copies made by Autofit; the fitted target replaces self.target on the main thread (see set_fitted_target).
+        """
+        print("*-*-*-*-*-*-* Starting Autofit *-*-*-*-*-*-*")
+        try:
+            # Calculating K factor
+            job.phase("Standard")
+            std_stopping = mod2.submit_stopping_power(self.std_target["layers"][0], self.std_energy)
+            try:
+                K = self.std_calc(params["std_yield"], params["beamWidth"], params["Doppler"], params["straggling_model"], std_stopping.result(), params["kernel"])
+            except:
+                job.post(messagebox.showerror, "Autofit failed", "Standard calculation error.\n\nMake sure all the standards information were correctly entered.")
+                raise Exception("Standard calculation failed.")
+
+            job.phase("Autofit evaluation")
+            fitted, report = mod5.fit_profile(target, exp_energy, ec_yield, ec_yErr, K, params["beamWidth"], params["Doppler"],
+                                              params["straggling_model"], params["kernel"], params["offset"],
+                                              callback=lambda evaluation, chi2: job.progress(evaluation))
+            job.post(self.set_fitted_target, fitted)
+            job.post(messagebox.showinfo, "Autofit", f"Chi-squared: {report['chi2']:.4g}\n{report['iterations']} iterations, {report['evaluations']} evaluations in {report['wall_time']:.1f} s\n\n{report['message']}")
+            job.on_finish.append(self.start_calc)  # Simulated curve of the fitted target
+            print("*-*-*-*-*-*-* Autofit completed *-*-*-*-*-*-*")
+        except CalculationCancelled:
+            print("*-*-*-*-*-*-* Autofit cancelled *-*-*-*-*-*-*")
+        except Exception as e:
+            print(f"An error occurred: {type(e).__name__}: {e}")
+            traceback.print_exc()
+
+    def set_fitted_target(self, target: Target)->None:
+        """
+        Replaces the target with the fitted one (main thread).
+        """
+        self.target = target
+        self.refresh_layer_list()
+        self.refresh_element_list()
+
+    def save_json(self, target_type: Literal['target', 'std'] = 'target', savepath: str | None = None, target: Target | None = None) -> None:
+        """
+        Saves the current target or standard configuration (or ``target`` if given) as a JSON file.
         """
         file_path = savepath or filedialog.asksaveasfilename(
             defaultextension=".json",
@@ -1101,9 +1504,24 @@ class GUI_App(tk.Tk):
         )
         if file_path:
             with open(file_path, 'w') as file:
-                json.dump(self.std_target if target_type == "std" else self.target, file, indent=4)
+                if target is None:
+                    target = self.std_target if target_type == "std" else self.target
+                json.dump(target, file, indent=4)
             print(f"File saved to: {file_path}")
 
+    def export_broadening_text(self)->None:
+        """
+        Exports a broadening archive of a run (see broadarchive) as text files, one datapointN folder per energy.
+        """
+        file_path = filedialog.askopenfilename(title="Export broadening data", filetypes=[("Broadening archive", "*.hpa")])
+        if not file_path:
+            return
+        try:
+            folder = broadarchive.export_text(file_path)
+            messagebox.showinfo("Export broadening data", f"Broadening data exported to:\n{folder}")
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Export broadening data", f"Couldn't export the data.\n\n{e}")
+
     def save_sim_curve_txt(self)->None:
         """
         Saves the simulated excitation curve as a TXT file.
@@ -1132,6 +1550,8 @@ class GUI_App(tk.Tk):
             return
         if exitDialogResult:
             self.save_json()
+        if self.job is not None:
+            self.job.cancel()
         self.quit()
 
 # Run app
@@ -1,6 +1,6 @@
 import tkinter as tk
 from tkinter import ttk
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import (FigureCanvasTkAgg,NavigationToolbar2Tk)
 
 def create_widgets(self):
@@ -11,10 +11,12 @@ def create_widgets(self):
         menubar.add_cascade(label="Target", menu=target_menu)
         target_menu.add_command(label="Load", command=self.load_target)
         target_menu.add_command(label="Save", command=self.save_json)
+        target_menu.add_command(label="Autofit", command=self.Autofit)
 
         plot_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="Plot", menu=plot_menu)
         plot_menu.add_command(label="Save simulated curve data", command=self.save_sim_curve_txt)
+        plot_menu.add_command(label="Export broadening data as text", command=self.export_broadening_text)
         plot_menu.add_command(label="Generate experimental curve", command=self.generate_exp_curve)
         plot_menu.add_separator()
         plot_menu.add_command(label="Remove experimental curve", command=self.on_remove_exp)
@@ -44,6 +46,13 @@ def create_widgets(self):
         self.run_button = ttk.Button(self.left_frame, text='Run\nCalculation', command=self.start_calc,style="Center.TButton")
         self.run_button.pack(fill="x",padx=10,pady=(0,0), ipady=10)
 
+        self.cancel_button = ttk.Button(self.left_frame, text='Cancel', command=self.cancel_job, state="disabled")
+        self.cancel_button.pack(fill="x",padx=10,pady=(0,0))
+        self.progress_bar = ttk.Progressbar(self.left_frame, mode="determinate", maximum=100)
+        self.progress_bar.pack(fill="x",padx=10,pady=(2,0))
+        self.progress_label = ttk.Label(self.left_frame, text="", font=("Segoe UI", 8))
+        self.progress_label.pack(fill="x",padx=10,pady=(0,5))
+
         self.extract_button = ttk.Button(self.left_frame, text='Extract profile', command=self.plot_Z2_profile)
         self.extract_button.pack(fill="x",padx=10,pady=(0,10), ipady=5)     
 
@@ -96,6 +105,14 @@ def create_widgets(self):
         self.options_doppler_entry = ttk.Checkbutton(self.options_frame2,text="Doppler", variable=self.Doppler_bool)
         self.options_doppler_entry.pack(padx=5, pady=(0,0),anchor='w')
 
+        self.Voigt_bool = tk.BooleanVar(value=False)
+        self.options_voigt_entry = ttk.Checkbutton(self.options_frame2,text="Analytic Voigt", variable=self.Voigt_bool)
+        self.options_voigt_entry.pack(padx=5, pady=(0,0),anchor='w')
+
+        self.FastZ2_bool = tk.BooleanVar(value=True)
+        self.options_fastZ2_entry = ttk.Checkbutton(self.options_frame2,text="Fast Z2 content updates", variable=self.FastZ2_bool)
+        self.options_fastZ2_entry.pack(padx=5, pady=(0,0),anchor='w')
+
         self.broadSave_bool = tk.BooleanVar(value=False)
         self.broadSave_entry = ttk.Checkbutton(self.options_frame2,text="Save broadening data", variable=self.broadSave_bool)
         self.broadSave_entry.pack(padx=5, pady=0 ,anchor='w')
@@ -112,7 +129,8 @@ def create_widgets(self):
         self.chi_frame = ttk.Frame(self.chi_frameLabel)
         self.chi_frame.pack(side='left', fill='both', expand=True, padx=10, pady=(10,10))
 
-        self.figure1, self.ax1 = plt.subplots(figsize=(2, 1.5), dpi=100,constrained_layout=True)
+        self.figure1 = Figure(figsize=(2, 1.5), dpi=100,constrained_layout=True)  # Embedded figures do not need pyplot (slow import)
+        self.ax1 = self.figure1.add_subplot()
         self.canvas1 = FigureCanvasTkAgg(self.figure1, master=self.chi_frame)
         self.canvas1.get_tk_widget().pack(expand=True, fill='both')
 
@@ -311,7 +329,8 @@ def create_widgets(self):
         self.exc_curve_frame = ttk.Frame(self.exc_curve_frameLabel)
         self.exc_curve_frame.pack(side='left', fill='both', expand=True, padx=10, pady=(10,0))
 
-        self.figure0, self.ax0 = plt.subplots(figsize=(10, 5),constrained_layout=True)
+        self.figure0 = Figure(figsize=(10, 5),constrained_layout=True)
+        self.ax0 = self.figure0.add_subplot()
         # self.figure0.tight_layout()
         self.canvas = FigureCanvasTkAgg(self.figure0, master=self.exc_curve_frame)
         self.toolbar = NavigationToolbar2Tk(self.canvas, self.exc_curve_frame)
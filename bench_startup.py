@@ -0,0 +1,60 @@
+"""
+Cold-start benchmark of the imports of the GUI and of the headless compute path (python -X importtime).
+
+Each entry point is imported several times in a fresh interpreter; the best run is reported with its slowest modules
+and the heavy libraries it loaded (the compute path must not load GUI or Excel libraries).
+
+Usage:
+    python bench_startup.py [--runs N] [--top N]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ENTRY_POINTS = {
+    "GUI (UI)": "UI",
+    "Headless (hyproc)": "hyproc",
+    "Compute (mod2-mod5)": "mod2, mod3, mod4, mod5",
+}
+HEAVY_LIBRARIES = ["tkinter", "matplotlib", "matplotlib.pyplot", "pandas", "xlwings", "scipy.signal", "scipy.interpolate", "scipy.optimize", "scipy.special"]
+
+def import_times(modules: str)-> dict[str, tuple[int, int]]:
+    """
+    Imports ``modules`` in a new interpreter.
+
+    Returns:
+        times (dict) : Self and cumulative import time (µs) of each module imported, the top-level ones included.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {modules}"],
+                            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {modules} failed:\n{result.stderr.splitlines()[-1] if result.stderr else ''}")
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+def main(argv=None)->None:
+    parser = argparse.ArgumentParser(description="Cold-start import benchmark of HyProC.")
+    parser.add_argument("--runs", type=int, default=5, help="Imports per entry point, the best one is kept (default 5).")
+    parser.add_argument("--top", type=int, default=8, help="Number of slowest modules shown (default 8).")
+    args = parser.parse_args(argv)
+
+    for label, modules in ENTRY_POINTS.items():
+        best_total, best = None, None
+        for run in range(args.runs):
+            times = import_times(modules)
+            total = sum(times[name.strip()][1] for name in modules.split(","))
+            if best_total is None or total < best_total:
+                best_total, best = total, times
+        print(f"{label}: {best_total/1e6:.3f} s (best of {args.runs})")
+        for name, (self_us, cumulative_us) in sorted(best.items(), key=lambda item: -item[1][1])[:args.top]:
+            print(f"    {cumulative_us/1e3:9.1f} ms  {name}")
+        print(f"    Heavy libraries loaded: {', '.join(name for name in HEAVY_LIBRARIES if name in best) or 'none'}")
+
+if __name__ == "__main__":
+    main()
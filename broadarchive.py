@@ -0,0 +1,210 @@
+"""
+Binary archive of the broadening data saved during a run ("Save broadening data").
+
+All the curves of a run go to a single append-only file instead of seven text files per energy point.
+Each curve is a record (small header, then its x and y values as float64) appended by a background writer thread.
+When the archive is closed, an index of the records (energy point, energy, curve name, offset, length) is written at the end of the file;
+an archive that was not closed (e.g. crash) is indexed by reading the record headers.
+The curves are read back without copy from a memory map of the file.
+
+Usage:
+    python -m broadarchive export run.hpa [output_folder]    (previous text layout: datapointN/<curve>.txt)
+"""
+import json
+import os
+import queue
+import struct
+import sys
+import threading
+import numpy as np
+from numpy.typing import NDArray
+
+MAGIC = b"HYPROCBA"
+VERSION = 1
+INDEX_MAGIC = b"HPAINDEX"
+RECORD = struct.Struct("<4sIIdQ")  # b"REC0", point, curve, energy (keV), number of values
+FOOTER = struct.Struct("<Q8s")  # Length of the JSON index, INDEX_MAGIC
+ARCHIVE_NAME = "broadening.hpa"
+
+# Curves saved for each energy point, with the text file they were saved to before
+CURVES = {
+    "Beam": "Beam.txt",
+    "Straggling": "Stragg.txt",
+    "Doppler": "Doppler.txt",
+    "Total Gauss": "Total_Gauss.txt",
+    "Cross section": "xsec.txt",
+    "Total Broadening": "Total_Broadening.txt",
+    "Total Broadening (TFU)": "Total_Broadening_TFU.txt",
+}
+CURVE_NAMES = list(CURVES)
+
+class ArchiveWriter:
+    """
+    Writes the curves of a run to an archive. ``add`` only queues the data: the file is written by a background thread.
+    The archive must be closed (or used as a context manager) to write its index.
+    """
+    def __init__(self, path: str)->None:
+        self.path = path
+        self.points = 0
+        self._energy = float("nan")
+        self._queue = queue.Queue()
+        self._index = []
+        self._error = None
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC + struct.pack("<I", VERSION))
+        self._thread = threading.Thread(target=self._write, daemon=True)
+        self._thread.start()
+
+    def __enter__(self)->"ArchiveWriter":
+        return self
+
+    def __exit__(self, *exc)->None:
+        self.close()
+
+    def new_point(self, energy: float)->int:
+        """
+        Starts a new energy point and returns its number.
+        """
+        self.points += 1
+        self._energy = float(energy)
+        return self.points - 1
+
+    def add(self, name: str, x: NDArray[np.float64], y: NDArray[np.float64], point: int | None = None)->None:
+        """
+        Queues a curve of an energy point (the last point started by default).
+        """
+        if self._error is not None:
+            raise self._error
+        if name not in CURVES:
+            raise ValueError(f"Unknown broadening curve: {name}")
+        x = np.array(x, dtype='<f8')
+        y = np.array(y, dtype='<f8')
+        if x.shape != y.shape or x.ndim != 1:
+            raise ValueError("Vectors must be the same length.")
+        self._queue.put((self.points - 1 if point is None else point, CURVE_NAMES.index(name), self._energy, x, y))
+
+    def _write(self)->None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            point, curve, energy, x, y = item
+            try:
+                self._file.write(RECORD.pack(b"REC0", point, curve, energy, x.size))
+                offset = self._file.tell()
+                self._file.write(x.tobytes())
+                self._file.write(y.tobytes())
+                self._index.append([point, curve, energy, offset, x.size])
+            except OSError as e:
+                self._error = e
+
+    def close(self)->None:
+        """
+        Waits for the queued curves to be written, then writes the index.
+        """
+        if self._file.closed:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        index = json.dumps({"version": VERSION, "curves": CURVE_NAMES, "records": self._index}).encode()
+        self._file.write(INDEX_MAGIC + index + FOOTER.pack(len(index), INDEX_MAGIC))
+        self._file.close()
+        if self._error is not None:
+            raise self._error
+
+class ArchiveReader:
+    """
+    Reads an archive written by ArchiveWriter. The curves are views of a memory map of the file.
+    """
+    def __init__(self, path: str)->None:
+        self.path = path
+        self._map = np.memmap(path, dtype=np.uint8, mode='r')
+        if self._map.size < len(MAGIC) + 4 or bytes(self._map[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} is not a HyProC broadening archive.")
+        records = self._read_index()
+        if records is None:
+            records = self._scan()
+        self.records = {(point, CURVE_NAMES[curve]): (energy, offset, n) for point, curve, energy, offset, n in records}
+        energies = {}
+        for point, curve, energy, offset, n in records:
+            energies[point] = energy
+        self.energies = np.array([energies[point] for point in sorted(energies)])  # Energy of each point (keV)
+
+    def __len__(self)->int:
+        return len(self.energies)
+
+    def _read_index(self)-> list | None:
+        end = self._map.size
+        if end < FOOTER.size:
+            return None
+        length, magic = FOOTER.unpack(bytes(self._map[end - FOOTER.size:end]))
+        start = end - FOOTER.size - length
+        if magic != INDEX_MAGIC or start < len(INDEX_MAGIC) or bytes(self._map[start - len(INDEX_MAGIC):start]) != INDEX_MAGIC:
+            return None
+        return json.loads(bytes(self._map[start:start + length]))["records"]
+
+    def _scan(self)-> list:
+        """
+        Indexes an archive without index (not closed) from the record headers. An incomplete last record is ignored.
+        """
+        records = []
+        position = len(MAGIC) + 4
+        while position + RECORD.size <= self._map.size:
+            tag, point, curve, energy, n = RECORD.unpack(bytes(self._map[position:position + RECORD.size]))
+            offset = position + RECORD.size
+            if tag != b"REC0" or offset + 16*n > self._map.size:
+                break
+            records.append([point, curve, energy, offset, n])
+            position = offset + 16*n
+        return records
+
+    def curves(self, point: int)-> list[str]:
+        """
+        Names of the curves saved for an energy point.
+        """
+        return [name for name in CURVE_NAMES if (point, name) in self.records]
+
+    def get(self, point: int, name: str)-> tuple[NDArray[np.float64], NDArray[np.float64]]:
+        """
+        Returns the x and y values of a curve of an energy point (read-only views of the file).
+        """
+        energy, offset, n = self.records[(point, name)]
+        x = np.frombuffer(self._map, dtype='<f8', count=n, offset=offset)
+        y = np.frombuffer(self._map, dtype='<f8', count=n, offset=offset + 8*n)
+        return x, y
+
+    def close(self)->None:
+        try:
+            self._map._mmap.close()
+        except BufferError:
+            pass  # Curves returned by get are still in use, the map is closed when they are released
+
+def export_text(archive_path: str, output_folder: str | None = None)-> str:
+    """
+    Writes the content of an archive with the previous text layout: one datapointN folder per energy point,
+    holding an empty _E=<energy>kev.dat file and one tab separated text file per curve (see CURVES).
+
+    Returns:
+        output_folder (str) : Folder the data was written to (default: next to the archive).
+    """
+    output_folder = output_folder or os.path.dirname(os.path.abspath(archive_path))
+    reader = ArchiveReader(archive_path)
+    try:
+        for point, energy in enumerate(reader.energies):
+            folder = os.path.join(output_folder, f"datapoint{point}")
+            os.makedirs(folder, exist_ok=True)
+            with open(os.path.join(folder, f'_E={energy:.1f}kev.dat'), 'w') as f:
+                pass
+            for name in reader.curves(point):
+                x, y = reader.get(point, name)
+                with open(os.path.join(folder, CURVES[name]), 'w') as f:
+                    f.write("".join(f"{v1}\t{v2}\n" for v1, v2 in zip(x.tolist(), y.tolist())))
+    finally:
+        reader.close()
+    return output_folder
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "export":
+        print(__doc__)
+        sys.exit(2)
+    print(f"Exported to {export_text(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)}")
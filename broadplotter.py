@@ -7,6 +7,92 @@ import matplotlib.pyplot as plt
 import os
 import re
 import glob
+from collections import OrderedDict
+import numpy as np
+
+import broadarchive
+import plotdecimate
+
+class RunData:
+    """
+    Index of a run folder, built once when the folder is selected: energy of each datapoint and where its curves are.
+    A run saved as a broadening archive (see broadarchive) is read from a memory map of the archive.
+    A run saved with the previous text layout (datapointN folders) is parsed on demand, the last parsed curves being kept in an LRU cache.
+    """
+    def __init__(self, folder: str, cache_size: int = 64)->None:
+        self.folder = folder
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        archive_path = os.path.join(folder, broadarchive.ARCHIVE_NAME)
+        if os.path.isfile(archive_path):
+            self.archive = broadarchive.ArchiveReader(archive_path)
+            self.energies = self.archive.energies.tolist()
+            self.folders = []
+        else:
+            self.archive = None
+            numbered = []
+            for name in os.listdir(folder):
+                match = re.fullmatch(r"datapoint(\d+)", name, flags=re.IGNORECASE)
+                if match and os.path.isdir(os.path.join(folder, name)):
+                    numbered.append((int(match.group(1)), os.path.join(folder, name)))
+            self.folders = [path for number, path in sorted(numbered)]
+            self.energies = [self.energy_from_dat(path) for path in self.folders]
+
+    def __len__(self)->int:
+        return len(self.energies)
+
+    @staticmethod
+    def energy_from_dat(path: str)-> float | None:
+        """
+        Energy of a datapoint folder of the text layout, from the name of its _E=...kev.dat file.
+        """
+        dat_files = glob.glob(os.path.join(path, "*.dat"))
+        match = re.search(r"_E=([\d.]+)kev", os.path.basename(dat_files[0])) if len(dat_files) == 1 else None
+        return float(match.group(1)) if match else None
+
+    def get(self, point: int, name: str)-> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the x and y values of a curve (see broadarchive.CURVES for the names). Raises KeyError if the curve was not saved.
+        """
+        if self.archive is not None:
+            return self.archive.get(point, name)
+        key = (point, name)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        path = os.path.join(self.folders[point], broadarchive.CURVES[name])
+        if not os.path.isfile(path):
+            raise KeyError(key)
+        data = read_two_columns(path)
+        self._cache[key] = data
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return data
+
+def read_two_columns(filename: str, delimiter: str = '\t')-> tuple[np.ndarray, np.ndarray]:
+    """
+    Loads two-column data from a .txt file. Lines that are not two numbers are skipped.
+    """
+    with open(filename, 'r') as f:
+        text = f.read()
+    try:
+        values = np.array(text.split(), dtype=float).reshape(-1, 2)
+        return values[:, 0], values[:, 1]
+    except ValueError:
+        pass
+    # Slow path for files with invalid lines
+    x_vals = []
+    y_vals = []
+    for line in text.splitlines():
+        if line.strip():  # skip empty lines
+            parts = line.strip().split(delimiter)
+            if len(parts) == 2:
+                try:
+                    x_vals.append(float(parts[0]))
+                    y_vals.append(float(parts[1]))
+                except ValueError:
+                    print(f"Skipping invalid line: {line.strip()}")
+    return np.array(x_vals), np.array(y_vals)
 
 class GUI_app:
     def __init__(self, root):
@@ -33,15 +119,7 @@ class GUI_app:
         self.combo_label.pack(pady=(10, 0))
 
         # Mapping: display_name -> actual filename or variable
-        self.data_mapping = {
-            "Beam": "Beam.txt",
-            "Straggling": "Stragg.txt",
-            "Doppler": "Doppler.txt",
-            "Total Gauss": "Total_Gauss.txt",
-            "Cross section": "xsec.txt",
-            "Total Broadening": "Total_Broadening.txt",
-            "Total Broadening (TFU)": "Total_Broadening_TFU.txt"
-        }
+        self.data_mapping = broadarchive.CURVES
 
         # Display names for the combobox
         self.data_options = list(self.data_mapping.keys())
@@ -63,6 +141,7 @@ class GUI_app:
         # Placeholder for current folder and index
         self.filename = None
         self.folder_path = ""
+        self.run = None
         self.current_index = 0
         self.max_index = 0
 
@@ -70,52 +149,43 @@ class GUI_app:
     def choose_folder(self):
         folder = filedialog.askdirectory()
         if folder:
-            # Look for subfolders starting with "datapoint"
+            # Look for a broadening archive or subfolders starting with "datapoint"
             subfolders = [
                 name for name in os.listdir(folder)
                 if os.path.isdir(os.path.join(folder, name)) and name.lower().startswith("datapoint")
             ]
 
-            if not subfolders:
+            if not subfolders and not os.path.isfile(os.path.join(folder, broadarchive.ARCHIVE_NAME)):
                 messagebox.showerror(
                     "Invalid Folder",
-                    "The selected folder does not contain any subfolder starting with 'datapoint'."
+                    f"The selected folder does not contain any {broadarchive.ARCHIVE_NAME} file or subfolder starting with 'datapoint'."
                 )
                 return  # stop here if invalid
 
+            try:
+                self.run = RunData(folder)
+            except (OSError, ValueError) as e:
+                messagebox.showerror("Invalid Folder", f"The run data could not be read.\n\n{e}")
+                return
             self.folder_path = folder
-            with os.scandir(self.folder_path) as entries:
-                self.max_index = sum(1 for entry in entries if entry.is_dir())
-
-            print(f"Selected folder: {self.folder_path}")
-            ## Check all expected files
-            #missing_files = []
-            #for display_name, filename in self.data_mapping.items():
-            #    file_path = os.path.join(self.folder_path, filename)
-            #    if not os.path.isfile(file_path):
-            #        missing_files.append(filename)
-            #
-            #if missing_files:
-            #    missing_list = "\n".join(missing_files)
-            #    messagebox.showerror(
-            #        "Missing Files",
-            #        f"The following files could not be found in the selected folder:\n{missing_list}"
-            #    ) 
-
-        self.slider.configure(to=self.max_index-1)
+            self.max_index = len(self.run)
+
+            print(f"Selected folder: {self.folder_path} ({self.max_index} datapoints)")
+
+        self.slider.configure(to=max(self.max_index-1, 0))
 
         selected_display = self.combo_var.get()
-        if not selected_display == "Choose file":
-            self.load_and_plot(os.path.join(self.folder_path,f"datapoint{self.current_index}",self.filename) )
+        if not selected_display == "Choose file" and self.run is not None:
+            self.load_and_plot(self.slider.get())
 
     def previous(self):
         self.current_index = max(0, self.current_index - 1)
-        self.load_and_plot(os.path.join(self.folder_path,f"datapoint{self.current_index}",self.filename) )
+        self.load_and_plot(self.current_index)
 
     def next(self):
         if not self.current_index == self.max_index-1:
             self.current_index += 1
-            self.load_and_plot(os.path.join(self.folder_path,f"datapoint{self.current_index}",self.filename) )
+            self.load_and_plot(self.current_index)
 
     def on_key_release(self, event):
         """
@@ -131,7 +201,7 @@ class GUI_app:
         if not self.folder_path == "":
             val = self.slider.get()
             if not self.filename==None:
-                self.load_and_plot(os.path.join(self.folder_path,f"datapoint{val}",self.filename))
+                self.load_and_plot(val)
     
     def combobox_changed(self, event):
         """
@@ -142,72 +212,44 @@ class GUI_app:
         
         # You can update your plot or logic here based on selection
         if not self.folder_path == "":
-            self.load_and_plot(os.path.join(self.folder_path,f"datapoint{self.slider.get()}",self.filename) )        
+            self.load_and_plot(self.slider.get())        
 
-    def load_and_plot(self, filename, delimiter='\t'):
+    def load_and_plot(self, point: int):
         """
-        Load two-column data from a .txt file and plot it.
+        Plot a curve of a datapoint of the run, read through the run index (see RunData).
 
         Parameters:
-            filename (str): Path to the text file containing the data.
-            delimiter (str): Column separator (default is tab).
+            point (int): Datapoint number.
         """
+        display_name = self.combo_var.get()
+        try:
+            x_vals, y_vals = self.run.get(point, display_name)
+        except (KeyError, IndexError):
+            self.ax.clear()
+            self.ax.set_title(f"Datapoint {point}: no {display_name} data")
+            self.canvas.draw_idle()
+            return
 
-        x_vals = []
-        y_vals = []
-
-        with open(filename, 'r') as f:
-            for line in f:
-                if line.strip():  # skip empty lines
-                    parts = line.strip().split(delimiter)
-                    if len(parts) == 2:
-                        try:
-                            x = float(parts[0])
-                            y = float(parts[1])
-                            x_vals.append(x)
-                            y_vals.append(y)
-                        except ValueError:
-                            print(f"Skipping invalid line: {line.strip()}")
-
-        for i,x in enumerate(x_vals):
-            if None or x < 0:
-                y_vals[i]=0
-
-        # nrg_loc = os.path.join(self.folder_path,f"datapoint{self.current_index}")
+        y_vals = np.where(x_vals < 0, 0.0, y_vals)
 
         # Plotting
         self.ax.clear()
-        self.ax.set_title(f"Datapoint {self.slider.get()} (E = {self.get_energy_from_dat()} keV)")
-        self.ax.plot(x_vals, y_vals, marker='.', linestyle='-')
-        if filename.endswith("TFU.txt"):
+        energy = self.run.energies[point]
+        self.ax.set_title(f"Datapoint {point} (E = {energy:.1f} keV)" if energy is not None else f"Datapoint {point}")
+        plotdecimate.plot(self.ax, x_vals, y_vals, marker='.', linestyle='-')  # Drawn decimated to the resolution of the plot
+        if self.filename.endswith("TFU.txt"):
             self.ax.set_xlabel("x (TFU)")
-            self.ax.set_xlim(left=0.0, right=max(1,max(x_vals)+0.05*max(x_vals)))
+            self.ax.set_xlim(left=0.0, right=max(1,max(x_vals)+0.05*max(x_vals)) if len(x_vals) else 1)
         else:
             self.ax.set_xlabel("E (keV)")
-        if filename.endswith("xsec.txt"):
+        if self.filename.endswith("xsec.txt"):
             self.ax.set_ylabel("Cross section (mb)")
         else:
             self.ax.set_ylabel("Probability")
 
         self.ax.grid(True)
         self.fig.tight_layout()
-        self.canvas.draw()
-
-    def get_dat_filename(self):
-        """
-        Extract the name of the .dat file
-        """
-        dat_files = glob.glob(os.path.join(self.folder_path,f"datapoint{self.slider.get()}", "*.dat"))
-        if len(dat_files) != 1:
-            raise FileNotFoundError("Expected exactly one .dat file in the folder.")
-        return os.path.basename(dat_files[0])
-    
-    def get_energy_from_dat(self):
-        filename = self.get_dat_filename()
-        match = re.search(r"_E=([\d.]+)kev", filename)
-        if not match:
-            raise ValueError(f"Could not find energy pattern in {filename}")
-        return float(match.group(1))
+        self.canvas.draw_idle()
 
 # --- Run the GUI ---
 if __name__ == "__main__":
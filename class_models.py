@@ -1,4 +1,10 @@
 import copy
+import queue
+import threading
+import time
+from typing import Callable
+import numpy as np
+from numpy.typing import NDArray
 
 class Element(dict):
     def __init__(self, data=None, Z: int = 14, percent_at: float = 100.0)->None: # Default: Si, 100% at.
@@ -92,3 +98,143 @@ class Target(dict):
         if index < len(self["layers"]) - 1:
             self["layers"][index + 1], self["layers"][index] = self["layers"][index], self["layers"][index + 1]
 
+
+
+class CompiledTarget:
+    """
+    Read-only NumPy form of a Target, built once per run and shared by mod3 and mod4.
+    It is identified by the signature of the target it was built from (areal densities, stopping powers and compositions),
+    so any edit of the target gives a new signature and a new compiled form (see compile_target).
+    """
+    def __init__(self, target: Target, Z2: int = 1)->None:
+        layers = target["layers"]
+        self.signature = target_signature(target)
+        self.Z2 = Z2
+        self.n_layers = len(layers)
+        self.areal_density = np.array([layer["areal_density"] for layer in layers], dtype=float)  # TFU
+        self.stopping = np.array([layer.get("stopping", 0.0) for layer in layers], dtype=float)  # keV/TFU
+        self.thickness = np.cumsum(self.areal_density)  # Depth of the back of each layer (TFU)
+        self.loss = np.cumsum(self.stopping * self.areal_density)  # Cumulative energy loss at the back of each layer (keV)
+
+        # Elements of each layer, zero padded (layers x elements)
+        n_el = max((len(layer["elements"]) for layer in layers), default=0)
+        self.Z = np.zeros((self.n_layers, n_el))
+        self.percent_at = np.zeros((self.n_layers, n_el))
+        for i, layer in enumerate(layers):
+            for j, element in enumerate(layer["elements"]):
+                self.Z[i, j] = element["Z"]
+                self.percent_at[i, j] = element["percent_at"]
+
+        # Bragg's rule mean atomic number, with and without hydrogen (as mod3.get_Z)
+        not_H = self.Z != 1
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.Z_bragg = np.round(np.sum(self.Z * self.percent_at, axis=1) / np.sum(self.percent_at, axis=1), 2)
+            self.Z_no_H = np.round(np.sum(self.Z * self.percent_at * not_H, axis=1) / np.sum(self.percent_at * not_H, axis=1), 2)
+        self.Z2_fraction = np.sum(self.percent_at * (self.Z == Z2), axis=1)  # at. %
+
+        # Derived tables computed on demand by the physics modules (e.g. straggling variances)
+        self.cache = {}
+
+def target_signature(target: Target)-> tuple:
+    """
+    Returns a hashable description of everything the calculation reads from a target.
+    """
+    return tuple((float(layer["areal_density"]), float(layer.get("stopping", 0.0)),
+                  tuple((int(el["Z"]), float(el["percent_at"])) for el in layer["elements"]))
+                 for layer in target["layers"])
+
+_compiled_targets: dict[tuple, CompiledTarget] = {}
+_compiled_targets_lock = threading.Lock()  # Targets are compiled on the worker threads of the GUI and of mod4
+
+def compile_target(target: Target | CompiledTarget, Z2: int = 1)-> CompiledTarget:
+    """
+    Returns the compiled form of a target, reusing the previous one as long as the target was not edited.
+    A CompiledTarget is returned as is.
+    """
+    if isinstance(target, CompiledTarget):
+        return target
+    key = (target_signature(target), Z2)
+    with _compiled_targets_lock:
+        compiled = _compiled_targets.get(key)
+    if compiled is None:
+        compiled = CompiledTarget(target, Z2)
+        with _compiled_targets_lock:
+            if key in _compiled_targets:
+                return _compiled_targets[key]  # Compiled meanwhile by another thread: its derived tables are shared
+            if len(_compiled_targets) >= 16:
+                _compiled_targets.pop(next(iter(_compiled_targets)))
+            _compiled_targets[key] = compiled
+    return compiled
+
+def clear_compiled_targets()->None:
+    """
+    Forgets the compiled targets and the tables derived from them (e.g. when the reaction or the stopping power source changes,
+    see mod2.load_settings).
+    """
+    with _compiled_targets_lock:
+        _compiled_targets.clear()
+
+class CalculationCancelled(Exception):
+    """
+    Raised in a calculation when the user cancelled it (see Job).
+    """
+
+class Job:
+    """
+    Calculation running on a worker thread. The worker never touches the GUI: it posts progress and GUI updates to a queue
+    that the main thread polls (GUI_App.poll_job), and checks between points whether the user cancelled the job.
+    """
+    def __init__(self, name: str)->None:
+        self.name = name
+        self.queue = queue.Queue()
+        self.thread = None
+        self.on_finish = []  # Called on the main thread once the job ended
+        self._cancel = threading.Event()
+        self._phase = ""
+        self._phase_start = time.perf_counter()
+
+    def start(self, function: Callable, *args)->None:
+        self.thread = threading.Thread(target=function, args=(self, *args), daemon=True)
+        self.thread.start()
+
+    def running(self)->bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def cancel(self)->None:
+        self._cancel.set()
+
+    @property
+    def cancelled(self)->bool:
+        return self._cancel.is_set()
+
+    def check(self)->None:
+        """
+        Raises CalculationCancelled if the job was cancelled.
+        """
+        if self._cancel.is_set():
+            raise CalculationCancelled(f"{self.name} cancelled")
+
+    def post(self, function: Callable, *args)->None:
+        """
+        Runs ``function(*args)`` on the main thread.
+        """
+        self.queue.put(("call", function, args))
+
+    def phase(self, name: str)->None:
+        """
+        Starts a new step of the job (e.g. "Stopping powers", "Broadening"). The remaining time is estimated per step.
+        """
+        self._phase = name
+        self._phase_start = time.perf_counter()
+        self.queue.put(("progress", name, 0, None, None))
+
+    def progress(self, done: int, total: int | None = None)->None:
+        """
+        Reports that ``done`` points out of ``total`` are completed, and stops the job here if it was cancelled.
+        The remaining time is extrapolated from the time per point measured since the start of the step.
+        """
+        eta = None
+        if total and done > 0:
+            eta = (time.perf_counter() - self._phase_start)/done*(total - done)
+        self.queue.put(("progress", self._phase, done, total, eta))
+        self.check()
@@ -0,0 +1,128 @@
+"""
+Settings of HyProC (settings.json), loaded once and shared by all the modules.
+
+The modules read their settings from the shared Settings object (get_settings) instead of reading settings.json themselves.
+Changes are made with Settings.apply, which saves the file and notifies the functions registered with Settings.subscribe,
+so that the modules update the values they derive from the settings and clear the caches that depend on them.
+"""
+import copy
+import json
+import os
+import threading
+from typing import Callable, Iterable
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+settings_path = os.path.join(script_dir, 'settings.json')
+
+class Settings(dict):
+    """
+    Content of settings.json: "SRIM_path", "save_path", "import_curve", "reaction", "resonance", "stopping" and "calculation" sections.
+    """
+    def __init__(self, path: str | None = None, data: dict | None = None)->None:
+        super().__init__()
+        self.path = path
+        self._listeners = []
+        self._lock = threading.RLock()
+        if data is None and path is not None:
+            data = self.read()
+        self.update(copy.deepcopy(data or {}))
+
+    def read(self)-> dict:
+        """
+        Returns the content of the settings file.
+        """
+        with open(self.path, 'r', encoding="utf-8") as f:
+            return json.load(f)
+
+    def save(self)->None:
+        with self._lock:
+            with open(self.path, 'w', encoding="utf-8") as f:
+                json.dump(self, f, indent=4)
+
+    def subscribe(self, listener: Callable[["Settings", set[str]], None], sections: Iterable[str] | None = None)->None:
+        """
+        Registers a function called with the settings and the names of the changed sections each time the settings change
+        (only when one of ``sections`` changes, if given).
+        """
+        with self._lock:
+            self._listeners.append((listener, None if sections is None else set(sections)))
+
+    def unsubscribe(self, listener: Callable[["Settings", set[str]], None])->None:
+        with self._lock:
+            self._listeners = [(function, sections) for function, sections in self._listeners if function != listener]
+
+    def apply(self, changes: dict, save: bool = True)-> set[str]:
+        """
+        Changes some settings: the sections given as dict are merged into the current ones, the others are replaced.
+        The settings are saved to the file (unless ``save`` is False), then the listeners are notified.
+
+        Returns:
+            changed (set of str) : Sections whose value changed.
+        """
+        with self._lock:
+            new = {key: merged(self.get(key), value) for key, value in changes.items()}
+            changed = {key for key, value in new.items() if self.get(key) != value}
+            if not changed:
+                return changed
+            previous = {key: self.get(key) for key in changed}
+            for key in changed:
+                self[key] = new[key]
+            if save:
+                try:
+                    self.save()
+                except OSError:
+                    for key, value in previous.items():  # The settings stay those of the file
+                        self[key] = value
+                    raise
+            self._notify(changed)
+        return changed
+
+    def replace(self, data: dict)-> set[str]:
+        """
+        Replaces all the settings (e.g. with those of another process), without saving them, and notifies the listeners.
+
+        Returns:
+            changed (set of str) : Sections whose value changed.
+        """
+        with self._lock:
+            changed = {key for key in set(self) | set(data) if self.get(key) != data.get(key)}
+            self.clear()
+            self.update(copy.deepcopy(data))
+            if changed:
+                self._notify(changed)
+        return changed
+
+    def reload(self)-> set[str]:
+        """
+        Reads the settings file again (e.g. after it was edited by hand).
+        """
+        return self.replace(self.read())
+
+    def _notify(self, changed: set[str])->None:
+        for listener, sections in list(self._listeners):
+            if sections is None or sections & changed:
+                listener(self, changed)
+
+def merged(current, change):
+    """
+    Returns a copy of ``current`` updated with ``change``: dicts are merged key by key, other values are replaced.
+    """
+    if not isinstance(current, dict) or not isinstance(change, dict):
+        return copy.deepcopy(change)
+    result = copy.deepcopy(current)
+    for key, value in change.items():
+        result[key] = merged(current.get(key), value)
+    return result
+
+_settings = None
+_settings_lock = threading.Lock()
+
+def get_settings()-> Settings:
+    """
+    Returns the settings shared by all the modules, read from settings.json the first time.
+    """
+    global _settings
+    with _settings_lock:
+        if _settings is None:
+            _settings = Settings(settings_path)
+    return _settings
@@ -0,0 +1,412 @@
+"""
+Headless command-line runner for HyProC, for batch processing without the GUI.
+
+Usage:
+    python -m hyproc run target.json --curve data.csv --std std.json --std-yield 1250 --beam-sd 2.5
+    python -m hyproc run targets/ --curve curves/ --std std.json --std-yield 1250 --beam-sd 2.5 --jobs 8
+    python -m hyproc sweep target.json --curve data.csv --std std.json --std-yield 1250 --beam-sd 1.5 2 2.5 --model Rud "Rud corr" Bohr --doppler on off --offset -1 0 1
+
+A directory of targets is processed in parallel across processes. The experimental curve of each target is the file of the
+same name in the --curve directory (.csv, .txt, .xlsx or .xls), or the --curve file itself if it is shared by all the targets.
+For each target, the simulated curve is written to <target>_sim.txt and a report (chi-squared, timings) is printed;
+a directory run also writes a report.tsv summarising all the targets.
+A sweep writes the chi-squared of every combination of the given beam widths, straggling models, Doppler settings and offsets.
+The stopping powers come from the backend of the settings ("stopping" section), or from the one given with --backend
+(srim, table or analytic) without changing settings.json.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import traceback
+import multiprocessing.util
+import contextlib
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from typing import Sequence
+import numpy as np
+from numpy.typing import NDArray
+
+from class_models import Element, Layer, Target
+import mod2
+import mod4
+from config import get_settings
+
+# Load settings
+settings = get_settings()
+
+curve_extensions = (".csv", ".txt", ".xlsx", ".xls")
+straggling_models = ["Rud", "Rud corr", "Bohr"]
+stopping_backends = ["srim", "table", "analytic"]
+
+def use_backend(backend: str | None)->None:
+    """
+    Selects the stopping power backend of the current process (--backend), settings.json being left unchanged.
+    """
+    if backend is not None:
+        settings.apply({"stopping": {"backend": backend}}, save=False)
+
+def load_target(path: str)-> Target:
+    """
+    Loads a target saved by the GUI (JSON file with a "layers" list).
+    """
+    with open(path, 'r') as f:
+        data = json.load(f)
+    target = Target()
+    target["layers"] = [Layer(data=layer) for layer in data["layers"]]
+    target.normalize_all_layers()
+    return target
+
+def load_std(path: str, layer_index: int = 0)-> Target:
+    """
+    Loads a standard saved by the GUI. As in the GUI, only one layer is kept and its areal density is set to 1500 TFU.
+
+    Parameters:
+        path (str) : JSON file of the standard.
+        layer_index (int, optional) : Layer to keep if the file holds several layers (default 0).
+
+    Returns:
+        std_target (Target) : Single layer standard.
+    """
+    with open(path, 'r') as f:
+        data = json.load(f)
+    layers = [Layer(data=layer) for layer in data["layers"]]
+    if not 0 <= layer_index < len(layers):
+        raise ValueError(f"The standard has {len(layers)} layer(s), layer {layer_index} does not exist.")
+    std_target = Target()
+    std_target["layers"] = [layers[layer_index]]
+    std_target["layers"][0]["areal_density"] = 1500.0
+    std_target["layers"][0].normalize()
+    Z2 = int(settings["reaction"]["Z2"])
+    percent_at = std_target["layers"][0].find_element(Z=Z2)
+    if percent_at is None or percent_at == 0:
+        raise ValueError(f"No element Z={Z2} in the standard.")
+    return std_target
+
+def load_curve(path: str)-> tuple[list[float], list[float], list[float]]:
+    """
+    Loads an experimental excitation curve, with the column names of the settings ("import_curve").
+    Plain text files are read as in the GUI. In Excel files, the first table holding the expected headers is used.
+
+    Returns:
+        energies, yields, errors (list of float) : Curve sorted by energy (keV, Count/µC, Count/µC).
+    """
+    import pandas as pd  # Only needed when a curve is given
+
+    config = settings["import_curve"]["columns"]
+    cols = [config["energy"], config["yield"]]
+    ext = os.path.splitext(path)[1].lower()
+    if ext in [".xlsx", ".xls"]:
+        df = None
+        for sheet in pd.ExcelFile(path).sheet_names:
+            df_raw = pd.read_excel(path, sheet_name=sheet, header=None)
+            header_rows = df_raw[df_raw.apply(lambda row: all(col in row.values for col in cols), axis=1)].index.tolist()
+            if header_rows:
+                header_row = header_rows[0]
+                ndata = 0
+                for i in range(header_row + 1, len(df_raw)):
+                    if df_raw.iloc[i].isnull().all():
+                        break
+                    ndata += 1
+                df = pd.read_excel(path, sheet_name=sheet, skiprows=range(header_row), header=0, nrows=ndata)
+                break
+        if df is None:
+            raise ValueError(f"No table containing the expected headers was found in {path}.")
+    else:
+        if ext == ".csv":
+            df = pd.read_csv(path, comment='#', engine='python')
+        else:
+            df = pd.read_csv(path, comment='#', sep=r'[\t ]+', engine='python', header=None)
+
+        if config["energy"] not in df.columns or config["yield"] not in df.columns:
+            if len(df.columns) >= 2:
+                original_columns = list(df.columns)
+                df.rename(columns={original_columns[0]: config["energy"], original_columns[1]: config["yield"]}, inplace=True)
+                if len(original_columns) > 2:
+                    df.rename(columns={original_columns[2]: config["yield_err"]}, inplace=True)
+            else:
+                raise ValueError("Curve file must contain at least two columns (energy and yield).")
+    if config["yield_err"] not in df.columns:
+        df[config["yield_err"]] = 0.0
+
+    df = df.dropna(subset=[config["energy"], config["yield"], config["yield_err"]])
+    df = df[pd.to_numeric(df[config["energy"]], errors='coerce').notna()]
+    df = df.astype({config["energy"]: float, config["yield"]: float, config["yield_err"]: float}).sort_values(config["energy"])
+    return df[config["energy"]].tolist(), df[config["yield"]].tolist(), df[config["yield_err"]].tolist()
+
+def find_curve(curve: str | None, target_path: str)-> str | None:
+    """
+    Returns the curve file of a target: ``curve`` itself if it is a file, else the file with the same name as the target in the ``curve`` directory.
+    """
+    if curve is None or os.path.isfile(curve):
+        return curve
+    stem = os.path.splitext(os.path.basename(target_path))[0]
+    for ext in curve_extensions:
+        path = os.path.join(curve, stem + ext)
+        if os.path.isfile(path):
+            return path
+    raise FileNotFoundError(f"No curve named {stem} in {curve}.")
+
+def run_one(target_path: str, options: dict)-> dict:
+    """
+    Simulates the excitation curve of one target and compares it to its experimental curve if there is one.
+
+    Parameters:
+        target_path (str) : JSON file of the target.
+        options (dict) : Run options, see main (keys of the parsed command line arguments).
+
+    Returns:
+        report (dict) : Target, output file, number of points, chi-squared (-1 without experimental curve), number of layers of the target and
+            of slabs they were cut into (see mod2.segment_target), timings (s), error message if the run failed.
+    """
+    report = {"target": target_path, "output": "", "points": 0, "chi2": -1.0, "layers": 0, "slabs": 0,
+              "t_stopping": 0.0, "t_broadening": 0.0, "t_total": 0.0, "error": ""}
+    start = time.perf_counter()
+    try:
+        target = load_target(target_path)
+        std_target = load_std(options["std"], options["std_layer"])
+        curve_path = find_curve(options["curve"], target_path)
+        if curve_path is not None:
+            exp_energy, exp_yield, exp_err = load_curve(curve_path)
+        else:
+            e_min, e_max, n = options["energies"]
+            exp_energy, exp_yield = list(np.linspace(e_min, e_max, n)), None
+        if not exp_energy:
+            raise ValueError("No energy to simulate.")
+
+        # Stopping powers of the target and of the standard
+        t0 = time.perf_counter()
+        std_stopping = mod2.submit_stopping_power(std_target["layers"][0], options["std_energy"])
+        segmented = mod2.assign_stopping(target, max(exp_energy))
+        std_stopping = std_stopping.result()
+        t1 = time.perf_counter()
+
+        K = mod4.compute_k_factor(std_target, options["std_yield"], options["beam_sd"], options["doppler"], options["model"],
+                                  options["kernel"], options["std_energy"], std_stopping)
+        sim_curve = mod4.simulate_curve(segmented, exp_energy, K, options["beam_sd"], options["doppler"], options["model"], options["kernel"])
+        sim_energy = [energy + options["offset"] for energy in exp_energy]
+        t2 = time.perf_counter()
+
+        output_dir = options["output"] or os.path.dirname(os.path.abspath(target_path))
+        os.makedirs(output_dir, exist_ok=True)
+        output = os.path.join(output_dir, os.path.splitext(os.path.basename(target_path))[0] + "_sim.txt")
+        with open(output, 'w') as f:
+            for energy, value in zip(sim_energy, sim_curve):
+                f.write(f"{energy:.3f}\t{value:.1f}\n")
+
+        report.update(output=output, points=len(sim_energy), layers=len(target["layers"]), slabs=len(segmented["layers"]), K=K,
+                      t_stopping=t1-t0, t_broadening=t2-t1)
+        if exp_yield is not None:
+            report["chi2"] = mod4.chi_squared_test(exp_energy, exp_yield, sim_energy, sim_curve)
+    except Exception as e:
+        report["error"] = f"{type(e).__name__}: {e}"
+        if not options["quiet"]:
+            traceback.print_exc()
+    report["t_total"] = time.perf_counter() - start
+    return report
+
+def _init_worker(quiet: bool, backend: str | None = None)->None:
+    """
+    Initialises a worker process of a directory run.
+    Each process gets its own copy of the SR Module so that the SRIM runs of different processes never share a folder.
+    """
+    use_backend(backend)  # Processes started with spawn read settings.json again
+    mod2.srim_private_copies = True
+    mod4.curve_workers = 1  # The targets are already shared between the processes
+    multiprocessing.util.Finalize(None, mod2._close_srim_pool, exitpriority=10)  # atexit handlers do not run in worker processes
+    if quiet:
+        sys.stdout = open(os.devnull, 'w')
+
+# Data shared by all the grid points of a sweep, set once per process by _init_sweep
+_sweep_data = {}
+
+def _init_sweep(target: Target, std_target: Target, energies: Sequence[float], options: dict, worker: bool = False)->None:
+    """
+    Stores the target (stopping powers assigned), the standard and the energies of a sweep in the current process.
+    """
+    _sweep_data.update(target=target, std_target=std_target, energies=energies, options=options)
+    if worker:
+        use_backend(options["backend"])
+        mod4.curve_workers = 1  # The grid points are already shared between the processes
+        if options["quiet"]:
+            sys.stdout = open(os.devnull, 'w')
+
+def _sweep_point(point: tuple[float, str, bool])-> tuple[float, NDArray[np.float64]]:
+    """
+    Calculates the K factor and the simulated curve of a sweep for one beam width, straggling model and Doppler setting.
+    """
+    beam_sd, model, doppler = point
+    options = _sweep_data["options"]
+    std_target = _sweep_data["std_target"]
+    K = mod4.compute_k_factor(std_target, options["std_yield"], beam_sd, doppler, model, options["kernel"],
+                              options["std_energy"], std_target["layers"][0]["stopping"])
+    return K, mod4.simulate_curve(_sweep_data["target"], _sweep_data["energies"], K, beam_sd, doppler, model, options["kernel"])
+
+def sweep(target: Target, std_target: Target, energies: Sequence[float], yields: Sequence[float], beam_sds: Sequence[float], models: Sequence[str],
+          dopplers: Sequence[bool], offsets: Sequence[float], options: dict, jobs: int = 1)-> list[dict]:
+    """
+    Simulates the excitation curve of a target for every combination of beam width, straggling model, Doppler setting and energy offset.
+    The stopping powers of the target and of the standard are computed once for the whole grid. An offset only shifts the energies
+    of a simulated curve, so each curve is computed once and compared to the experimental curve for all the offsets.
+
+    Parameters:
+        target (Target) : Target description.
+        std_target (Target) : Single layer standard.
+        energies (list of float) : Energies of the experimental excitation curve (keV).
+        yields (list of float) : Yield of the experimental excitation curve (Count/µC).
+        beam_sds, models, dopplers, offsets (list) : Values of the grid for each parameter.
+        options (dict) : Run options (std_yield, std_energy, kernel and quiet).
+        jobs (int, optional) : Number of processes the curves are calculated on (default 1).
+
+    Returns:
+        results (list of dict) : beam_sd, model, doppler, offset, K and chi2 of each combination.
+    """
+    std_target["layers"][0]["stopping"] = mod2.calc_stopping_power(std_target["layers"][0], options["std_energy"])
+    target = mod2.assign_stopping(target, max(energies))
+
+    points = list(itertools.product(beam_sds, models, dopplers))
+    jobs = max(1, min(jobs, len(points)))
+    if jobs == 1:
+        _init_sweep(target, std_target, energies, options)
+        curves = map(_sweep_point, points)
+    else:
+        # The target is sent once to each process, not with every grid point
+        executor = ProcessPoolExecutor(max_workers=jobs, initializer=_init_sweep, initargs=(target, std_target, energies, options, True))
+        curves = executor.map(_sweep_point, points)
+
+    results = []
+    try:
+        for (beam_sd, model, doppler), (K, sim_curve) in zip(points, curves):
+            for offset in offsets:
+                sim_energy = [energy + offset for energy in energies]
+                results.append({"beam_sd": beam_sd, "model": model, "doppler": doppler, "offset": offset, "K": K,
+                                "chi2": mod4.chi_squared_test(energies, yields, sim_energy, sim_curve)})
+    finally:
+        if jobs > 1:
+            executor.shutdown()
+    return results
+
+def write_sweep(results: Sequence[dict], path: str)->None:
+    """
+    Writes the results of a sweep as a tab separated table, sorted by chi-squared (combinations that could not be compared last).
+    """
+    columns = ["beam_sd", "model", "doppler", "offset", "K", "chi2"]
+    with open(path, 'w') as f:
+        f.write("\t".join(columns) + "\n")
+        for result in sorted(results, key=lambda r: (r["chi2"] < 0, r["chi2"])):
+            f.write("\t".join(f"{result[c]:.6g}" if isinstance(result[c], float) else str(result[c]) for c in columns) + "\n")
+
+def print_report(report: dict)->None:
+    if report["error"]:
+        print(f"{report['target']}: FAILED ({report['error']})")
+        return
+    chi2 = f"{report['chi2']:.4g}" if report["chi2"] >= 0 else "n/a"
+    print(f"{report['target']}: {report['points']} points, {report['layers']} layers ({report['slabs']} slabs), chi2 = {chi2}, "
+          f"stopping {report['t_stopping']:.2f} s, broadening {report['t_broadening']:.2f} s, total {report['t_total']:.2f} s -> {report['output']}")
+
+def write_report(reports: Sequence[dict], path: str)->None:
+    """
+    Writes the reports of a directory run as a tab separated table.
+    """
+    columns = ["target", "points", "layers", "slabs", "chi2", "t_stopping", "t_broadening", "t_total", "output", "error"]
+    with open(path, 'w') as f:
+        f.write("\t".join(columns) + "\n")
+        for report in reports:
+            f.write("\t".join(f"{report[c]:.6g}" if isinstance(report[c], float) else str(report[c]) for c in columns) + "\n")
+
+def parse_energies(text: str)-> tuple[float, float, int]:
+    try:
+        e_min, e_max, n = text.split(":")
+        return float(e_min), float(e_max), int(n)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected min:max:points, e.g. 6380:6600:45")
+
+def main(argv: Sequence[str] | None = None)-> int:
+    # Options shared by all the commands
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--curve", help="Experimental curve file, or directory of curves named after the targets.")
+    common.add_argument("--std", required=True, help="Standard JSON file.")
+    common.add_argument("--std-yield", type=float, required=True, help="Yield measured on the standard (Count/µC).")
+    common.add_argument("--std-layer", type=int, default=0, help="Layer of the standard file to use (default 0).")
+    common.add_argument("--std-energy", type=float, default=6525.0, help="Energy at which the standard is measured (keV, default 6525).")
+    common.add_argument("--backend", choices=stopping_backends,
+                        help="Stopping powers: srim (SR Module), table (stopping tables of the settings) or analytic (approximate, for tests). "
+                             "Default: the backend of the settings, which is left unchanged.")
+    common.add_argument("--kernel", default="convolve", choices=["convolve", "voigt"], help="Broadening kernel (default convolve).")
+    common.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Number of processes (default: number of CPUs).")
+    common.add_argument("--quiet", action="store_true", help="Only print the reports.")
+
+    parser = argparse.ArgumentParser(prog="hyproc", description="HyProC headless runner.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run = subparsers.add_parser("run", parents=[common], help="Simulate the excitation curve of a target, or of every target of a directory.")
+    run.add_argument("target", help="Target JSON file, or directory of target JSON files.")
+    run.add_argument("--energies", type=parse_energies, help="Energies to simulate without experimental curve (min:max:points, keV).")
+    run.add_argument("--beam-sd", type=float, required=True, help="Beam energy broadening (keV).")
+    run.add_argument("--model", default="Rud corr", choices=straggling_models, help="Straggling model (default 'Rud corr').")
+    run.add_argument("--no-doppler", dest="doppler", action="store_false", help="Disable Doppler broadening.")
+    run.add_argument("--offset", type=float, default=0.0, help="Energy offset of the simulated curve (keV).")
+    run.add_argument("--output", help="Output directory (default: next to each target).")
+
+    grid = subparsers.add_parser("sweep", parents=[common], help="Compare a target to its experimental curve over a grid of calculation parameters.")
+    grid.add_argument("target", help="Target JSON file.")
+    grid.add_argument("--beam-sd", type=float, nargs="+", required=True, help="Beam energy broadenings (keV).")
+    grid.add_argument("--model", nargs="+", default=["Rud corr"], choices=straggling_models, help="Straggling models (default 'Rud corr').")
+    grid.add_argument("--doppler", nargs="+", default=["on"], choices=["on", "off"], help="Doppler broadening settings (default on).")
+    grid.add_argument("--offset", type=float, nargs="+", default=[0.0], help="Energy offsets of the simulated curve (keV, default 0).")
+    grid.add_argument("--output", help="Results table (default: <target>_sweep.tsv next to the target).")
+    args = parser.parse_args(argv)
+
+    if args.command == "run" and args.curve is None and args.energies is None:
+        parser.error("either --curve or --energies is required")
+    if args.command == "sweep" and (args.curve is None or not os.path.isfile(args.curve)):
+        parser.error("sweep requires an experimental curve file (--curve)")
+    use_backend(args.backend)
+    if mod2.backend_name == "srim" and not mod2.check_srim_path():
+        print("SRIM path not found. Please check your settings.", file=sys.stderr)
+        return 2
+    options = vars(args)
+
+    if args.command == "sweep":
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(open(os.devnull, 'w')) if args.quiet else contextlib.nullcontext():
+            exp_energy, exp_yield, exp_err = load_curve(args.curve)
+            results = sweep(load_target(args.target), load_std(args.std, args.std_layer), exp_energy, exp_yield, args.beam_sd,
+                            args.model, [doppler == "on" for doppler in args.doppler], args.offset, options, args.jobs)
+        output = args.output or os.path.splitext(os.path.abspath(args.target))[0] + "_sweep.tsv"
+        write_sweep(results, output)
+        valid = [result for result in results if result["chi2"] >= 0]
+        if valid:
+            best = min(valid, key=lambda r: r["chi2"])
+            print(f"Best of {len(results)} combinations: beam SD {best['beam_sd']:g} keV, {best['model']}, Doppler {'on' if best['doppler'] else 'off'}, "
+                  f"offset {best['offset']:g} keV, chi2 = {best['chi2']:.4g}")
+        print(f"Sweep completed in {time.perf_counter()-start:.2f} s. Results: {output}")
+        return 0 if valid else 1
+
+    if not os.path.isdir(args.target):
+        with contextlib.redirect_stdout(open(os.devnull, 'w')) if args.quiet else contextlib.nullcontext():
+            report = run_one(args.target, options)
+        print_report(report)
+        return 1 if report["error"] else 0
+
+    targets = sorted(os.path.join(args.target, name) for name in os.listdir(args.target) if name.lower().endswith(".json"))
+    if not targets:
+        print(f"No target JSON file in {args.target}.", file=sys.stderr)
+        return 2
+    start = time.perf_counter()
+    reports = []
+    jobs = max(1, min(args.jobs, len(targets)))
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(args.quiet, args.backend)) as executor:
+        for report in executor.map(run_one, targets, [options]*len(targets)):
+            print_report(report)
+            reports.append(report)
+
+    report_path = os.path.join(args.output or args.target, "report.tsv")
+    os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+    write_report(reports, report_path)
+    failed = sum(1 for report in reports if report["error"])
+    print(f"{len(reports)-failed}/{len(reports)} targets processed in {time.perf_counter()-start:.2f} s with {jobs} process(es). Report: {report_path}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
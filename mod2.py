@@ -3,52 +3,309 @@ import subprocess
 import periodictable
 import json
 import copy
-
-from class_models import Element, Layer, Target
+import sqlite3
+import threading
+import time
+import queue
+import shutil
+import tempfile
+import atexit
+from contextlib import contextmanager
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Sequence, Callable
+import numpy as np
+from numpy.typing import NDArray
+
+from class_models import Element, Layer, Target, clear_compiled_targets
+from config import Settings, get_settings
 
 # Load settings
 script_dir = os.path.dirname(os.path.abspath(__file__))
-settings_path = os.path.join(script_dir, 'settings.json')
-with open(settings_path, 'r', encoding="utf-8") as f:
-    settings = json.load(f)
-
-Z1 = int(settings["reaction"]["Z1"])
-A1 = int(settings["reaction"]["A1"])
-M1 = periodictable.elements[Z1][A1].mass  # amu
-energy_res = settings["resonance"]["E_R"]  # keV
+settings = get_settings()
 
 # Stopping power variation allowed within a layer (in %)
 percentage = 0.5
+min_step = 1e-6  # Thinnest slab, relative to the layer areal density
+stopped_energy = 1.0  # keV, below which the beam is considered stopped
+
+# Stopping power cache: energies are quantised to 1 eV before being looked up or sent to SRIM
+energy_quantum = 1e-3  # keV
+_stopping_cache = None
+_stopping_cache_lock = threading.Lock()
+
+# Stopping tables: SRIM is run once per composition on a log-spaced energy grid, then interpolated
+table_e_min = 1.0  # keV, lowest energy of the tables (stopping is clamped below)
+_stopping_tables = {}
+_stopping_tables_lock = threading.Lock()
+
+# Stopping backend: "srim" (SRModule.exe), "table" (replay of precomputed tables) or "analytic" (built-in engine)
+analytic_data_path = os.path.join(script_dir, "stopping_data.json")
+_stopping_backend = None
+
+# SRIM workers: each one runs in its own copy of the SR Module folder
+srim_private_copies = False  # Set in worker processes so that they never share the SR Module folder
+_srim_pool = None
+_srim_pool_lock = threading.Lock()
+
+# Segmentation of the layers already integrated: energy loss only propagates forward, so a layer entered with the
+# same energy as in a previous run gives the same slabs (daughter layers) and exit energy
+segment_memo_size = 10000
+_segment_memo = OrderedDict()
+_segment_memo_lock = threading.Lock()
+
+def load_settings(settings: Settings, changed: set[str] | None = None)->None:
+    """
+    Sets the constants derived from the settings. When the settings change (``changed`` sections), the stopping powers
+    computed with the previous ones (backend, tables, cache, SRIM workers, segmentation memo and compiled targets) are forgotten.
+    """
+    global Z1, A1, M1, energy_res, cache_settings, table_mode, table_points, backend_name, table_path, srim_workers
+    global _stopping_backend, _stopping_cache, _srim_pool
+    Z1 = int(settings["reaction"]["Z1"])
+    A1 = int(settings["reaction"]["A1"])
+    M1 = periodictable.elements[Z1][A1].mass  # amu
+    energy_res = settings["resonance"]["E_R"]  # keV
+    cache_settings = settings.get("stopping", {})
+    table_mode = cache_settings.get("table_mode", False)
+    table_points = int(cache_settings.get("table_points", 100))
+    backend_name = cache_settings.get("backend", "srim")
+    table_path = cache_settings.get("table_path") or os.path.join(settings["save_path"], "HyProC", "stopping_tables")
+    srim_workers = int(cache_settings.get("workers", 1))
+    if not changed or not changed & {"reaction", "stopping", "SRIM_path", "save_path"}:
+        return
+    _stopping_backend = None
+    with _stopping_tables_lock:
+        _stopping_tables.clear()
+    with _stopping_cache_lock:
+        if _stopping_cache is not None:
+            _stopping_cache.close()
+            _stopping_cache = None
+    with _srim_pool_lock:
+        if _srim_pool is not None:
+            _srim_pool.close()
+            _srim_pool = None
+    clear_segment_memo()
+    clear_compiled_targets()
+
+load_settings(settings)
+settings.subscribe(load_settings)
+
+def composition_key(layer: Layer) -> str:
+    """
+    Builds a canonical description of the composition of a layer, used as a key for the stopping power cache.
+    Elements are merged by atomic number, sorted and their atomic percentages normalised to 100 %.
 
-def check_srim_path(settings_path: str) -> bool:
-    with open(settings_path, 'r', encoding="utf-8") as f:
-        path = json.load(f)["SRIM_path"]
-    return os.path.exists(os.path.join(path, "SR Module"))
+    Parameters:
+        layer (Layer) : layer of a given target.
+
+    Returns:
+        key (str) : Canonical composition, e.g. "1:10.0000;14:90.0000".
+    """
+    total = sum(el["percent_at"] for el in layer["elements"])
+    merged = {}
+    for el in layer["elements"]:
+        merged[el["Z"]] = merged.get(el["Z"], 0.0) + el["percent_at"]
+    return ";".join(f"{Z}:{pct/total*100.0:.4f}" for Z, pct in sorted(merged.items()) if pct > 0)
+
+def ion_key() -> str:
+    """
+    Describes the incident ion (Z1 & M1 from the settings), used as a key for the stopping power cache.
+    """
+    return f"{Z1}:{M1:.6f}"
+
+class StoppingCache:
+    """
+    Persistent (SQLite) table of stopping powers keyed by layer composition, incident ion and quantised energy.
+    The least recently used entries are evicted once the table holds more than ``max_entries`` rows.
+    The last use of the entries read is kept in memory and written with the next put, every ``touch_batch`` hits and on close,
+    so that a hit is a single SELECT.
+    """
+    def __init__(self, path: str, max_entries: int = 100000, touch_batch: int = 256)->None:
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_batch = touch_batch
+        self.hits = 0
+        self.misses = 0
+        self._touched = {}  # (composition, ion, energy) -> last use not written yet
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30.0)  # The cache may be shared by several processes (see hyproc.py)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS stopping ("
+            "composition TEXT NOT NULL, ion TEXT NOT NULL, energy INTEGER NOT NULL, "
+            "stopping REAL NOT NULL, last_used REAL NOT NULL, "
+            "PRIMARY KEY (composition, ion, energy))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS stopping_last_used ON stopping (last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM stopping").fetchone()[0]
+
+    def get(self, composition: str, ion: str, energy: int) -> float | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT stopping FROM stopping WHERE composition=? AND ion=? AND energy=?",
+                (composition, ion, energy)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touched[(composition, ion, energy)] = time.time()
+            if len(self._touched) >= self.touch_batch:
+                self._write_touched()
+                self._conn.commit()
+            return row[0]
+
+    def _write_touched(self)->None:
+        """
+        Writes the last use of the entries read since the last write (the caller holds the lock and commits).
+        """
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE stopping SET last_used=? WHERE composition=? AND ion=? AND energy=?",
+                [(last_used, *key) for key, last_used in self._touched.items()])
+            self._touched.clear()
+
+    def put(self, composition: str, ion: str, energy: int, stopping: float)->None:
+        with self._lock:
+            self._write_touched()  # Evictions below see the latest uses
+            self._touched.pop((composition, ion, energy), None)
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO stopping (composition, ion, energy, stopping, last_used) VALUES (?, ?, ?, ?, ?)",
+                (composition, ion, energy, stopping, time.time()))
+            if cur.rowcount > 0:
+                self._size += 1  # New row (a replaced one doesn't change the size)
+            else:
+                self._conn.execute(
+                    "UPDATE stopping SET stopping=?, last_used=? WHERE composition=? AND ion=? AND energy=?",
+                    (stopping, time.time(), composition, ion, energy))
+            if self._size > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM stopping WHERE rowid IN (SELECT rowid FROM stopping ORDER BY last_used LIMIT ?)",
+                    (self._size - self.max_entries,))
+                self._size = self._conn.execute("SELECT COUNT(*) FROM stopping").fetchone()[0]
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": self._size}
+
+    def clear(self)->None:
+        with self._lock:
+            self._touched.clear()
+            self._conn.execute("DELETE FROM stopping")
+            self._conn.commit()
+            self._size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def close(self)->None:
+        with self._lock:
+            if self._conn is None:
+                return
+            self._write_touched()
+            self._conn.commit()
+            self._conn.close()
+            self._conn = None
+
+def get_stopping_cache() -> StoppingCache | None:
+    """
+    Opens (once) the persistent stopping power cache located in the HyProC folder of the save path.
+    Falls back on the script folder if the save path doesn't exist. Returns None if the cache is disabled in the settings.
+    """
+    global _stopping_cache
+    if not cache_settings.get("cache", True):
+        return None
+    with _stopping_cache_lock:
+        if _stopping_cache is None:
+            folder = os.path.join(settings["save_path"], "HyProC")
+            try:
+                os.makedirs(folder, exist_ok=True)
+            except OSError:
+                folder = script_dir
+            _stopping_cache = StoppingCache(os.path.join(folder, "stopping_cache.sqlite"),
+                                            int(cache_settings.get("cache_max_entries", 100000)))
+    return _stopping_cache
+
+class SRIMPool:
+    """
+    Pool of SRIM workers. Each worker owns a scratch copy of the SR Module folder so that several SR.IN/Output
+    files can be written and SRModule.exe can be run concurrently, without changing the working directory.
+    With a single worker, the SR Module folder itself is used unless ``private`` is True.
+    """
+    def __init__(self, srim_module_path: str, workers: int = 1, private: bool = False)->None:
+        self.source = srim_module_path
+        self.workers = max(1, workers)
+        self._tmp_root = None
+        self._free = queue.Queue()
+        if self.workers == 1 and not private:
+            self._free.put(srim_module_path)
+        else:
+            self._tmp_root = tempfile.mkdtemp(prefix="HyProC_SRIM_")
+            for i in range(self.workers):
+                scratch = os.path.join(self._tmp_root, f"worker{i}", "SR Module")
+                shutil.copytree(srim_module_path, scratch)
+                self._free.put(scratch)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="SRIM")
+
+    @contextmanager
+    def scratch_dir(self):
+        """
+        Borrows a free SR Module folder for the duration of a SRIM run (blocks until one is available).
+        """
+        folder = self._free.get()
+        try:
+            yield folder
+        finally:
+            self._free.put(folder)
+
+    def submit(self, fn, *args) -> Future:
+        return self._executor.submit(fn, *args)
+
+    def close(self)->None:
+        self._executor.shutdown(wait=True)
+        if self._tmp_root is not None:
+            shutil.rmtree(self._tmp_root, ignore_errors=True)
+
+def get_srim_pool() -> SRIMPool:
+    """
+    Returns the SRIM worker pool, (re)creating it if the SRIM path changed in the settings.
+    """
+    global _srim_pool
+    SRIM_path = os.path.join(settings["SRIM_path"], "SR Module")
+    with _srim_pool_lock:
+        if _srim_pool is None or _srim_pool.source != SRIM_path:
+            if _srim_pool is not None:
+                _srim_pool.close()
+            _srim_pool = SRIMPool(SRIM_path, srim_workers, srim_private_copies)
+    return _srim_pool
+
+@atexit.register
+def _close_srim_pool()->None:
+    if _srim_pool is not None:
+        _srim_pool.close()
+
+@atexit.register
+def _close_stopping_cache()->None:
+    if _stopping_cache is not None:
+        _stopping_cache.close()  # Writes the last uses kept in memory
+
+def check_srim_path() -> bool:
+    return os.path.exists(os.path.join(settings["SRIM_path"], "SR Module"))
 
 # Writing input file for SRIM
-def write_input(layer: Layer, energy: float)->None:
+def write_input(layer: Layer, energy: float | Sequence[float], SRIM_path: str)->None:
     """
     Writes the SR.IN input file that SRIM uses to calculate the stopping power of a given layer.
 
     Parameters:
         layer (Layer) : layer of a given target.
-        energy (float) : Energy (in keV) at which the stopping power is going to be calculated.
+        energy (float or list of float) : Energy (in keV) at which the stopping power is going to be calculated.
+            If a list is given, SRIM tabulates the stopping power at every energy of the list.
+        SRIM_path (str) : SR Module folder (or scratch copy of it) in which SRIM is going to run.
 
     Returns
     -------
         None
     """
-    # Finding out where the script is located
-    script_dir = os.path.dirname(os.path.abspath(__file__)) 
-    settings_path = os.path.join(script_dir, 'settings.json')
-
-    # Loading the SRIM path from the settings json file
-    with open(settings_path,'r', encoding="utf-8") as f:
-        filedata = json.load(f)
-        path=filedata["SRIM_path"]
-    SRIM_path = os.path.join(path,"SR Module")    
-    os.chdir(SRIM_path)
-
     file_path = os.path.join(SRIM_path, "SR.IN")
 
     # Delete existing file if it exists
@@ -93,22 +350,28 @@ def write_input(layer: Layer, energy: float)->None:
         file.write("7 \n")  # So the unit is eV/TFU
         file.write("---Ion Energy : E-Min(keV), E-Max(keV) \n")
         file.write("0   0 \n")
-        file.write(f"{energy}")
+        if np.ndim(energy) == 0:
+            file.write(f"{energy}")
+        else:
+            for E in energy:
+                file.write(f"{E:.6g}\n")
+            file.write("0\n")  # End of the energy list
 
 # Reading output file from SRIM
-def read_stoppower()-> float:
+def read_stopping_table(n_energies: int, SRIM_path: str)-> list[float]:
     """
-    Reads the output file from SRIM.
+    Reads the stopping table written by SRIM in the output file.
 
     Parameters
     ----------
-        None
+        n_energies (int): Number of energies requested in the SR.IN file (rows to read).
+        SRIM_path (str): SR Module folder in which SRIM ran.
 
     Returns
     -------
-        S (float): Stopping power in keV/TFU (both electronic and nuclear)
+        S (list of float): Stopping power in eV/TFU (both electronic and nuclear) for each requested energy, in the same order.
     """
-    with open("Output", 'r') as f: # Output is the file name!!
+    with open(os.path.join(SRIM_path, "Output"), 'r') as f: # Output is the file name!!
         lines = f.readlines()
         
     # Find the line containing "Stopping Units"
@@ -119,24 +382,346 @@ def read_stoppower()-> float:
     else:
         raise ValueError('"Stopping Units" not found in file.')
 
-    # Extract the line and parse values
-    target_line = lines[target_line_index].strip()
-    parts = target_line.split()
-    
-    if len(parts) < 3:
-        raise ValueError("The data line doesn't have enough columns.")
+    # Extract the lines and parse values
+    S = []
+    for target_line in lines[target_line_index:target_line_index + n_energies]:
+        parts = target_line.strip().split()
+        if len(parts) > 1 and parts[1] in ("eV", "keV", "MeV", "GeV"):
+            parts = parts[1:]  # Energy printed with a separate unit
+
+        if len(parts) < 3:
+            raise ValueError("The data line doesn't have enough columns.")
+
+        try:
+            s_elec = float(parts[1])
+            s_nuc = float(parts[2])
+        except ValueError:
+            raise ValueError("Non-numeric values found in expected columns.")
+        S.append(s_elec + s_nuc)
+
+    if len(S) != n_energies:
+        raise ValueError(f"Expected {n_energies} stopping values, found {len(S)}.")
+    return S
+
+def read_stoppower(SRIM_path: str)-> float:
+    """
+    Reads the output file from SRIM for a single energy.
+
+    Parameters
+    ----------
+        SRIM_path (str): SR Module folder in which SRIM ran.
+
+    Returns
+    -------
+        S (float): Stopping power in eV/TFU (both electronic and nuclear)
+    """
+    return read_stopping_table(1, SRIM_path)[0]
+
+def run_srim(layer: Layer, energy: float) -> float:
+    """
+    Computes the stopping power of a given layer at a certain energy by running SRIM.
+
+    Parameters:
+        layer (Layer) : layer of a given target.
+        energy (float) : Energy (in keV) at which the stopping power is going to be calculated.
+
+    Returns:
+        S (float) : Stopping power in keV/TFU
+    """
+    with get_srim_pool().scratch_dir() as SRIM_path:
+        write_input(layer, energy, SRIM_path)
+        subprocess.run([os.path.join(SRIM_path, "SRModule.exe")], cwd=SRIM_path, check=True)
+        S = read_stoppower(SRIM_path)
+
+    return S/1000 # Final units: keV/TFU
+
+def calc_stopping_table(layer: Layer, e_max: float) -> tuple[NDArray[np.float64], NDArray[np.float64]]:
+    """
+    Tabulates the stopping power of a given layer with a single SRIM run, on a log-spaced energy grid.
+
+    Parameters:
+        layer (Layer) : layer of a given target.
+        e_max (float) : Highest energy (in keV) of the table.
+
+    Returns:
+        E (NDArray[float64]) : Energies of the table (keV).
+        S (NDArray[float64]) : Stopping power at each energy (keV/TFU).
+    """
+    E = np.geomspace(table_e_min, max(e_max, 2*table_e_min), table_points)
+    with get_srim_pool().scratch_dir() as SRIM_path:
+        write_input(layer, E, SRIM_path)
+        subprocess.run([os.path.join(SRIM_path, "SRModule.exe")], cwd=SRIM_path, check=True)
+        S = np.asarray(read_stopping_table(len(E), SRIM_path))/1000 # Final units: keV/TFU
+    return E, S
+
+def prepare_stopping_tables(layers: Sequence[Layer], e_max: float, in_pool: bool = False) -> None:
+    """
+    Makes sure a stopping table reaching at least ``e_max`` exists for every composition found in ``layers``.
+    SRIM is run once per unique composition missing from the tables, the runs being spread over the SRIM workers.
+
+    Parameters:
+        layers (list of Layer) : layers of a given target.
+        e_max (float) : Highest energy (in keV) needed (max energy of the excitation curve).
+        in_pool (bool, optional) : True when called from a task running on a SRIM worker (see submit_stopping_power):
+            the tables are then computed on that worker, waiting on the pool from inside the pool could block it.
+    """
+    e_max = e_max * 1.05  # Margin so the max energy isn't on the edge of the table
+    ion = ion_key()
+    missing = {}
+    for layer in layers:
+        key = (composition_key(layer), ion)
+        with _stopping_tables_lock:
+            table = _stopping_tables.get(key)
+        if (table is None or table[0] < e_max) and key not in missing:
+            missing[key] = layer
+
+    if in_pool:
+        tables = {key: calc_stopping_table(layer, e_max) for key, layer in missing.items()}
+    else:
+        futures = {key: get_srim_pool().submit(calc_stopping_table, layer, e_max) for key, layer in missing.items()}
+        tables = {key: future.result() for key, future in futures.items()}
+    from scipy.interpolate import PchipInterpolator  # Slow import, only needed when tables are built
+
+    for key, (E, S) in tables.items():
+        print(f"Stopping table computed for {key[0]} ({len(E)} energies)")
+        with _stopping_tables_lock:
+            _stopping_tables[key] = (E[-1], PchipInterpolator(np.log(E), np.log(S)))
+        try:
+            save_stopping_table(table_path, key[0], key[1], E, S)
+        except OSError:
+            print(f"Stopping table couldn't be saved in {table_path}")
+
+def interpolate_stopping(layer: Layer, energy: float | NDArray[np.float64], in_pool: bool = False) -> float | NDArray[np.float64]:
+    """
+    Interpolates (monotone, log-log) the stopping power of a layer from its stopping table.
+    The table is computed first if it doesn't exist or doesn't reach ``energy``.
+
+    Parameters:
+        layer (Layer) : layer of a given target.
+        energy (float or NDArray[float64]) : Energy (in keV) at which the stopping power is going to be calculated.
+        in_pool (bool, optional) : True when running on a SRIM worker, see prepare_stopping_tables.
+
+    Returns:
+        S (float or NDArray[float64]) : Stopping power in keV/TFU
+    """
+    key = (composition_key(layer), ion_key())
+    with _stopping_tables_lock:
+        table = _stopping_tables.get(key)
+    if table is None or table[0] < np.max(energy):
+        prepare_stopping_tables([layer], np.max(energy), in_pool)
+        with _stopping_tables_lock:
+            table = _stopping_tables[key]
+    E_top, interp = table
+    S = np.exp(interp(np.log(np.clip(energy, table_e_min, E_top))))
+    return float(S) if np.ndim(S) == 0 else S
+
+def srim_stopping_power(layer: Layer, energy: float, in_pool: bool = False) -> float:
+    """
+    Computes the stopping power of a given layer at a certain energy with SRIM.
+    In table mode, the value is interpolated from the stopping table of the layer composition.
+    Otherwise, the persistent stopping cache is looked up first and SRIM is only run on a miss.
+
+    Parameters:
+        layer (Layer) : layer of a given target.
+        energy (float) : Energy (in keV) at which the stopping power is going to be calculated.
+        in_pool (bool, optional) : True when running on a SRIM worker, see prepare_stopping_tables.
 
-    try:
-        s_elec = float(parts[1])
-        s_nuc = float(parts[2])
-    except ValueError:
-        raise ValueError("Non-numeric values found in expected columns.")
+    Returns:
+        S (float) : Stopping power in keV/TFU
+    """
+    if table_mode:
+        return interpolate_stopping(layer, energy, in_pool)
+
+    cache = get_stopping_cache()
+    if cache is None:
+        return run_srim(layer, energy)
+
+    composition = composition_key(layer)
+    ion = ion_key()
+    energy_q = round(energy/energy_quantum)
+    S = cache.get(composition, ion, energy_q)
+    if S is None:
+        S = run_srim(layer, energy_q*energy_quantum)
+        cache.put(composition, ion, energy_q, S)
+    return S
+
+# Stopping tables files
+def save_stopping_table(folder: str, composition: str, ion: str, E: Sequence[float], S: Sequence[float])->None:
+    """
+    Saves a stopping table as a tab-separated text file, so it can be replayed later by the "table" backend.
 
-    return s_elec + s_nuc
+    Parameters:
+        folder (str) : Folder in which the table is saved.
+        composition (str) : Canonical composition of the layer (see ``composition_key``).
+        ion (str) : Incident ion (see ``ion_key``).
+        E (list of float) : Energies of the table (keV).
+        S (list of float) : Stopping power at each energy (keV/TFU).
+    """
+    os.makedirs(folder, exist_ok=True)
+    filename = f"Z1-{ion.split(':')[0]}_" + composition.replace(":", "-").replace(";", "_") + ".txt"
+    with open(os.path.join(folder, filename), 'w') as f:
+        f.write("# HyProC stopping table\n")
+        f.write(f"# composition: {composition}\n")
+        f.write(f"# ion: {ion}\n")
+        f.write("# Energy (keV)\tStopping (keV/TFU)\n")
+        for e, s in zip(E, S):
+            f.write(f"{e}\t{s}\n")
+
+def load_stopping_table(file_path: str) -> tuple[str, str, NDArray[np.float64], NDArray[np.float64]]:
+    """
+    Loads a stopping table saved by ``save_stopping_table``.
+
+    Returns:
+        composition (str) : Canonical composition of the layer.
+        ion (str) : Incident ion.
+        E (NDArray[float64]) : Energies of the table (keV).
+        S (NDArray[float64]) : Stopping power at each energy (keV/TFU).
+    """
+    header = {}
+    E = []
+    S = []
+    with open(file_path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("#"):
+                name, _, value = line[1:].partition(":")
+                header[name.strip()] = value.strip()
+            elif line:
+                e, s = line.split()
+                E.append(float(e))
+                S.append(float(s))
+    if "composition" not in header or "ion" not in header:
+        raise ValueError(f"{file_path} is not a HyProC stopping table.")
+    return header["composition"], header["ion"], np.asarray(E), np.asarray(S)
+
+# Stopping backends
+class StoppingBackend:
+    """
+    Computes the stopping power of a layer (keV/TFU) for one energy or a whole array of energies (keV).
+    """
+    name = ""
+
+    def stopping(self, layer: Layer, energy: float | NDArray[np.float64]) -> float | NDArray[np.float64]:
+        raise NotImplementedError
+
+class SRIMBackend(StoppingBackend):
+    """
+    Stopping powers from SRIM's SR Module (cached, or tabulated in table mode).
+    """
+    name = "srim"
+
+    def stopping(self, layer: Layer, energy: float | NDArray[np.float64]) -> float | NDArray[np.float64]:
+        if np.ndim(energy) == 0:
+            return srim_stopping_power(layer, float(energy))
+        if table_mode:
+            return interpolate_stopping(layer, np.asarray(energy, dtype=float))
+        return np.array([srim_stopping_power(layer, float(E)) for E in energy])
+
+class TableBackend(StoppingBackend):
+    """
+    Replays stopping tables previously computed with SRIM (files saved by ``save_stopping_table``).
+    """
+    name = "table"
+
+    def __init__(self, folder: str)->None:
+        from scipy.interpolate import PchipInterpolator  # Slow import, only needed when tables are built
+
+        self.folder = folder
+        self.tables = {}
+        if os.path.isdir(folder):
+            for filename in sorted(os.listdir(folder)):
+                if filename.endswith(".txt"):
+                    composition, ion, E, S = load_stopping_table(os.path.join(folder, filename))
+                    self.tables[(composition, ion)] = (E[0], E[-1], PchipInterpolator(np.log(E), np.log(S)))
+
+    def stopping(self, layer: Layer, energy: float | NDArray[np.float64]) -> float | NDArray[np.float64]:
+        key = (composition_key(layer), ion_key())
+        if key not in self.tables:
+            raise ValueError(f"No stopping table for composition {key[0]} (ion {key[1]}) in {self.folder}.")
+        E_min, E_max, interp = self.tables[key]
+        if np.max(energy) > E_max:
+            print(f"Warning: {np.max(energy):.1f} keV is beyond the stopping table of {key[0]} ({E_max:.1f} keV)")
+        S = np.exp(interp(np.log(np.clip(energy, E_min, E_max))))
+        return float(S) if np.ndim(S) == 0 else S
+
+class AnalyticBackend(StoppingBackend):
+    """
+    Approximate built-in stopping engine, meant for tests and for machines without SRIM: final results should use SRIM
+    or replayed SRIM tables ("srim" or "table" backends).
+    Compound stopping from Bragg's rule over per-element stopping powers. The electronic stopping interpolates between
+    the Lindhard-Scharff (low velocity) and Bethe (high velocity) regimes. The only per-element data are the mean excitation
+    energies of stopping_data.json: there are no per-element fitted coefficients (such as Ziegler's). The effective charge
+    of heavy ions uses a single constant adjusted on SRIM for 15N in Si around 6.4 MeV, applied to every element, so the
+    error grows for other ions, elements and energies. The nuclear stopping uses the ZBL universal potential.
+    """
+    name = "analytic"
+
+    def __init__(self, data_path: str)->None:
+        with open(data_path, 'r', encoding="utf-8") as f:
+            data = json.load(f)
+        self.mean_excitation = {int(Z): float(I) for Z, I in data["mean_excitation_energy"].items()}
+
+    def element_stopping(self, Z2: int, E: NDArray[np.float64]) -> NDArray[np.float64]:
+        """
+        Stopping power (eV/TFU, electronic + nuclear) of the ion in the element Z2, at the energies E (keV).
+        """
+        M2 = periodictable.elements[Z2].mass
+        I = self.mean_excitation.get(Z2, 10.0*Z2)  # eV, Bloch approximation if missing
+
+        # Electronic stopping of a proton with the same velocity
+        E_p = E / M1 * 1.007276  # keV
+        S_low = 1.212 * Z2 / (1 + Z2**(2/3))**1.5 * np.sqrt(E_p)  # Lindhard-Scharff
+        gamma = 1 + E_p / 938272.0
+        beta2 = 1 - 1/gamma**2
+        L = np.log1p(2 * 510998.95 * beta2 * gamma**2 / I) - beta2
+        S_high = 5.0992e-4 * Z2 / beta2 * L  # Bethe
+        S_p = 1 / (1/S_low + 1/S_high)
+
+        # Effective charge of the ion
+        if Z1 == 1:
+            q = 1.0
+        else:
+            v_ratio = np.sqrt(E / M1 / 24.8)  # v/v0
+            q = 1 - np.exp(-1.55 * v_ratio / Z1**(2/3))  # Constant adjusted on SRIM for 15N in Si around 6.4 MeV
+        S_elec = S_p * (Z1 * q)**2
+
+        # Nuclear stopping (ZBL universal)
+        Zsum = Z1**0.23 + Z2**0.23
+        eps = 32.53 * M2 * E / (Z1 * Z2 * (M1 + M2) * Zsum)
+        sn = np.where(eps <= 30,
+                      np.log1p(1.1383*eps) / (2*(eps + 0.01321*eps**0.21226 + 0.19593*np.sqrt(eps))),
+                      np.log(np.maximum(eps, 30)) / (2*np.maximum(eps, 30)))
+        S_nuc = 8.462 * Z1 * Z2 * M1 * sn / ((M1 + M2) * Zsum)
+
+        return S_elec + S_nuc
+
+    def stopping(self, layer: Layer, energy: float | NDArray[np.float64]) -> float | NDArray[np.float64]:
+        E = np.maximum(np.asarray(energy, dtype=float), 1e-6)
+        total = sum(el["percent_at"] for el in layer["elements"])
+        S = sum(el["percent_at"]/total * self.element_stopping(el["Z"], E) for el in layer["elements"])
+        S = S / 1000 # Final units: keV/TFU
+        return float(S) if np.ndim(S) == 0 else S
+
+def get_stopping_backend() -> StoppingBackend:
+    """
+    Returns the stopping backend selected in the settings ("srim", "table" or "analytic").
+    """
+    global _stopping_backend
+    if _stopping_backend is None:
+        if backend_name == "srim":
+            _stopping_backend = SRIMBackend()
+        elif backend_name == "table":
+            _stopping_backend = TableBackend(table_path)
+        elif backend_name == "analytic":
+            _stopping_backend = AnalyticBackend(analytic_data_path)
+            print("Analytic stopping backend: approximate stopping powers (test mode), use SRIM or SRIM tables for results.")
+        else:
+            raise ValueError(f"Unknown stopping backend: {backend_name}")
+    return _stopping_backend
 
 def calc_stopping_power(layer: Layer, energy: float) -> float:
     """
-    Computes the stopping power of a given layer at a certain energy using SRIM.
+    Computes the stopping power of a given layer at a certain energy, using the stopping backend selected in the settings.
 
     Parameters:
         layer (Layer) : layer of a given target.
@@ -145,103 +730,212 @@ def calc_stopping_power(layer: Layer, energy: float) -> float:
     Returns:
         S (float) : Stopping power in keV/TFU
     """
-    write_input(layer, energy)
-    subprocess.run(["SRModule.exe"], check=True)
+    return float(get_stopping_backend().stopping(layer, energy))
+
+def submit_stopping_power(layer: Layer, energy: float) -> Future:
+    """
+    Computes the stopping power of a given layer in the background, on one of the SRIM workers.
+
+    Returns:
+        future (Future) : Future whose result is the stopping power in keV/TFU.
+    """
+    if backend_name != "srim":
+        future = Future()
+        future.set_result(calc_stopping_power(layer, energy))
+        return future
+    return get_srim_pool().submit(srim_stopping_power, copy.deepcopy(layer), energy, True)  # Runs on a SRIM worker: in_pool
+
+def integrate_layer(layer: Layer, E_in: float, tolerance: float) -> tuple[list[Layer], float, int]:
+    '''
+    Integrates the energy loss through a layer with an adaptive step: the layer is cut in slabs thin enough
+    for the stopping power to vary by less than ``tolerance`` (relative) between the entry and the exit of each slab.
+    The step grows or shrinks with the observed variation, and the exit stopping of a slab is reused as the entry
+    stopping of the next one, so about one stopping evaluation is needed per slab.
+
+    Parameters:
+        layer (Layer): Layer to integrate through.
+        E_in (float): Energy (keV) of the beam entering the layer.
+        tolerance (float): Relative variation of the stopping power allowed within a slab.
+
+    Returns:
+        slabs (list of Layer): Slabs (daughter layers) of the layer, each with a constant stopping power (keV/TFU).
+        E_out (float): Energy (keV) of the beam leaving the layer.
+        evaluations (int): Number of stopping power evaluations.
+    '''
+    slabs = []
+    evaluations = 0
+    remaining = layer["areal_density"]
+    h = remaining  # First try: the whole layer in one slab
+    S_in = None
+
+    while remaining > 1e-9 * layer["areal_density"]:
+        # Beam stopped before the end of the layer: stopping set to 0 for the rest of it
+        if E_in <= stopped_energy:
+            slab = copy.deepcopy(layer)
+            slab["areal_density"] = remaining
+            slab["stopping"] = 0
+            slabs.append(slab)
+            break
+
+        if S_in is None:
+            S_in = calc_stopping_power(layer, E_in)
+            evaluations += 1
+
+        h = min(h, remaining)
+        if h > remaining * (1 - 1e-9):
+            h = remaining
+        E_out = E_in - h * S_in
+        if E_out <= 0:
+            h = 0.5 * E_in / S_in  # Slab would stop the beam: retrying with a thinner one
+            continue
+
+        S_out = calc_stopping_power(layer, E_out)
+        evaluations += 1
+        variation = abs(S_in - S_out)/max(abs(S_in), abs(S_out))
+
+        if variation > tolerance and h > min_step * layer["areal_density"]:
+            h *= max(0.1, 0.9 * tolerance / variation)  # Variation is ~linear with the slab thickness
+            continue
+
+        slab = copy.deepcopy(layer)
+        slab["areal_density"] = h
+        slab["stopping"] = (S_in + S_out) / 2  # Mid slab approx
+        slabs.append(slab)
+
+        E_in -= h * slab["stopping"]
+        remaining -= h
+        S_in = S_out  # Exit stopping reused as entry of the next slab
+        h *= min(2.0, 0.9 * tolerance / variation) if variation > 0 else 2.0
+
+    return slabs, E_in, evaluations
+
+def segment_key(layer: Layer, E_in: float, tolerance: float) -> tuple:
+    """
+    Describes everything the segmentation of a layer depends on, used as a key for the segmentation memo.
+    """
+    return (backend_name, table_mode, ion_key(), tuple((el["Z"], el["percent_at"]) for el in layer["elements"]),
+            float(layer["areal_density"]), round(E_in/energy_quantum), tolerance)
 
-    return read_stoppower()/1000 # Final units: keV/TFU
+def clear_segment_memo() -> None:
+    """
+    Forgets the segmentation of all the layers (e.g. when the stopping power source changes).
+    """
+    with _segment_memo_lock:
+        _segment_memo.clear()
 
-def assign_stopping(target: Target, energy: float) -> Target:
+def segment_target(target: Target, energy: float, progress: Callable[[int, int], None] | None = None) -> tuple[Target, list[int]]:
     '''
     Computes the stopping power of each layer based on its composition and the initial beam energy. The stopping power is considered constant, therefore layers that are too thick are cut in smaller ones to keep that approximation correct. 
+    Each layer is integrated with an adaptive step (see ``integrate_layer``), the energy loss being accumulated from one slab to the next.
+    A layer entered with the same energy as in a previous run is not integrated again: its slabs are taken from the segmentation memo,
+    so after an edit only the modified layer and the layers behind it are recomputed.
+    The memo is keyed on the layers of ``target``: callers keep the unsegmented target and segment it again at each run
+    (the returned slabs differ from one run to the next and would never be found in the memo).
 
     Parameters:
         target (Target): Target  description
         energy (float): Max energy of the excitation curve
+        progress (callable, optional): Called with the number of layers done and the number of layers after each layer.
+            It may raise (e.g. class_models.CalculationCancelled) to stop the integration.
 
     Returns:
         target_copy (Target): Target description. Each layer has a constant stopping power (in keV/TFU)
+        parents (list of int): Index in ``target`` of the layer each slab was cut from
 
     '''
+    if backend_name == "srim" and table_mode:
+        prepare_stopping_tables(target["layers"], energy)
+
     new_target = copy.deepcopy(target)
     new_target["layers"].clear()
-    partDidntEnterLayer = False
-    index = 0
-    daughterLayers_by_layer = []
+    tolerance = percentage/100.0
+    E_in = energy
+    total_evaluations = 0
+    parents = []
+    reused = 0
 
     for i, layer in enumerate(target["layers"]):
-        ctr = 1
+        key = segment_key(layer, E_in, tolerance)
+        with _segment_memo_lock:
+            memo = _segment_memo.get(key)
+            if memo is not None:
+                _segment_memo.move_to_end(key)
+        if memo is not None:
+            slabs, E_out, evaluations = copy.deepcopy(memo[0]), memo[1], 0
+            reused += 1
+            print(f'--- Layer #{i}, E in: {E_in:.6f} keV, E out: {E_out:.6f} keV, {len(slabs)} slab(s), reused')
+        else:
+            slabs, E_out, evaluations = integrate_layer(layer, E_in, tolerance)
+            print(f'--- Layer #{i}, E in: {E_in:.6f} keV, E out: {E_out:.6f} keV, {len(slabs)} slab(s), {evaluations} stopping evaluations')
+            with _segment_memo_lock:
+                _segment_memo[key] = (copy.deepcopy(slabs), E_out)
+                if len(_segment_memo) > segment_memo_size:
+                    _segment_memo.popitem(last=False)
+        new_target["layers"].extend(slabs)
+        parents.extend([i]*len(slabs))
+        total_evaluations += evaluations
+        E_in = E_out
+        if progress is not None:
+            progress(i+1, len(target["layers"]))
+
+    print(f"{len(target['layers'])} layers integrated in {len(new_target['layers'])} slabs ({total_evaluations} stopping evaluations)")
+    print(f"Reused {reused}/{len(target['layers'])} layers from the previous runs")
+    cache = get_stopping_cache() if backend_name == "srim" and not table_mode else None
+    if cache is not None:
+        stats = cache.stats()
+        print(f"Stopping cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries")
+
+    return new_target, parents
+
+def update_slab_stopping(target: Target, segmented: Target, parents: Sequence[int], energy: float) -> tuple[Target, list[int]]:
+    '''
+    Updates the compositions and stopping powers of the slabs of a segmentation after the compositions (not the areal densities)
+    of the layers of ``target`` changed, keeping the slab boundaries: one stopping evaluation per slab instead of a new adaptive integration.
+    The stopping of each slab is the mean of its entry and exit values, as in ``integrate_layer``. Only meant for small changes
+    of composition (e.g. successive iterations of a fit), the slab thicknesses having been chosen for the previous stopping powers.
 
-        # Dummy values to make sure the program enters the while loop
-        S_in = 10
-        S_out = 1
+    Parameters:
+        target (Target): Target description, with the new compositions
+        segmented (Target): Segmentation of ``target`` with the previous compositions (see ``segment_target``), not modified
+        parents (list of int): Index in ``target`` of the layer each slab was cut from
+        energy (float): Max energy of the excitation curve, as passed to ``segment_target``
 
-        while abs(S_in - S_out)/max(abs(S_in), abs(S_out)) > percentage/100.0: 
-            if i == 0:
-                E_in = energy 
-                print(f'--- Layer #0, E in: {E_in:.6f} keV')
-            else:
-                k = len(new_target["layers"])
-                loss = sum(new_target["layers"][n]["areal_density"] * new_target["layers"][n]["stopping"] for n in range(k))
-                E_in = energy - loss
-                print(f'--- Layer #{i}, E in: {E_in:.6f} keV')
-
-            if E_in <= 0:
-                partDidntEnterLayer = True
-                break
-            S_in = calc_stopping_power(layer,E_in)
-            print(f"IN - Energy: {E_in:.3f} keV & Stopping: {S_in:.6f} keV/TFU")
-            E_out = E_in - layer["areal_density"] * S_in
-
-            if E_out < 0:
-                E_out = 0
-                S_out = 0.000001
-            else:
-                S_out = calc_stopping_power(layer, E_out)
-            print(f'OUT - Energy: {E_out:.3f} keV & Stopping: {S_out:.6f} keV/TFU')
-
-            # Checking for variation between the stopping powers on entry VS on exit
-            if abs(S_in - S_out)/max(abs(S_in), abs(S_out)) > percentage/100.0:
-                print("Layer too thick, cutting")
-                layer["areal_density"] /= 2
-                ctr+=1
-            else:
-                layer["stopping"] = (S_in + S_out) / 2 # No segmentation required, assigning stopping power (mid layer approx)
-                print(f'Final Stopping: {layer["stopping"]:.9f} keV/TFU')
+    Returns:
+        target_copy (Target): Target description. Each layer has a constant stopping power (in keV/TFU)
+        parents (list of int): Index in ``target`` of the layer each slab was cut from
 
-        #NbrDaughter = 2**ctr
-        if ctr ==2:
-            Count = 2
-        else:
-            Count = max(1,(ctr-1)**2)
-
-        daughterLayers_by_layer.append(Count) # Count: Number of daughter layers from parent layer
-        index += ctr
-
-        # Segmentation sequence
-        for k in range(Count):
-            new_target["layers"].append(copy.deepcopy(target["layers"][i]))
-
-        # Assigning stopping powers to the segmented target
-        for k in range(Count):
-            nbr = sum(daughterLayers_by_layer[:i])
-            if k == 0:
-                if partDidntEnterLayer:
-                    new_target["layers"][index]["stopping"] = 0
-
-            loss = sum(new_target["layers"][n]["areal_density"] * new_target["layers"][n]["stopping"] for n in range(nbr+k))
-            E_in = energy - loss
-            if E_in <= 0 or partDidntEnterLayer: # If the particle doesn't reach the start of layer, putting stopping power to 0
-                new_target["layers"][k+nbr]["stopping"] = 0
-                continue
-
-            S_in = calc_stopping_power(new_target["layers"][nbr+k], E_in)
-            E_out = E_in - new_target["layers"][k+nbr]["areal_density"] * S_in
-            if E_out < 0:
-                E_out = 0
-                S_out = 0.000001
-            else:
-                S_out = calc_stopping_power(new_target["layers"][k+nbr],E_out)
+    '''
+    new_target = copy.deepcopy(segmented)
+    E_in = energy
+    S_in = None
+    previous = None
+    for slab, parent in zip(new_target["layers"], parents):
+        layer = target["layers"][parent]
+        slab["elements"] = copy.deepcopy(layer["elements"])
+        if parent != previous:
+            S_in, previous = None, parent  # Entry of a new layer: new composition
+        if E_in <= stopped_energy:
+            slab["stopping"] = 0
+            continue
+        if S_in is None:
+            S_in = calc_stopping_power(layer, E_in)
+        S_out = calc_stopping_power(layer, max(E_in - slab["areal_density"]*S_in, stopped_energy))
+        slab["stopping"] = (S_in + S_out) / 2
+        E_in -= slab["areal_density"] * slab["stopping"]
+        S_in = S_out
+    return new_target, list(parents)
+
+def assign_stopping(target: Target, energy: float, progress: Callable[[int, int], None] | None = None) -> Target:
+    '''
+    Computes the stopping power of each layer based on its composition and the initial beam energy (see ``segment_target``).
 
-            new_target["layers"][k+nbr]["stopping"] = (S_in + S_out)/2
+    Parameters:
+        target (Target): Target  description
+        energy (float): Max energy of the excitation curve
+        progress (callable, optional): See ``segment_target``
 
-    return new_target
\ No newline at end of file
+    Returns:
+        target_copy (Target): Target description. Each layer has a constant stopping power (in keV/TFU)
+
+    '''
+    return segment_target(target, energy, progress)[0]
@@ -1,31 +1,36 @@
 import numpy as np
-from scipy.signal import convolve
 import json
 from typing import Sequence, Literal
 from numpy.typing import NDArray
 import os
 import periodictable
-from xlwings import Range
 
-from class_models import Element, Layer, Target
+from class_models import Element, Layer, Target, CompiledTarget, compile_target
+from broadarchive import ArchiveWriter
+from config import Settings, get_settings
 
 # Load settings
-script_dir = os.path.dirname(os.path.abspath(__file__))
-settings_path = os.path.join(script_dir, 'settings.json')
-with open(settings_path, 'r', encoding="utf-8") as f:
-    settings = json.load(f)
+settings = get_settings()
 
-Z1 = int(settings["reaction"]["Z1"])
-A1 = int(settings["reaction"]["A1"])
-M1 = periodictable.elements[Z1][A1].mass* 931.494  # keV/c²
-Z2 = int(settings["reaction"]["Z2"])
-A2 = int(settings["reaction"]["A2"])
-M2 = periodictable.elements[Z2][A2].mass* 931.494  # keV/c²
+def load_settings(settings: Settings, changed: set[str] | None = None)->None:
+    """
+    Sets the reaction and resonance constants from the settings (called again when they change).
+    """
+    global Z1, A1, M1, Z2, A2, M2, E_R, Gamma, sigma_R
+    Z1 = int(settings["reaction"]["Z1"])
+    A1 = int(settings["reaction"]["A1"])
+    M1 = periodictable.elements[Z1][A1].mass* 931.494  # keV/c²
+    Z2 = int(settings["reaction"]["Z2"])
+    A2 = int(settings["reaction"]["A2"])
+    M2 = periodictable.elements[Z2][A2].mass* 931.494  # keV/c²
 
-# Resonance properties
-E_R = settings["resonance"]["E_R"]  # keV
-Gamma = settings["resonance"]["Gamma"]  # keV
-sigma_R = settings["resonance"]["Sigma"]  # mbarn
+    # Resonance properties
+    E_R = settings["resonance"]["E_R"]  # keV
+    Gamma = settings["resonance"]["Gamma"]  # keV
+    sigma_R = settings["resonance"]["Sigma"]  # mbarn
+
+load_settings(settings)
+settings.subscribe(load_settings, ("reaction", "resonance"))
 
 
 def gauss(x: NDArray[np.float64], x0:float, sigma:float)->NDArray[np.float64]:
@@ -35,23 +40,18 @@ def lorentz(x:NDArray[np.float64], x0:float, gamma:float, sigma:float=1.0)->NDAr
     return sigma *(gamma**2 / 4) / ((gamma**2 / 4) + (x-x0)**2)
     # return sigma*1/(np.pi*gamma / 2) *(gamma**2 / 4) / ((gamma**2 / 4) + (x-x0)**2)
 
-def loss_axis(target: Target)->list[float]:
+def loss_axis(target: Target | CompiledTarget)->NDArray[np.float64]:
     """
     Computes the cumulative energy loss through each layer of a multi-layer target, based on stopping power and areal density.
     This is used to identify the layer in which the resonance is reached for a given incident energy.
 
     Parameters:
-        target (Target): Target description.
+        target (Target or CompiledTarget): Target description.
 
     Returns:
-        E_loss (list): Cumulative energy loss in each layer.
+        E_loss (NDArray[float64]): Cumulative energy loss in each layer.
     """
-    E_loss = []
-    loss = 0.0
-    for i, layer in enumerate(target["layers"]):
-        loss = sum(target["layers"][j]["stopping"]*target["layers"][j]["areal_density"] for j in range(i))
-        E_loss.append(loss + layer["stopping"]*layer["areal_density"])
-    return E_loss
+    return compile_target(target, Z2).loss
 
 def find_layer_index(E_in: float, E_loss: list[float]) -> int:
     """
@@ -68,10 +68,10 @@ def find_layer_index(E_in: float, E_loss: list[float]) -> int:
     deltaE_in = E_in - E_R  # Energy loss to get to the resonance
     if deltaE_in < 0:
         return -2  # Out of target: front of target
-    for i, num in enumerate(E_loss):
-        if deltaE_in <= num:
-            return i
-    return -1  # Out of target: back of target
+    index = int(np.searchsorted(E_loss, deltaE_in, side='left'))  # First layer with deltaE_in <= E_loss
+    if index == len(E_loss):
+        return -1  # Out of target: back of target
+    return index
 
 def get_Z(target: Target, index: int, excl_H: bool=False, return_list: bool=False)-> float | list[tuple[int, float]]:
     """
@@ -109,7 +109,7 @@ def get_Z(target: Target, index: int, excl_H: bool=False, return_list: bool=Fals
 
     return round(Z_mean,2)
 
-def find_in_layer_thickness(E_in: float, E_loss: list[float], index: int, target: Target) -> float:
+def find_in_layer_thickness(E_in: float, E_loss: list[float], index: int, target: Target | CompiledTarget) -> float:
     """
     Calculates the thickness within the resonance layer at which the resonance occurs.
 
@@ -120,7 +120,7 @@ def find_in_layer_thickness(E_in: float, E_loss: list[float], index: int, target
         E_in (float): Incident beam energy.
         E_loss (list): Cumulative energy loss values for each layer.
         index (int): Index of the layer where the resonance occurs.
-        target (Target): Target description.
+        target (Target or CompiledTarget): Target description.
 
     Returns:
         float: Thickness within the specified layer at which the resonance is reached.
@@ -133,10 +133,10 @@ def find_in_layer_thickness(E_in: float, E_loss: list[float], index: int, target
     #     inlayer_loss = E_loss[-1] - E_loss[-2]
     else:
         inlayer_loss = deltaE_in - E_loss[index-1]
-    thickness = inlayer_loss/target["layers"][index]["stopping"]
+    thickness = inlayer_loss/compile_target(target, Z2).stopping[index]
     return thickness
 
-def find_total_thickness(E_in: float, E_loss: list[float], index: int, target: Target)-> float:
+def find_total_thickness(E_in: float, E_loss: list[float], index: int, target: Target | CompiledTarget)-> float:
     """
     Calculates the total thickness traveled by the incident particle up to the resonance point in the target.
 
@@ -151,24 +151,23 @@ def find_total_thickness(E_in: float, E_loss: list[float], index: int, target: T
         index (int): Index of the layer where the resonance occurs.
                      Special values: -2 if resonance is before the target,
                                      -1 if resonance is beyond the last layer.
-        target (Target): Target description.
+        target (Target or CompiledTarget): Target description.
 
     Returns:
         thickness (float): Total thickness traveled up to the resonance point within the target.
     """
+    target = compile_target(target, Z2)
     if index==-2:
         offset = E_in - E_R
-        return offset/target["layers"][0]["stopping"]
+        return offset/target.stopping[0]
     elif index==-1:
-        return sum(layer["areal_density"] for layer in target["layers"])
-    thickness = 0.0
-    for i in range(index):
-        thickness += target["layers"][i]["areal_density"]
+        return float(target.thickness[-1])
+    thickness = float(target.thickness[index-1]) if index > 0 else 0.0
     thickness_in_last_layer = find_in_layer_thickness(E_in, E_loss, index, target)
     thickness+= thickness_in_last_layer
     return thickness
 
-def DopplerSD(target: Target, index: int)-> float:
+def DopplerSD(target: Target | CompiledTarget, index: int)-> float:
     """
     Calculates the Doppler standard deviation (delta_D) for the incident particle 
     based on the atomic number (Z) of the layer where the resonance is reached.
@@ -177,13 +176,13 @@ def DopplerSD(target: Target, index: int)-> float:
     For other elements, delta_D is approximated by a linear fit derived from known data.
 
     Parameters:
-        target (Target): Target description.
+        target (Target or CompiledTarget): Target description.
         index (int): Index of the layer where the resonance is reached.
 
     Returns:
         delta_D (float): Doppler standard deviation (delta_D) for the incident particle in the specified layer.
     """
-    Z = get_Z(target, index, excl_H=True)
+    Z = compile_target(target, Z2).Z_no_H[index]  # Same as get_Z(target, index, excl_H=True)
     #print("Z Doppler", Z)
     if Z == 14:  # H-Si binding
         delta_D = 4.00
@@ -214,7 +213,30 @@ def Stragg_law(Z: int, thickness: float, model: str) -> float:
     if model == "Bohr":
         return np.sqrt(0.260532*Z1**2*Z*thickness/1000.0) 
 
-def stragg(E_in: float, E_loss: list[float], index: int, target: Target, model: str="Rud corr")-> float:
+def stragg_variance_table(target: Target | CompiledTarget, model: str="Rud corr")-> tuple[NDArray[np.float64], NDArray[np.float64]]:
+    """
+    Straggling variance table of a target for a given model and incident ion, computed once and kept in the compiled target.
+    The variance of every model is proportional to the thickness crossed, so each layer is described by its variance per TFU
+    and the variance accumulated over the full layers is a prefix sum.
+
+    Parameters:
+        target (Target or CompiledTarget): Target description.
+        model (str, optional): The straggling model to use.
+
+    Returns:
+        var_per_TFU (NDArray[float64]): Straggling variance per TFU of each layer (keV²/TFU).
+        var_cumul (NDArray[float64]): Straggling variance accumulated over the layers before each layer, plus the whole target as last value (keV²).
+    """
+    target = compile_target(target, Z2)
+    key = ("stragg", model, Z1, M1)  # The Bohr law depends on the incident ion, which is set with the reaction
+    if key not in target.cache:
+        # Padded elements have Z = 0 and 0 at. %, i.e. no straggling
+        var_per_TFU = np.sum(Stragg_law(target.Z, target.percent_at/100, model)**2, axis=1)
+        var_cumul = np.concatenate(([0.0], np.cumsum(var_per_TFU*target.areal_density)))
+        target.cache[key] = (var_per_TFU, var_cumul)
+    return target.cache[key]
+
+def stragg(E_in: float, E_loss: list[float], index: int, target: Target | CompiledTarget, model: str="Rud corr")-> float:
     """
     Calculates the standard deviation of the straggling-induced gaussian broadening based on the atomic number,
     material thickness, and selected model.
@@ -225,36 +247,127 @@ def stragg(E_in: float, E_loss: list[float], index: int, target: Target, model:
         index (int): Index of the layer where the resonance occurs.
                      Special values: -2 if resonance is before the target,
                                      -1 if the beam doesn't lose enough energy in the target to reach the resonance.
-        target (Target): Target description.
+        target (Target or CompiledTarget): Target description.
         model (str, optional): The straggling model to use.
 
     Returns:
         Delta_Stg (float): Straggling standard deviation according to the selected model.
     """
-    Var_S = 0.0
+    if index == -2:
+        return 0.0
+    target = compile_target(target, Z2)
+    var_per_TFU, var_cumul = stragg_variance_table(target, model)
 
     if index == -1:
-        for j, layer in enumerate(target["layers"]):
-            Z = get_Z(target, j, excl_H=False, return_list=True)
-            for Z_el in Z:
-                delta_S = Stragg_law(Z_el[0], layer["areal_density"]*Z_el[1]/100, model)
-                Var_S += delta_S**2
+        Var_S = var_cumul[-1]
     else:
-        for i in range(index+1):
-            Z = get_Z(target, i, excl_H=False, return_list=True) 
-            if i != index:  
-                DeltaTFU = target["layers"][i]["areal_density"]
-            else: 
-                DeltaTFU = find_in_layer_thickness(E_in, E_loss,i, target) 
-
-            for Z_el in Z:
-                delta_S = Stragg_law(Z_el[0], DeltaTFU*Z_el[1]/100, model)
-                Var_S += delta_S**2
+        # Full layers crossed + part of the resonance layer
+        Var_S = var_cumul[index] + var_per_TFU[index]*find_in_layer_thickness(E_in, E_loss, index, target)
 
     #print('stragg index ', index)
     #print("Straggling SD: ", np.sqrt(Var_S))
     return np.sqrt(Var_S)
 
+def stragg_batch(energies: Sequence[float], target: Target | CompiledTarget, model: str="Rud corr")-> NDArray[np.float64]:
+    """
+    Calculates the straggling standard deviation (see stragg) for a whole array of incident energies at once.
+
+    Parameters:
+        energies (list of float): Incident energies (keV).
+        target (Target or CompiledTarget): Target description.
+        model (str, optional): The straggling model to use.
+
+    Returns:
+        Delta_Stg (NDArray[float64]): Straggling standard deviation for each energy.
+    """
+    target = compile_target(target, Z2)
+    var_per_TFU, var_cumul = stragg_variance_table(target, model)
+    deltaE_in = np.asarray(energies, dtype=float) - E_R
+    L = target.loss
+
+    # Same as find_layer_index for every energy
+    index = np.searchsorted(L, deltaE_in, side='left')
+    inside = (deltaE_in >= 0) & (index < target.n_layers)
+    k = np.minimum(index, target.n_layers-1)
+    in_layer_thickness = (deltaE_in - np.where(k > 0, L[k-1], 0.0))/target.stopping[k]
+
+    Var_S = np.where(inside, var_cumul[k] + var_per_TFU[k]*in_layer_thickness, var_cumul[-1])
+    Var_S[deltaE_in < 0] = 0.0
+    return np.sqrt(Var_S)
+
+def energy_to_depth(x_conv: NDArray[np.float64], E_in: float, E_loss: list[float], index: int, center: float, target: Target | CompiledTarget) -> tuple[NDArray[np.float64], NDArray[np.int64]]:
+    """
+    Maps every energy of the broadening profile to the thickness at which the beam reaches the resonance with that energy.
+    All samples are mapped at once: layer indices come from a binary search on the cumulative energy loss,
+    and thicknesses from the cumulative areal densities and the stopping power of each layer.
+
+    Parameters:
+        x_conv (NDArray[float64]): Energy axis of the broadening profile (keV).
+        E_in (float): Incident beam energy (keV).
+        E_loss (list): Cumulative energy loss values for each layer.
+        index (int): Index of the layer where the resonance occurs for E_in (-2: before the target, -1: beyond the last layer).
+        center (float): Thickness at which the resonance is reached for E_in (TFU).
+        target (Target or CompiledTarget): Target description.
+
+    Returns:
+        x_conv_TFU (NDArray[float64]): Thickness corresponding to each energy (TFU).
+        new_index (NDArray[int64]): Layer reached by each energy (-2: front escape, -1: back escape).
+    """
+    target = compile_target(target, Z2)
+    S = target.stopping
+    L = np.asarray(E_loss, dtype=float)
+    T = target.thickness  # Cumulative thickness at the end of each layer
+    n = len(L)
+
+    deltaE_in = E_in - E_R  # Energy loss to get to the resonance
+    deltaE = E_R - x_conv  # Energy difference relative to E_R
+    Eloss_value = deltaE_in - deltaE  # Energy loss for each energy value
+
+    # Same as find_layer_index for every sample
+    new_index = np.searchsorted(L, (E_in - deltaE) - E_R, side='left')
+    new_index[new_index == n] = -1
+    new_index[(E_in - deltaE) - E_R < 0] = -2
+
+    x_conv_TFU = np.zeros(len(x_conv))
+    k = np.clip(new_index, 0, n-1)  # Safe gather index (masked-out samples are overwritten)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Target escape (front & back)
+        front = new_index == -2
+        x_conv_TFU[front] = Eloss_value[front]/S[0]
+        back = new_index == -1
+        x_conv_TFU[back] = T[-1] + (Eloss_value[back] - L.max())/S[0]
+
+        inside = new_index > -1
+        if index > -1:
+            # Resonance layer crossed: full layers in between plus partial thicknesses on both sides
+            cross = inside & (new_index != index)
+            low = np.minimum(index, k)
+            high = np.maximum(index, k)
+            low_loss = np.minimum(deltaE_in, Eloss_value)
+            high_loss = np.maximum(deltaE_in, Eloss_value)
+            fullLayerThicknesses = np.where(high - low >= 2, T[np.maximum(high-1, 0)] - T[low], 0.0)
+            x_cross = center + np.sign(k - index) * (fullLayerThicknesses + np.abs(low_loss - L[low])/S[low] + np.abs(high_loss - L[np.maximum(high-1, 0)])/S[high])
+            x_conv_TFU[cross] = x_cross[cross]
+            same = inside & ~cross
+        elif index == -2:
+            deeper = inside & (new_index > 0)
+            prev = np.maximum(k-1, 0)
+            x_deeper = T[prev] + (Eloss_value - L[prev])/S[k]
+            x_conv_TFU[deeper] = x_deeper[deeper]
+            same = inside & ~deeper
+        else:
+            back_res = inside
+            x_back = center - (T[-1] - T[k]) + (Eloss_value - L[k])/S[k]
+            x_conv_TFU[back_res] = x_back[back_res]
+            same = np.zeros(len(x_conv), dtype=bool)
+
+        # Same layer as the resonance
+        x_same = center + (Eloss_value - deltaE_in)/S[k]
+        x_conv_TFU[same] = x_same[same]
+
+    return x_conv_TFU, new_index
+
 def save(vector1: Sequence[float], vector2: Sequence[float], filename: str)-> None:
     """
     Saves two vectors as tab-separated columns to a text file.
@@ -279,7 +392,7 @@ def save(vector1: Sequence[float], vector2: Sequence[float], filename: str)-> No
             f.write(f"{v1}\t{v2}\n")
 
 
-def broadening(E_in: float, target: Target, delta_B: float, Doppler: bool=True, straggling_model: str="Rud corr", saveData: bool=False, savepath: str | None = None)-> tuple[float, NDArray[np.float64], NDArray[np.float64], NDArray[np.float64], float]:
+def broadening(E_in: float, target: Target | CompiledTarget, delta_B: float, Doppler: bool=True, straggling_model: str="Rud corr", saveData: bool=False, savepath: str | None = None, kernel: Literal["convolve", "voigt"]="convolve", voigt_tail: float=50.0, archive: ArchiveWriter | None = None)-> tuple[float, NDArray[np.float64], NDArray[np.float64], NDArray[np.float64], float]:
     """
     Calculates the full energy broadening profile of an incident particle in a multi-layer target,
     accounting for cross section, beam, Doppler, and straggling broadenings, and converts the energy distribution
@@ -288,12 +401,17 @@ def broadening(E_in: float, target: Target, delta_B: float, Doppler: bool=True,
     Parameters
     ----------
         E_in (float) : Incident beam energy (keV).
-        target (Target) : Target description.
+        target (Target or CompiledTarget) : Target description.
         delta_B (float) : Beam energy broadening (keV).
         Doppler (bool, optional) : Whether to include Doppler broadening (default True).
         straggling_model (str, optional) : The straggling model.
         saveData (bool, optional) : Whether to save intermediate broadening data to files (default False).
         savepath (str, optional) : Path to directory for saving data files if saveData is True.
+        kernel (str, optional) : "convolve" for the discrete Gaussian-Lorentzian convolution, "voigt" to evaluate
+            the exact Voigt profile (Faddeeva function) directly on the energy grid (default "convolve").
+        voigt_tail (float, optional) : Half-width of the energy grid in units of Gamma, i.e. where the Lorentzian tails are truncated (default 50).
+        archive (ArchiveWriter, optional) : If saveData is True, the data is added to this archive as a new energy point (see broadarchive)
+            instead of being saved as text files in savepath.
 
     Returns
     -------
@@ -303,7 +421,8 @@ def broadening(E_in: float, target: Target, delta_B: float, Doppler: bool=True,
         layers_contribution (NDArray[float64]) : Normalized contributions of each layer to the profile.
         outOfTarget (float) : Fraction of the profile corresponding to particles escaping the target.
     """
-    E_loss = loss_axis(target)
+    target = compile_target(target, Z2)
+    E_loss = target.loss
     index = find_layer_index(E_in, E_loss)
     
     # Doppler
@@ -311,7 +430,7 @@ def broadening(E_in: float, target: Target, delta_B: float, Doppler: bool=True,
         if index==-2:
             delta_D = DopplerSD(target, 0)
         elif index==-1:
-            delta_D = DopplerSD(target, len(target["layers"])-1)
+            delta_D = DopplerSD(target, target.n_layers-1)
         else:
             delta_D = DopplerSD(target, index)
     else:
@@ -345,112 +464,75 @@ def broadening(E_in: float, target: Target, delta_B: float, Doppler: bool=True,
 
     dx = Gamma / 15
     n_half_gauss = round(x_Range * SD_gauss / dx)  # adapts to SD_gauss
-    n_half_lorentz = round(50 * Gamma / dx)       # fixed, always captures full Lorentzian
+    n_half_lorentz = round(voigt_tail * Gamma / dx)  # fixed, always captures full Lorentzian
     n_half = max(n_half_gauss, n_half_lorentz)
     x = np.linspace(E_center - n_half * dx, E_center + n_half * dx, 2 * n_half + 1)
     
     y1 = gauss(x, E_center, SD_gauss)
-    #y1 /= np.trapezoid(y1,x)  # Normalising (opt)
-    centroid_y1 = np.trapezoid(x * y1, x) # Center of the Gaussian profile
-    #print("Mean of Gaussian: ", centroid_y1)
-    y2 = lorentz(x, E_R, Gamma, sigma_R) 
-    #y2 /= np.trapezoid(y2, x)  # Normalising
-
-    # Convolution between the final Gaussian & Lorentzian
-    y_conv = convolve(y1, y2, mode='full') * dx  
-    x_conv = np.arange(len(y_conv)) * dx + 2 * x[0]  # Generating x-axis 
-    #print("dx: ", dx, "x first element: ", x[0], "second element: ", x[1])
-    #print("x axis conv: ", x_conv)
-    #integral = np.trapezoid(y_conv, x_conv)
-    #centroid_true_equiv = np.trapezoid(x_conv * y_conv, x_conv) / integral
-
-    #print("integral of y_conv:", integral)
-    #print("centroid:", centroid_true_equiv)
-    #print("y_conv min/max:", y_conv.min(), y_conv.max())
-    #print("y_conv boundaries:", y_conv[0], y_conv[-1])
-    if False:
-        y_conv /= np.trapezoid(y_conv, x_conv)  # Normalising (necessary but why?)
-        centroid_conv = np.trapezoid(x_conv * y_conv, x_conv) # Center of the resulting Voigt profile
+    if kernel == "voigt":
+        # Exact Voigt profile of the resonance seen through the Gaussian broadening, no convolution nor recentring needed
+        from scipy.special import voigt_profile  # Slow import (scipy.special), only needed by the "voigt" kernel
+        x_conv = x
+        y_conv = sigma_R * np.pi * Gamma / 2 * voigt_profile(x - E_R, SD_gauss, Gamma / 2)
     else:
-        centroid_conv = np.trapezoid(x_conv * y_conv, x_conv) / np.trapezoid(y_conv, x_conv) # Center of the resulting Voigt profile
-        #centroid_conv = x_conv[np.argmax(y_conv)] 
-    #print("Mean of convolution: ", centroid_conv, (centroid_conv - centroid_y1), "keV from the Gaussian center")
-    x_conv = x_conv - (centroid_conv - centroid_y1)  # Centering the x axis on the resonance energy
-    #print("Final x axis in E scale: ", x_conv)
+        #y1 /= np.trapezoid(y1,x)  # Normalising (opt)
+        centroid_y1 = np.trapezoid(x * y1, x) # Center of the Gaussian profile
+        #print("Mean of Gaussian: ", centroid_y1)
+        y2 = lorentz(x, E_R, Gamma, sigma_R) 
+        #y2 /= np.trapezoid(y2, x)  # Normalising
+
+        # Convolution between the final Gaussian & Lorentzian
+        from scipy.signal import convolve  # Slow import (scipy.signal), only needed by the "convolve" kernel
+        y_conv = convolve(y1, y2, mode='full') * dx  
+        x_conv = np.arange(len(y_conv)) * dx + 2 * x[0]  # Generating x-axis 
+        #print("dx: ", dx, "x first element: ", x[0], "second element: ", x[1])
+        #print("x axis conv: ", x_conv)
+        #integral = np.trapezoid(y_conv, x_conv)
+        #centroid_true_equiv = np.trapezoid(x_conv * y_conv, x_conv) / integral
+
+        #print("integral of y_conv:", integral)
+        #print("centroid:", centroid_true_equiv)
+        #print("y_conv min/max:", y_conv.min(), y_conv.max())
+        #print("y_conv boundaries:", y_conv[0], y_conv[-1])
+        if False:
+            y_conv /= np.trapezoid(y_conv, x_conv)  # Normalising (necessary but why?)
+            centroid_conv = np.trapezoid(x_conv * y_conv, x_conv) # Center of the resulting Voigt profile
+        else:
+            centroid_conv = np.trapezoid(x_conv * y_conv, x_conv) / np.trapezoid(y_conv, x_conv) # Center of the resulting Voigt profile
+            #centroid_conv = x_conv[np.argmax(y_conv)] 
+        #print("Mean of convolution: ", centroid_conv, (centroid_conv - centroid_y1), "keV from the Gaussian center")
+        x_conv = x_conv - (centroid_conv - centroid_y1)  # Centering the x axis on the resonance energy
+        #print("Final x axis in E scale: ", x_conv)
 
-    #y_conv /= np.trapezoid(y_conv, x_conv)
+        #y_conv /= np.trapezoid(y_conv, x_conv)
 
     deltaE_in = E_in - E_R # Energy loss to get to the resonance
     center = find_total_thickness(E_in, E_loss, index, target)  # Thickness at which the energy resonance is reached for a given incident energy
     # print("c ",center)
 
     # Changing the x-axis from energy (keV) to thickness (TFU)
-    x_conv_TFU = np.zeros(len(x_conv))
-    y_conv_TFU = np.zeros(len(x_conv))
-
-    for l,eVal in enumerate(x_conv):
-        deltaE = E_R - eVal  # Energy difference relative to E_R
-        Eloss_value = deltaE_in - deltaE  # Energy loss for the current energy value
-        new_index = find_layer_index(E_in - deltaE, E_loss)
-        outOfTarget = 0
-
-        layers_contribution = np.zeros(len(target["layers"]))
-
-        # If target escape (front)
-        if new_index == -2:
-            #value = center + (Eloss_value - deltaE_in)/target["layers"][0]["stopping"]
-            x_value = Eloss_value/target["layers"][0]["stopping"]
-            y_value = y_conv[l] 
-            # y_conv[np.where(x_conv == eVal)] = 0
-            outOfTarget += 1
-        
-        # If target escape (back)
-        if new_index == -1:
-            x_value = sum(layer["areal_density"] for layer in target["layers"]) + (Eloss_value-max(E_loss))/target["layers"][0]["stopping"]
-            y_value = 0.0
-            # y_conv[np.where(x_conv == eVal)] = 0
-            outOfTarget += 1
-
-        # No escape
-        if new_index > -1:
-            y_value = y_conv[l]
-            layers_contribution[new_index] += 1
-        
-            if new_index != index and index > -1:
-                
-                low_index = min(index, new_index)
-                high_index = max(index, new_index)
-                low_loss = min(deltaE_in, Eloss_value)
-                high_loss = max(deltaE_in, Eloss_value)
-
-                if abs(new_index-index) >= 2:
-                    fullLayerThicknesses = sum(target["layers"][i]["areal_density"] for i in range(low_index + 1, high_index, 1))
-                else:
-                    fullLayerThicknesses = 0.0
-                
-                x_value = center + np.sign(new_index - index) * (fullLayerThicknesses + abs(low_loss-E_loss[low_index])/target["layers"][low_index]["stopping"] + abs(high_loss-E_loss[high_index-1])/target["layers"][high_index]["stopping"] )
-                
-            elif new_index > 0 and index == -2:
-                fullLayerThicknesses = sum(target["layers"][i]["areal_density"] for i in range(0, new_index)) 
-                x_value = fullLayerThicknesses + (Eloss_value-E_loss[new_index-1])/target["layers"][new_index]["stopping"]
-
-            elif new_index >= 0 and index == -1:
-                fullLayerThicknesses = sum(target["layers"][i]["areal_density"] for i in range(new_index+1,len(target["layers"]))) 
-                x_value = center - fullLayerThicknesses + (Eloss_value-E_loss[new_index])/target["layers"][new_index]["stopping"]
-
-            else:
-                x_value = center + (Eloss_value - deltaE_in)/target["layers"][new_index]["stopping"]  # Here, using index or new_index is equivalent            
-        
-        x_conv_TFU[l] = x_value
-        y_conv_TFU[l] = y_value
+    x_conv_TFU, new_index = energy_to_depth(x_conv, E_in, E_loss, index, center, target)
+    y_conv_TFU = np.where(new_index == -1, 0.0, y_conv)  # Nothing beyond the back of the target
 
     # Normalising to get layer contribution in %
+    layers_contribution = np.bincount(new_index[new_index > -1], minlength=target.n_layers).astype(float)
+    outOfTarget = float(np.count_nonzero(new_index < 0))
     total = sum(layers_contribution) + outOfTarget
     if total > 0:
         layers_contribution /= total
         outOfTarget /= total
     
-    if saveData:
+    if saveData and archive is not None:
+        archive.new_point(E_in)
+        archive.add("Beam", x, gauss(x,E_center, delta_B))
+        archive.add("Straggling", x, np.zeros(len(x)) if delta_S == 0 else gauss(x,E_center, delta_S))
+        if Doppler:
+            archive.add("Doppler", x, gauss(x,E_center, delta_D))
+        archive.add("Total Gauss", x, y1)
+        archive.add("Cross section", x, lorentz(x,E_R, Gamma,sigma_R))
+        archive.add("Total Broadening", x_conv, y_conv)
+        archive.add("Total Broadening (TFU)", x_conv_TFU, y_conv_TFU)
+    elif saveData:
         #print(savepath)
         save(x, gauss(x,E_center, delta_B), savepath+"\\"+"Beam.txt")
         if delta_S == 0:
@@ -467,6 +549,82 @@ def broadening(E_in: float, target: Target, delta_B: float, Doppler: bool=True,
     return center, x_conv_TFU, y_conv_TFU, layers_contribution, outOfTarget
 
 
+def broadening_batch(energies: Sequence[float], target: Target | CompiledTarget, delta_B: float, Doppler: bool=True, straggling_model: str="Rud corr", voigt_tail: float=50.0)-> tuple[NDArray[np.float64], NDArray[np.float64], NDArray[np.float64]]:
+    """
+    Calculates the broadening profiles of a whole incident energy scan at once.
+    Target-derived quantities (energy loss axis, Doppler broadening of each layer) are computed once, and every profile
+    is the analytic Voigt profile (see broadening with kernel="voigt") sampled on a depth grid shared by all energies.
+    The grid is uniform in energy loss (step Gamma/15, as in broadening) and contains every layer boundary.
+    Each profile is truncated like the energy grid of broadening, so it only covers a range of consecutive depths of the grid:
+    the profiles are returned as a sparse matrix holding these ranges only.
+
+    Parameters
+    ----------
+        energies (list of float) : Incident beam energies (keV).
+        target (Target or CompiledTarget) : Target description.
+        delta_B (float) : Beam energy broadening (keV).
+        Doppler (bool, optional) : Whether to include Doppler broadening (default True).
+        straggling_model (str, optional) : The straggling model.
+        voigt_tail (float, optional) : Half-width of the profiles in units of Gamma, i.e. where the Lorentzian tails are truncated (default 50).
+
+    Returns
+    -------
+        centers (NDArray[float64]) : Thickness at which resonance is reached for each energy (in TFU).
+        X (NDArray[float64]) : Depth grid shared by all profiles, from the surface to the back of the target (TFU).
+        W (scipy.sparse.csr_matrix) : Broadening profiles, one row per energy and one column per depth of X.
+
+    Raises
+    ------
+        ValueError : If the stopping power of a layer is not positive.
+    """
+    energies = np.asarray(energies, dtype=float)
+    target = compile_target(target, Z2)
+    invalid = np.flatnonzero(~(target.stopping > 0))
+    if invalid.size:
+        # The depth grid is interpolated from the energy loss, which must increase strictly with depth
+        raise ValueError(f"The stopping power of layer {invalid[0]} is not positive ({target.stopping[invalid[0]]} keV/TFU).")
+    L = target.loss
+    T = target.thickness
+    n = target.n_layers
+
+    # Resonance depth and Gaussian broadening of each energy (as find_layer_index and find_total_thickness)
+    deltaE_in = energies - E_R
+    index = np.searchsorted(L, deltaE_in, side='left')
+    front = deltaE_in < 0
+    back = ~front & (index == n)
+    k = np.minimum(index, n-1)  # Layer of the resonance, the last one behind the target
+    centers = np.where(k > 0, T[k-1], 0.0) + (deltaE_in - np.where(k > 0, L[k-1], 0.0))/target.stopping[k]
+    centers[front] = deltaE_in[front]/target.stopping[0]
+    centers[back] = T[-1]
+    delta_D = np.array([DopplerSD(target, i) for i in range(n)])[k] if Doppler else 0.0
+    SD_gauss = np.sqrt(delta_B**2 + delta_D**2 + stragg_batch(energies, target, straggling_model)**2)
+    E_center = np.where(front, energies, np.where(back, energies - L[-1], E_R))
+
+    # Shared depth grid
+    dx = Gamma / 15
+    loss_nodes = np.concatenate(([0.0], L))
+    n_steps = np.maximum(np.ceil(np.diff(loss_nodes) / dx).astype(int), 1)
+    loss = np.concatenate([np.linspace(loss_nodes[k], loss_nodes[k+1], n_steps[k], endpoint=False) for k in range(n)] + [loss_nodes[-1:]])
+    X = np.interp(loss, loss_nodes, np.concatenate(([0.0], T)))
+
+    # Profiles truncated like the energy grid of broadening: |E_in - loss - E_center| <= half_width,
+    # i.e. a range of consecutive depths of the grid for each energy (the loss increases with depth)
+    half_width = np.maximum(4 * SD_gauss, voigt_tail * Gamma)
+    start = np.searchsorted(loss, energies - E_center - half_width, side='left')
+    stop = np.searchsorted(loss, energies - E_center + half_width, side='right')
+    counts = np.maximum(stop - start, 0)
+    indptr = np.concatenate(([0], np.cumsum(counts)))
+    rows = np.repeat(np.arange(len(energies)), counts)
+    columns = np.arange(indptr[-1]) - np.repeat(indptr[:-1] - start, counts)
+
+    from scipy.special import voigt_profile  # Slow imports (scipy), only needed by the "voigt" kernel
+    from scipy.sparse import csr_matrix
+    values = sigma_R * np.pi * Gamma / 2 * voigt_profile(energies[rows] - loss[columns] - E_R, SD_gauss[rows], Gamma / 2)
+    W = csr_matrix((values, columns, indptr), shape=(len(energies), X.size))
+
+    return centers, X, W
+
+
 if __name__ == "__main__":
     with open(r"C:\Users\louis\OneDrive - Université de Namur\Documents\Mémoire (MA2)\OwnCode\Straggling comparison\Ti33H66.json",'r') as f:
         target_input = json.load(f)
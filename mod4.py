@@ -1,110 +1,399 @@
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy.interpolate import interp1d
 import json
-from typing import Sequence, Literal
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+from typing import Sequence, Literal, Callable
 from numpy.typing import NDArray
 import os
 
-from class_models import Element, Layer, Target
+from class_models import Element, Layer, Target, CompiledTarget, compile_target
+import mod2
+import mod3
+from config import Settings, get_settings
 
 # Load settings
-script_dir = os.path.dirname(os.path.abspath(__file__))
-settings_path = os.path.join(script_dir, 'settings.json')
-with open(settings_path, 'r', encoding="utf-8") as f:
-    settings = json.load(f)
+settings = get_settings()
 
-Z2 = int(settings["reaction"]["Z2"])
+def load_settings(settings: Settings, changed: set[str] | None = None)->None:
+    """
+    Sets the constants derived from the settings (called again when they change).
+    """
+    global Z2, curve_workers
+    Z2 = int(settings["reaction"]["Z2"])
+    # Processes the energies of an excitation curve are shared between (0: one per CPU, 1: no process pool)
+    curve_workers = int(settings.get("calculation", {}).get("workers", 1))
+
+load_settings(settings)
+settings.subscribe(load_settings, ("reaction", "calculation"))
+
+_worker_target = None  # Target of the curve being calculated, sent once to each worker process
 
 # Creating the hydrogen profile from the target
-def cH_make(target: Target)-> tuple[list[float], list[float]]:
+def cH_make(target: Target | CompiledTarget)-> tuple[NDArray[np.float64], NDArray[np.float64]]:
     """
     Creates a hydrogen step profile from the current target.
     
     Parameters:
-        target (Target): Target description.
+        target (Target or CompiledTarget): Target description.
 
     Returns
     -------
-        cH_x (list of float): x values of the hydrogen step profile (TFU).
-        cH_y (list of float): y values of the hydrogen step profile (at. %).
+        cH_x (NDArray[float64]): x values of the hydrogen step profile (TFU).
+        cH_y (NDArray[float64]): y values of the hydrogen step profile (at. %).
 
     """
-    cH_x = np.zeros(len(target["layers"])+1)
-    value = 0.0
-    for i, layer in enumerate(target["layers"]):
-        value += layer["areal_density"]
-        cH_x[i+1] = value
-    cH_y = []
-    for layer in target["layers"]:
-        z1_fraction = sum(elem["percent_at"] for elem in layer["elements"] if elem["Z"] == Z2) 
-        cH_y.append(z1_fraction)
-    cH_y.insert(0, 0.0) # Inserting 0.0 at index 0
-
+    target = compile_target(target, Z2)
+    cH_x = np.concatenate(([0.0], target.thickness))
+    cH_y = np.concatenate(([0.0], target.Z2_fraction)) # 0.0 at index 0
     return cH_x, cH_y
 
 # Calculating yield
-def compute_yield(target: Target, x_conv_TFU: NDArray[np.float64], y_conv_TFU: NDArray[np.float64])-> float:
+def layer_masses(target: Target | CompiledTarget, x_conv_TFU: NDArray[np.float64], y_conv_TFU: NDArray[np.float64])-> NDArray[np.float64]:
     """
-    Calculates the gamma-yield at a given energy based on the hydrogen depth profile of the target and broadening function.
+    Integrates the broadening function over the depth range of each layer of the target.
+    The yield is linear in the hydrogen content of the layers: it is the sum of these masses weighted by the hydrogen content.
 
     Parameters:
-        target (Target) : Target description.
+        target (Target or CompiledTarget) : Target description.
         x_conv_TFU (list of float) : Thickness values corresponding to the broadening energy profile.
         y_conv_TFU (list of float) : Probability values of the broadening profile mapped to thickness.
 
     Returns:
-        integral (float) : Simulated yield (Count/µC).
+        masses (NDArray[float64]) : Broadening mass inside each layer.
     """
-    # Hydrogen concentration vector calculation from target
     cH_x, cH_y = cH_make(target)
-    cH_fct = interp1d(cH_x, cH_y, kind='next', bounds_error=False, fill_value=0)
 
-    # Broadening vector, but first defining left edges so interp1D can be used with kind next
     x_conv_TFU = np.asarray(x_conv_TFU, dtype=float)
     y_conv_TFU = np.asarray(y_conv_TFU, dtype=float)
 
     if x_conv_TFU.ndim != 1 or y_conv_TFU.ndim != 1 or x_conv_TFU.size != y_conv_TFU.size:
         raise ValueError("Broadening arrays must be one-dimensional and have the same length.")
-    #if x_conv_TFU.size < 2:
-    #    return 0.0
     if not np.all(np.isfinite(x_conv_TFU)) or not np.all(np.isfinite(y_conv_TFU)):
         n_bad_x = np.sum(~np.isfinite(x_conv_TFU))
         n_bad_y = np.sum(~np.isfinite(y_conv_TFU))
         raise ValueError(f"Broadening arrays contain non-finite values: {n_bad_x} in x, {n_bad_y} in y.")
 
-    # Ensure x values are sorted and unique for interp1d
-    #order = np.argsort(x_conv_TFU)
-    #x_conv_TFU = x_conv_TFU[order]
-    #y_conv_TFU = y_conv_TFU[order]
-    #unique_x, unique_indices = np.unique(x_conv_TFU, return_index=True)
-    #if unique_x.size != x_conv_TFU.size:
-    #    x_conv_TFU = x_conv_TFU[unique_indices]
-    #    y_conv_TFU = y_conv_TFU[unique_indices]
-    #if x_conv_TFU.size < 2:
-    #    return 0.0
-
-    edges = np.empty_like(x_conv_TFU)
-    edges[1:] = (x_conv_TFU[1:] + x_conv_TFU[:-1]) / 2
-    edges[0] = x_conv_TFU[0] - (x_conv_TFU[1] - x_conv_TFU[0]) / 2
-    broad = interp1d(edges, y_conv_TFU, kind='next', bounds_error=False, fill_value=0)
-
-    # Setting up boundaries
-    a = min(0.0, float(np.min(x_conv_TFU)))
-    b = float(np.max(x_conv_TFU))
-    if b <= a:
-        return 0.0
-
-    res = float(np.min(np.diff(np.sort(x_conv_TFU))))  # use native spacing
-    xa = np.arange(a, b + res, res)
-    f1 = cH_fct(xa)
-    f2 = broad(xa)
-    area = float(np.sum(f1 * f2) * res)
+    if x_conv_TFU.size < 2:
+        return np.zeros(len(cH_x)-1)
+
+    # Histogram of the broadening profile: one bin centred on each sample
+    order = np.argsort(x_conv_TFU, kind='stable')
+    x = x_conv_TFU[order]
+    y = y_conv_TFU[order]
+    edges = np.empty(x.size + 1)
+    edges[1:-1] = (x[1:] + x[:-1]) / 2
+    edges[0] = x[0] - (x[1] - x[0]) / 2
+    edges[-1] = x[-1] + (x[-1] - x[-2]) / 2
+
+    # Cumulative broadening mass read at the layer boundaries
+    mass = np.concatenate(([0.0], np.cumsum(y * np.diff(edges))))
+    mass_at_boundaries = np.interp(cH_x, edges, mass)
+    return np.diff(mass_at_boundaries)
+
+def compute_yield(target: Target | CompiledTarget, x_conv_TFU: NDArray[np.float64], y_conv_TFU: NDArray[np.float64])-> float:
+    """
+    Calculates the gamma-yield at a given energy based on the hydrogen depth profile of the target and broadening function.
+
+    Parameters:
+        target (Target or CompiledTarget) : Target description.
+        x_conv_TFU (list of float) : Thickness values corresponding to the broadening energy profile.
+        y_conv_TFU (list of float) : Probability values of the broadening profile mapped to thickness.
+
+    Returns:
+        integral (float) : Simulated yield (Count/µC).
+    """
+    # Hydrogen concentration vector calculation from target
+    cH_x, cH_y = cH_make(target)
+
+    # Broadening mass inside each layer, weighted by the (constant) hydrogen content of the layer
+    area = float(np.dot(cH_y[1:], layer_masses(target, x_conv_TFU, y_conv_TFU)))
     if not np.isfinite(area):
         raise ValueError("Computed yield integral is not finite.")
 
     return area
 
+def layer_masses_batch(target: Target | CompiledTarget, X: NDArray[np.float64], W: NDArray[np.float64])-> NDArray[np.float64]:
+    """
+    Integrates the broadening profiles returned by mod3.broadening_batch over the depth range of each layer of the target.
+    Each interval of the shared depth grid lies in a single layer and is integrated with the trapezoidal rule.
+
+    Parameters:
+        target (Target or CompiledTarget) : Target description.
+        X (NDArray[float64]) : Depth grid shared by all the broadening profiles (TFU).
+        W (NDArray[float64] or scipy.sparse matrix) : Broadening profiles, one row per energy and one column per depth of X.
+
+    Returns:
+        masses (NDArray[float64]) : Broadening mass inside each layer, one row per energy.
+    """
+    cH_x, cH_y = cH_make(target)
+    n_layers = len(cH_x)-1
+    X = np.asarray(X, dtype=float)
+    if not hasattr(W, "tocsr"):  # Dense profiles
+        W = np.atleast_2d(np.asarray(W, dtype=float))
+    if X.ndim != 1 or W.shape[1] != X.size:
+        raise ValueError("The weight matrix must have one column per depth of the grid.")
+    if X.size < 2:
+        return np.zeros((W.shape[0], n_layers))
+
+    # Trapezoidal weight of each depth of the grid in each layer: half of each interval it bounds,
+    # in the layer holding that interval (column n_layers beyond the target), the grid being sorted by depth
+    layer = np.searchsorted(cH_x, (X[1:] + X[:-1]) / 2, side='left') - 1
+    half = np.diff(X) / 2
+    weights = np.zeros((X.size, n_layers+1))
+    np.add.at(weights, (np.arange(X.size-1), layer), half)
+    np.add.at(weights, (np.arange(1, X.size), layer), half)
+    return np.asarray(W @ weights[:, :n_layers])
+
+def parent_masses(masses: NDArray[np.float64], parents: Sequence[int], n_layers: int)-> NDArray[np.float64]:
+    """
+    Sums the broadening masses of the slabs of a segmented target (see mod2.segment_target) into the layers they were cut from.
+
+    Parameters:
+        masses (NDArray[float64]) : Broadening mass inside each slab, one row per energy.
+        parents (list of int) : Index of the layer each slab was cut from.
+        n_layers (int) : Number of layers of the target before segmentation.
+
+    Returns:
+        masses (NDArray[float64]) : Broadening mass inside each layer, one row per energy.
+    """
+    masses = np.atleast_2d(masses)
+    R = np.zeros((masses.shape[0], n_layers))
+    for slab, parent in enumerate(parents):
+        R[:, parent] += masses[:, slab]
+    return R
+
+def compute_yield_batch(target: Target | CompiledTarget, X: NDArray[np.float64], W: NDArray[np.float64])-> NDArray[np.float64]:
+    """
+    Calculates the gamma-yield of a whole energy scan from the output of mod3.broadening_batch,
+    i.e. the broadening mass inside each layer weighted by the hydrogen content of that layer.
+
+    Parameters:
+        target (Target or CompiledTarget) : Target description.
+        X (NDArray[float64]) : Depth grid shared by all the broadening profiles (TFU).
+        W (NDArray[float64]) : Broadening profiles, one row per energy and one column per depth of X.
+
+    Returns:
+        yields (NDArray[float64]) : Simulated yield for each energy (Count/µC).
+    """
+    cH_x, cH_y = cH_make(target)
+    yields = layer_masses_batch(target, X, W) @ cH_y[1:]
+    if not np.all(np.isfinite(yields)):
+        raise ValueError("Computed yield integral is not finite.")
+    return yields
+
+def compute_k_factor(std_target: Target, std_yield: float, delta_B: float, Doppler: bool=True, straggling_model: str="Rud corr", kernel: Literal["convolve", "voigt"]="convolve", std_energy: float=6525.0, stopping: float | None = None)-> float:
+    """
+    Calculates the K factor (experimental set-up detection efficiency) from the yield measured on a standard.
+
+    Parameters:
+        std_target (Target) : Standard description, a single uniform layer. Its stopping power is set by this function.
+        std_yield (float) : Yield measured on the standard (Count/µC).
+        delta_B (float) : Beam energy broadening (keV).
+        Doppler (bool, optional) : Whether to include Doppler broadening (default True).
+        straggling_model (str, optional) : The straggling model.
+        kernel (str, optional) : Broadening kernel, see mod3.broadening.
+        std_energy (float, optional) : Energy at which the standard is measured (keV).
+        stopping (float, optional) : Stopping power of the standard, computed with mod2 if not given.
+
+    Returns:
+        K (float) : K factor of the set-up.
+    """
+    if stopping is None:
+        stopping = mod2.calc_stopping_power(std_target["layers"][0], std_energy)
+    std_target["layers"][0]["stopping"] = stopping
+    xc, x, y, layers_contribution, outOfTarget = mod3.broadening(std_energy, std_target, delta_B, Doppler, straggling_model, False, None, kernel)
+
+    value = compute_yield(std_target, x, y)
+    if not np.isfinite(value) or value == 0.0:
+        raise ValueError(f"Standard yield integral is invalid (value={value}). Check target and broadening data.")
+    return std_yield / value
+
+def _init_curve_worker(target: CompiledTarget, settings: dict)->None:
+    global _worker_target
+    get_settings().replace(settings)  # Settings of the parent process, even if they were not saved
+    _worker_target = target
+
+def _curve_chunk(energies: Sequence[float], delta_B: float, Doppler: bool, straggling_model: str, kernel: str)-> NDArray[np.float64]:
+    return layer_masses_curve(_worker_target, energies, delta_B, Doppler, straggling_model, kernel, workers=1)
+
+def curve_pool(target: Target | CompiledTarget, workers: int)-> ProcessPoolExecutor:
+    """
+    Process pool for layer_masses_curve, the compiled target and the settings being sent once to each process.
+    The pool can be used for several curves of the same target (see adaptive_layer_masses); the caller shuts it down.
+    """
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_curve_worker, initargs=(compile_target(target, Z2), dict(settings)))
+
+def layer_masses_curve(target: Target | CompiledTarget, energies: Sequence[float], delta_B: float, Doppler: bool=True, straggling_model: str="Rud corr", kernel: Literal["convolve", "voigt"]="convolve", workers: int | None = None, progress: Callable[[int, int], None] | None = None, partial: Callable[[NDArray[np.float64], NDArray[np.float64]], None] | None = None, pool: ProcessPoolExecutor | None = None)-> NDArray[np.float64]:
+    """
+    Calculates the broadening mass inside each layer of a target whose stopping powers are already assigned, for every energy of a curve.
+    The yield is K * masses @ cH (see compute_yield).
+
+    The energies are independent of each other: with several workers they are split in contiguous chunks calculated on a process pool,
+    the target being sent once to each process. The rows keep the order of the energies. If the pool cannot be used,
+    the energies it did not calculate are calculated in this process.
+
+    Parameters:
+        target (Target or CompiledTarget) : Target description.
+        energies (list of float) : Incident beam energies (keV).
+        delta_B (float) : Beam energy broadening (keV).
+        Doppler (bool, optional) : Whether to include Doppler broadening (default True).
+        straggling_model (str, optional) : The straggling model.
+        kernel (str, optional) : Broadening kernel, see mod3.broadening. "voigt" uses mod3.broadening_batch.
+        workers (int, optional) : Number of processes (default: "workers" of the "calculation" settings, 0 for one per CPU).
+        progress (callable, optional) : Called with the number of energies done and the number of energies, after each energy
+            (after each chunk on a process pool). It may raise (e.g. class_models.CalculationCancelled) to stop the calculation.
+        partial (callable, optional) : Called with the energies just calculated and their masses, as they complete
+            (e.g. to plot the curve while it is calculated). Each energy is passed once.
+        pool (ProcessPoolExecutor, optional) : Pool created by curve_pool for this target, used instead of a new one.
+
+    Returns:
+        masses (NDArray[float64]) : Broadening mass inside each layer, one row per energy.
+    """
+    compiled = compile_target(target, Z2)
+    energies = np.asarray(list(energies), dtype=float)
+    workers = curve_workers if workers is None else workers
+    workers = min((os.cpu_count() or 1) if workers <= 0 else workers, len(energies))
+    masses = np.zeros((len(energies), compiled.n_layers))
+    done = np.zeros(len(energies), dtype=bool)
+
+    if workers > 1:
+        chunks = [chunk for chunk in np.array_split(np.arange(len(energies)), 4*workers) if chunk.size]  # A few chunks per worker to balance the load
+        try:
+            executor = pool or curve_pool(compiled, workers)
+            try:
+                parts = executor.map(_curve_chunk, [energies[chunk] for chunk in chunks], repeat(delta_B), repeat(Doppler), repeat(straggling_model), repeat(kernel))
+                for chunk, part in zip(chunks, parts):
+                    masses[chunk] = part
+                    done[chunk] = True
+                    if partial is not None:
+                        partial(energies[chunk], part)
+                    if progress is not None:
+                        progress(int(done.sum()), len(energies))
+            finally:
+                if pool is None:
+                    executor.shutdown(wait=False, cancel_futures=True)  # Chunks not started yet are dropped if the calculation was stopped
+            return masses
+        except (BrokenProcessPool, OSError) as e:
+            print(f"Process pool unavailable ({type(e).__name__}: {e}), calculating the {np.count_nonzero(~done)} remaining energies in a single process.")
+
+    # Energies not calculated by the pool (all of them without a pool)
+    todo = np.flatnonzero(~done)
+    if kernel == "voigt":
+        centers, X, W = mod3.broadening_batch(energies[todo], compiled, delta_B, Doppler, straggling_model)
+        masses[todo] = layer_masses_batch(compiled, X, W)
+        if partial is not None:
+            partial(energies[todo], masses[todo])
+        if progress is not None:
+            progress(len(energies), len(energies))
+        return masses
+    for count, i in enumerate(todo, start=len(energies) - todo.size + 1):
+        masses[i] = layer_masses(compiled, *mod3.broadening(energies[i], compiled, delta_B, Doppler, straggling_model, kernel=kernel)[1:3])
+        if partial is not None:
+            partial(energies[i:i+1], masses[i:i+1])
+        if progress is not None:
+            progress(count, len(energies))
+    return masses
+
+def adaptive_layer_masses(target: Target | CompiledTarget, e_min: float, e_max: float, delta_B: float, Doppler: bool=True, straggling_model: str="Rud corr", kernel: Literal["convolve", "voigt"]="convolve", tolerance: float=0.002, max_points: int=150, initial_points: int | None = None, workers: int | None = None, progress: Callable[[int, int], None] | None = None, partial: Callable[[NDArray[np.float64], NDArray[np.float64]], None] | None = None)-> tuple[NDArray[np.float64], NDArray[np.float64]]:
+    """
+    Chooses the energies of a simulated excitation curve: the curve is first calculated on a coarse uniform grid, then the intervals
+    where a linear interpolation of the yield is not accurate enough (strong curvature, e.g. at the surface edge or at a layer interface)
+    are split in two, until the estimated interpolation error is below ``tolerance`` everywhere or ``max_points`` energies are used.
+    Flat parts of the curve thus keep a coarse sampling.
+
+    The interpolation error in an interval of width h is estimated as |f''| h^2/8, the second derivative being the divided difference
+    of the interval with its left or right neighbour (the largest of the two). Features narrower than the initial spacing may be missed.
+
+    Parameters:
+        target (Target or CompiledTarget) : Target description.
+        e_min, e_max (float) : Energy range of the curve (keV).
+        delta_B (float) : Beam energy broadening (keV).
+        Doppler (bool, optional) : Whether to include Doppler broadening (default True).
+        straggling_model (str, optional) : The straggling model.
+        kernel (str, optional) : Broadening kernel, see mod3.broadening.
+        tolerance (float, optional) : Interpolation error allowed, relative to the maximum of the curve (default 0.2 %).
+        max_points (int, optional) : Maximum number of energies (default 150).
+        initial_points (int, optional) : Number of energies of the coarse grid (default max_points/4, at least 9).
+        workers (int, optional) : Number of processes, see layer_masses_curve. A single process pool is used for all the refinements.
+        progress (callable, optional) : Called with the number of energies calculated and max_points as the energies complete. May raise to stop.
+        partial (callable, optional) : See layer_masses_curve. The energies come in the order they are calculated, not sorted.
+
+    Returns:
+        energies (NDArray[float64]) : Chosen energies, sorted (keV).
+        masses (NDArray[float64]) : Broadening mass inside each layer, one row per energy (see layer_masses_curve).
+    """
+    compiled = compile_target(target, Z2)
+    max_points = max(int(max_points), 2)
+    initial_points = min(max(9, max_points//4) if initial_points is None else max(int(initial_points), 2), max_points)
+    min_step = (e_max - e_min)/2**12  # Intervals are not split below this width
+
+    workers = curve_workers if workers is None else workers
+    workers = min((os.cpu_count() or 1) if workers <= 0 else workers, max_points)
+
+    energies = np.zeros(0)
+    masses = np.zeros((0, compiled.n_layers))
+    new = np.linspace(e_min, e_max, initial_points)
+    pool = None
+    try:
+        if workers > 1:
+            try:
+                pool = curve_pool(compiled, workers)  # Shared by all the refinements
+            except OSError as e:
+                print(f"Process pool unavailable ({type(e).__name__}: {e}), calculating the curve in a single process.")
+        while new.size:
+            # Progress over all the refinements, so that the calculation can be stopped within a refinement
+            done = energies.size
+            round_progress = None if progress is None else lambda count, total: progress(done + count, max_points)
+            rows = layer_masses_curve(compiled, new, delta_B, Doppler, straggling_model, kernel, workers if pool is not None else 1,
+                                      progress=round_progress, partial=partial, pool=pool)
+            energies = np.concatenate((energies, new))
+            masses = np.vstack((masses, rows))
+            order = np.argsort(energies)
+            energies, masses = energies[order], masses[order]
+            budget = max_points - energies.size
+            if budget <= 0 or energies.size < 3:
+                break
+
+            # Interpolation error of each interval from the second divided differences at its two ends
+            y = masses @ compiled.Z2_fraction
+            h = np.diff(energies)
+            slopes = np.diff(y)/h
+            d2 = np.zeros(energies.size)
+            d2[1:-1] = np.abs(np.diff(slopes))/(energies[2:] - energies[:-2])*2  # f'' at the inner energies
+            error = np.maximum(d2[:-1], d2[1:])*h**2/8
+            scale = max(np.max(np.abs(y)), np.finfo(float).tiny)
+            split = np.flatnonzero((error > tolerance*scale) & (h > 2*min_step))
+            split = split[np.argsort(-error[split])][:budget]  # Largest errors first if the budget is short
+            new = (energies[split] + energies[split+1])/2
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+    return energies, masses
+
+def simulate_curve(target: Target | CompiledTarget, energies: Sequence[float], K: float, delta_B: float, Doppler: bool=True, straggling_model: str="Rud corr", kernel: Literal["convolve", "voigt"]="convolve", workers: int | None = None)-> NDArray[np.float64]:
+    """
+    Calculates the excitation curve of a target whose stopping powers are already assigned (see mod2.assign_stopping).
+
+    Parameters:
+        target (Target or CompiledTarget) : Target description.
+        energies (list of float) : Incident beam energies (keV).
+        K (float) : K factor of the set-up (see compute_k_factor).
+        delta_B (float) : Beam energy broadening (keV).
+        Doppler (bool, optional) : Whether to include Doppler broadening (default True).
+        straggling_model (str, optional) : The straggling model.
+        kernel (str, optional) : Broadening kernel, see mod3.broadening. "voigt" computes the whole scan with mod3.broadening_batch.
+        workers (int, optional) : Number of processes, see layer_masses_curve.
+
+    Returns:
+        yields (NDArray[float64]) : Simulated yield for each energy (Count/µC).
+    """
+    compiled = compile_target(target, Z2)
+    yields = K*(layer_masses_curve(compiled, energies, delta_B, Doppler, straggling_model, kernel, workers) @ compiled.Z2_fraction)
+    if not np.all(np.isfinite(yields)):
+        raise ValueError("Computed yield integral is not finite.")
+    return yields
+
 def chi_squared_test(x_exp: list[float], y_exp: list[float], x_sim: list[float], y_sim: list[float]) -> float:
     """
     Chi-squared test between the experimental and simulated excitation curves.
@@ -153,6 +442,9 @@ def chi_squared_test(x_exp: list[float], y_exp: list[float], x_sim: list[float],
 
 
 if __name__ == "__main__":
+    import matplotlib.pyplot as plt
+    from scipy.interpolate import interp1d
+
     with open(r"D:\loudupon\OneDrive - Université de Namur\Documents\Mémoire (MA2)\Code\FRIA target 2.json",'r') as f:
         target_input = json.load(f)
         print('Loaded')
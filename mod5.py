@@ -0,0 +1,175 @@
+import numpy as np
+import copy
+import time
+from typing import Sequence, Literal, Callable
+from numpy.typing import NDArray
+
+from class_models import Element, Layer, Target
+import mod2
+import mod4
+from config import Settings, get_settings
+
+# Load settings
+settings = get_settings()
+
+def load_settings(settings: Settings, changed: set[str] | None = None)->None:
+    """
+    Sets the constants derived from the settings (called again when they change).
+    """
+    global Z2
+    Z2 = int(settings["reaction"]["Z2"])
+
+load_settings(settings)
+settings.subscribe(load_settings, ("reaction",))
+
+# Self-consistency of the Z2 contents and the stopping powers of a fit (see fit_profile)
+composition_tolerance = 1e-6  # at. %, largest change of the Z2 contents between two iterations once converged (well below the noise the optimiser tolerates)
+composition_iterations = 3  # Per thickness vector tried by the optimiser, starting from the contents of the best one so far
+final_composition_iterations = 30  # For the fitted thicknesses
+
+def response_matrix(target: Target, energies: Sequence[float], delta_B: float, Doppler: bool=True, straggling_model: str="Rud corr", kernel: Literal["convolve", "voigt"]="convolve", segmentation: tuple[Target, list[int]] | None = None)-> NDArray[np.float64]:
+    """
+    Calculates the response of each layer of the target to each incident energy: the broadening mass inside the layer,
+    summed over the slabs the layer is cut into by mod2.segment_target.
+    For fixed broadening profiles the yield is linear in the hydrogen content of the layers, i.e. yield = K * R @ cH.
+
+    Parameters:
+        target (Target) : Target description.
+        energies (list of float) : Incident beam energies (keV).
+        delta_B (float) : Beam energy broadening (keV).
+        Doppler (bool, optional) : Whether to include Doppler broadening (default True).
+        straggling_model (str, optional) : The straggling model.
+        kernel (str, optional) : Broadening kernel, see mod3.broadening. "voigt" uses mod3.broadening_batch.
+        The energies are shared between the processes set in the settings (see mod4.layer_masses_curve).
+        segmentation (tuple, optional) : Slabs and parent indices of ``target`` already computed (see mod2.segment_target).
+
+    Returns:
+        R (NDArray[float64]) : Response matrix, one row per energy and one column per layer of the target (Count/µC per at. % and per unit of K).
+    """
+    segmented, parents = mod2.segment_target(target, max(energies)) if segmentation is None else segmentation
+    masses = mod4.layer_masses_curve(segmented, energies, delta_B, Doppler, straggling_model, kernel)
+    return mod4.parent_masses(masses, parents, len(target["layers"]))
+
+def matrix_ratios(layer: Layer)-> dict[int, float]:
+    """
+    Returns the relative proportions of the elements other than Z2 in a layer (element index -> fraction of the non-Z2 part).
+    """
+    others = {i: element["percent_at"] for i, element in enumerate(layer["elements"]) if element["Z"] != Z2}
+    total = sum(others.values())
+    return {i: value/total for i, value in others.items()} if total > 0 else {}
+
+def set_Z2_fraction(layer: Layer, percent_at: float, ratios: dict[int, float])-> None:
+    """
+    Sets the atomic percentage of Z2 in a layer, the other elements sharing the rest according to ``ratios`` (see matrix_ratios).
+    Unlike Layer.lock_and_normalize, the matrix is restored even if Z2 was at 100 at. % before.
+    """
+    for i, element in enumerate(layer["elements"]):
+        if element["Z"] == Z2:
+            element["percent_at"] = percent_at
+        elif i in ratios:
+            element["percent_at"] = ratios[i]*(100.0 - percent_at)
+
+def fit_profile(target: Target, energies: Sequence[float], yields: Sequence[float], errors: Sequence[float] | None, K: float, delta_B: float, Doppler: bool=True, straggling_model: str="Rud corr", kernel: Literal["convolve", "voigt"]="convolve", offset: float=0.0, fit_thickness: bool=True, max_iterations: int=200, callback: Callable[[int, float], None] | None = None)-> tuple[Target, dict]:
+    """
+    Fits the Z2 content and the areal density of the layers of the target to an experimental excitation curve,
+    minimising the chi-squared weighted by the yield errors.
+
+    The yield being linear in the Z2 content of the layers, the concentrations are solved exactly for given thicknesses by
+    bounded linear least squares (0 to 100 at. %) on the response matrix (see response_matrix). Only the areal densities go through
+    a nonlinear optimisation (Nelder-Mead on their logarithm). Layers without Z2 keep no Z2, layers made of Z2 only are not fitted.
+    The stopping powers depending on the compositions, for given thicknesses the concentrations are solved again with the stopping powers
+    of the concentrations just found, until they no longer change: the chi-squared is then a function of the areal densities only.
+    Each thickness vector tried by the optimiser starts from the concentrations of the best one so far (a start far from the solution
+    can converge to a spurious solution without Z2) and only solves them ``composition_iterations`` times; the slabs of its first segmentation
+    are kept, only their stopping powers being updated (see mod2.update_slab_stopping). The fitted thicknesses are then iterated,
+    segmenting the target again each time, until the concentrations no longer change.
+
+    Parameters:
+        target (Target) : Initial target description (not modified).
+        energies (list of float) : Energies of the experimental excitation curve (keV).
+        yields (list of float) : Yield of the experimental excitation curve (Count/µC).
+        errors (list of float or None) : Yield errors. Points without a positive error have a unit weight.
+        K (float) : K factor of the set-up (see GUI_App.std_calc).
+        delta_B (float) : Beam energy broadening (keV).
+        Doppler (bool, optional) : Whether to include Doppler broadening (default True).
+        straggling_model (str, optional) : The straggling model.
+        kernel (str, optional) : Broadening kernel, see mod3.broadening.
+        offset (float, optional) : Energy offset between the simulated and experimental curves (keV).
+        fit_thickness (bool, optional) : Fits the areal densities if True, only the Z2 content otherwise (default True).
+        max_iterations (int, optional) : Maximum number of iterations of the thickness optimisation.
+        callback (callable, optional) : Called with the evaluation number and the chi-squared after each evaluation.
+
+    Returns
+    -------
+        fitted_target (Target) : Target with the fitted areal densities and Z2 contents.
+        report (dict) : chi-squared, iterations, evaluations (thickness vectors tried), response matrices computed, wall time and optimiser status.
+    """
+    from scipy.optimize import lsq_linear, minimize  # Slow import, only needed when fitting
+
+    start = time.perf_counter()
+    energies = np.asarray(energies, dtype=float) - offset  # Energies at which the simulated curve matches the experimental one
+    yields = np.asarray(yields, dtype=float)
+    errors = np.zeros(len(yields)) if errors is None else np.asarray(errors, dtype=float)
+    weights = np.where(errors > 0, 1/np.where(errors > 0, errors, 1.0), 1.0)
+
+    fitted = copy.deepcopy(target)
+    ratios = [matrix_ratios(layer) for layer in fitted["layers"]]
+    cH_fixed = np.array([layer.find_element(Z=Z2) or 0.0 for layer in fitted["layers"]])
+    free = np.array([layer.find_element(Z=Z2) is not None and len(r) > 0 for layer, r in zip(fitted["layers"], ratios)])
+    if not np.any(free):
+        raise ValueError("No layer of the target contains the element of interest mixed with other elements.")
+    log_AD0 = np.log([layer["areal_density"] for layer in fitted["layers"]])
+    evaluations = 0
+    matrices = 0
+    best_chi2, cH_best = np.inf, cH_fixed[free].copy()
+
+    def solve(log_AD: NDArray[np.float64], iterations: int, final: bool = False)-> tuple[float, NDArray[np.float64]]:
+        nonlocal evaluations, matrices, best_chi2, cH_best
+        for layer, AD in zip(fitted["layers"], np.exp(log_AD)):
+            layer["areal_density"] = float(AD)
+        cH = cH_best.copy()
+        for i, value in zip(np.flatnonzero(free), cH):
+            set_Z2_fraction(fitted["layers"][i], float(value), ratios[i])
+        slabs, parents = mod2.segment_target(fitted, max(energies))
+        for iteration in range(iterations):
+            if iteration > 0:
+                # The next response matrix uses the stopping powers of the new compositions: same slabs during the optimisation
+                slabs, parents = mod2.segment_target(fitted, max(energies)) if final else mod2.update_slab_stopping(fitted, slabs, parents, max(energies))
+            R = K*response_matrix(fitted, energies, delta_B, Doppler, straggling_model, kernel, (slabs, parents))
+            matrices += 1
+            residual = yields - R[:, ~free] @ cH_fixed[~free]  # Part of the yield from the layers that are not fitted
+            result = lsq_linear(R[:, free]*weights[:, None], residual*weights, bounds=(0.0, 100.0), method='bvls')
+            change = float(np.max(np.abs(result.x - cH)))
+            cH = result.x
+            for i, value in zip(np.flatnonzero(free), cH):
+                set_Z2_fraction(fitted["layers"][i], float(value), ratios[i])
+            if change < composition_tolerance:
+                break
+        chi2 = float(np.sum(((R[:, free] @ cH - residual)*weights)**2))
+        if chi2 < best_chi2:
+            best_chi2, cH_best = chi2, cH
+        evaluations += 1
+        if callback is not None:
+            callback(evaluations, chi2)
+        return chi2, cH
+
+    if fit_thickness:
+        result = minimize(lambda log_AD: solve(log_AD, composition_iterations)[0], log_AD0, method='Nelder-Mead',
+                          options={"maxiter": max_iterations, "xatol": 1e-3, "fatol": 1e-6})
+        log_AD, iterations, success, message = result.x, int(result.nit), bool(result.success), str(result.message)
+    else:
+        log_AD, iterations, success, message = log_AD0, 0, True, "Areal densities fixed"
+    chi2, cH = solve(log_AD, final_composition_iterations, final=True)  # Final state of the target
+
+    report = {
+        "chi2": chi2,
+        "reduced_chi2": chi2/max(1, len(yields) - int(np.sum(free)) - (len(log_AD) if fit_thickness else 0)),
+        "iterations": iterations,
+        "evaluations": evaluations,
+        "response_matrices": matrices,
+        "wall_time": time.perf_counter() - start,
+        "success": success,
+        "message": message,
+    }
+    print(f"Autofit: chi2 = {report['chi2']:.4g} after {iterations} iterations, {evaluations} evaluations, {report['wall_time']:.2f} s ({message})")
+    return fitted, report
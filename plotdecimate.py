@@ -0,0 +1,188 @@
+"""
+View-dependent decimation of large curves for the matplotlib plots (main window and broadplotter).
+
+Only the points that change the drawing are drawn: for a line, the first, last, lowest and highest points of each pixel column of the axes;
+for markers, one point per pixel; for error bars, one bar per group of overlapping bars of a pixel column.
+The points are chosen again each time the range of the axes changes (zoom, pan or home of the navigation toolbar).
+The artists keep the full data (see full_data).
+"""
+import numpy as np
+from numpy.typing import NDArray
+from matplotlib.lines import Line2D
+from matplotlib.collections import LineCollection
+
+POINTS_PER_COLUMN = 4
+
+def visible_range(x: NDArray[np.float64], x_min: float, x_max: float)-> tuple[int, int]:
+    """
+    Index range of the sorted values x between x_min and x_max, plus the closest value on each side so that a line reaches the edges of the axes.
+    """
+    first = max(int(np.searchsorted(x, x_min, 'left')) - 1, 0)
+    last = min(int(np.searchsorted(x, x_max, 'right')) + 1, len(x))
+    return first, last
+
+def pixel_columns(x: NDArray[np.float64], x_min: float, x_max: float, columns: int)-> NDArray[np.int64]:
+    """
+    Pixel column of each value x, for a range x_min - x_max drawn on ``columns`` pixels (-1 and ``columns`` out of the range).
+    """
+    return np.clip(((x - x_min)/(x_max - x_min)*columns).astype(np.int64), -1, columns)
+
+def minmax_indices(x: NDArray[np.float64], y: NDArray[np.float64], x_min: float, x_max: float, columns: int)-> NDArray[np.int64]:
+    """
+    Indices of the points of a line to draw between x_min and x_max on a width of ``columns`` pixels:
+    first, last, lowest and highest point of each pixel column.
+
+    Parameters:
+        x (NDArray) : Sorted x values.
+        y (NDArray) : y values.
+        x_min, x_max (float) : Visible x range.
+        columns (int) : Width of the axes (pixels).
+    Returns:
+        indices (NDArray[int]) : Sorted indices of the points to draw.
+    """
+    first, last = visible_range(x, x_min, x_max)
+    if last - first <= POINTS_PER_COLUMN*columns or not x_max > x_min:
+        return np.arange(first, last)
+    column = pixel_columns(x[first:last], x_min, x_max, columns)
+    starts = np.flatnonzero(np.r_[True, column[1:] != column[:-1]])
+    ends = np.r_[starts[1:], len(column)] - 1
+    # Sorted by column then by value: the first point of each column in this order is its lowest/highest point
+    lowest = np.lexsort((y[first:last], column))[starts]
+    highest = np.lexsort((-y[first:last], column))[starts]
+    return np.unique(np.concatenate((starts, ends, lowest, highest))) + first
+
+def pixel_indices(ax, x: NDArray[np.float64], y: NDArray[np.float64], first: int, last: int)-> NDArray[np.int64]:
+    """
+    Indices of the markers to draw among the points first to last: one point per pixel of the axes.
+    """
+    pixels = np.floor(ax.transData.transform(np.column_stack((x[first:last], y[first:last]))))
+    pixels = np.nan_to_num(pixels, nan=-1.0, posinf=-1.0, neginf=-1.0)
+    indices = np.unique(pixels, axis=0, return_index=True)[1]
+    return np.sort(indices) + first
+
+def merged_intervals(x: NDArray[np.float64], low: NDArray[np.float64], high: NDArray[np.float64],
+                     x_min: float, x_max: float, y_min: float, y_max: float, columns: int)-> tuple[NDArray[np.float64], NDArray[np.float64], NDArray[np.float64]]:
+    """
+    Error bars to draw between x_min and x_max on a width of ``columns`` pixels: the overlapping bars (low - high) of each pixel column are merged into one.
+
+    Returns:
+        x, low, high (NDArray) : Merged bars.
+    """
+    first, last = visible_range(x, x_min, x_max)
+    x, low, high = x[first:last], low[first:last], high[first:last]
+    if last - first <= POINTS_PER_COLUMN*columns or not x_max > x_min:
+        return x, low, high
+    column = pixel_columns(x, x_min, x_max, columns)
+    # Bars clipped to the y range (with a margin), and shifted by column so that bars of different columns never overlap
+    margin = (y_max - y_min) or 1.0
+    low = np.clip(low, y_min - margin, y_max + margin)
+    high = np.clip(high, y_min - margin, y_max + margin)
+    shift = (column + 1)*4*margin
+    order = np.lexsort((low, column))
+    low, high, shift = low[order] + shift[order], high[order] + shift[order], shift[order]
+    reach = np.maximum.accumulate(high)
+    starts = np.flatnonzero(np.r_[True, low[1:] > reach[:-1]])
+    ends = np.r_[starts[1:], len(low)] - 1
+    return x[order][starts], low[starts] - shift[starts], reach[ends] - shift[ends]
+
+class DecimatedLine(Line2D):
+    """
+    Line drawing a decimated version of its data (see minmax_indices), updated when the x range of its axes changes.
+    Created with ``plot``. ``set_data`` sets the full data.
+    """
+    def __init__(self, x, y, **kwargs)->None:
+        self._full = (np.empty(0), np.empty(0))
+        super().__init__([], [], **kwargs)
+        self.set_data(x, y)
+
+    def set_data(self, *args)->None:
+        x, y = args if len(args) == 2 else args[0]
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        order = np.argsort(x, kind='stable')
+        self._full = (x[order], y[order])
+        self.update_view()
+
+    def full_data(self)-> tuple[NDArray[np.float64], NDArray[np.float64]]:
+        """
+        Returns the full (not decimated) x and y values.
+        """
+        return self._full
+
+    def update_view(self, ax=None)->None:
+        """
+        Chooses the points to draw for the current range of the axes.
+        """
+        x, y = self._full
+        if self.axes is None:
+            super().set_data(x, y)
+            return
+        x_min, x_max = sorted(self.axes.get_xlim())
+        columns = max(int(self.axes.bbox.width), 1)
+        indices = minmax_indices(x, y, x_min, x_max, columns) if self.get_linestyle() != 'None' else np.empty(0, dtype=np.int64)
+        if self.get_marker() not in ('None', None, '', ' '):
+            first, last = visible_range(x, x_min, x_max)
+            if last - first > POINTS_PER_COLUMN*columns:
+                indices = np.union1d(indices, pixel_indices(self.axes, x, y, first, last))
+            else:
+                indices = np.arange(first, last)
+        super().set_data(x[indices], y[indices])
+
+class DecimatedErrorbars(LineCollection):
+    """
+    Vertical error bars drawing a decimated version of their data, updated when the x range of their axes changes.
+    Created with ``errorbar``. ``set_data`` sets the full data.
+    """
+    def __init__(self, x, y, yerr, **kwargs)->None:
+        self._full = (np.empty(0), np.empty(0), np.empty(0))
+        super().__init__([], **kwargs)
+        self.set_data(x, y, yerr)
+
+    def set_data(self, x, y, yerr)->None:
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        yerr = np.broadcast_to(np.asarray(yerr, dtype=float), x.shape)
+        order = np.argsort(x, kind='stable')
+        self._full = (x[order], y[order], yerr[order])
+        self.update_view()
+
+    def full_data(self)-> tuple[NDArray[np.float64], NDArray[np.float64], NDArray[np.float64]]:
+        """
+        Returns the full (not decimated) x, y and error values.
+        """
+        return self._full
+
+    def update_view(self, ax=None)->None:
+        """
+        Chooses the error bars to draw for the current x range of the axes.
+        """
+        x, y, yerr = self._full
+        low, high = y - yerr, y + yerr
+        if self.axes is not None:
+            x_min, x_max = sorted(self.axes.get_xlim())
+            y_min, y_max = sorted(self.axes.get_ylim())
+            x, low, high = merged_intervals(x, low, high, x_min, x_max, y_min, y_max, max(int(self.axes.bbox.width), 1))
+        self.set_segments(np.stack((np.column_stack((x, low)), np.column_stack((x, high))), axis=1))
+
+def plot(ax, x, y, **kwargs)-> DecimatedLine:
+    """
+    Same as ``ax.plot(x, y, **kwargs)`` for a single curve, drawn decimated.
+    """
+    line = DecimatedLine(x, y, **kwargs)
+    ax.add_line(line)
+    ax.callbacks.connect('xlim_changed', line.update_view)
+    ax.callbacks.connect('ylim_changed', line.update_view)
+    ax.autoscale_view()
+    line.update_view()
+    return line
+
+def errorbar(ax, x, y, yerr, color=None, **kwargs)-> DecimatedErrorbars:
+    """
+    Same as ``ax.errorbar(x, y, yerr, fmt='none', color=color)`` (vertical error bars only), drawn decimated.
+    """
+    bars = DecimatedErrorbars(x, y, yerr, colors=color, **kwargs)
+    ax.add_collection(bars)
+    ax.callbacks.connect('xlim_changed', bars.update_view)
+    ax.callbacks.connect('ylim_changed', bars.update_view)
+    bars.update_view()
+    return bars
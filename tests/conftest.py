@@ -0,0 +1,9 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import get_settings
+
+# Built-in stopping engine: the tests run without SRIM (not saved to settings.json)
+get_settings().apply({"stopping": {"backend": "analytic", "cache": False}}, save=False)
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from class_models import Layer, Target
+import mod3
+import mod4
+
+def make_target()-> Target:
+    target = Target()
+    target["layers"] = [
+        Layer(data={"areal_density": 0.5, "stopping": 0.1, "elements": [{"Z": 14, "percent_at": 100.0}]}),
+        Layer(data={"areal_density": 800.0, "stopping": 0.12, "elements": [{"Z": 1, "percent_at": 40.0}, {"Z": 22, "percent_at": 60.0}]}),
+        Layer(data={"areal_density": 8000.0, "stopping": 0.08, "elements": [{"Z": 22, "percent_at": 100.0}]}),
+    ]
+    return target
+
+def test_broadening_batch_centers_and_support():
+    """
+    Resonance depths as find_total_thickness (in front of, inside and behind the target), and profiles stored on the
+    truncation window only: the dense profiles restricted to that window are the same.
+    """
+    target = make_target()
+    E_loss = list(mod3.loss_axis(target))
+    energies = np.concatenate((np.linspace(mod3.E_R - 30.0, mod3.E_R + E_loss[-1] + 30.0, 200), mod3.E_R + np.array(E_loss)))
+    centers, X, W = mod3.broadening_batch(energies, target, 1.0, True, "Rud corr")
+
+    expected = [mod3.find_total_thickness(E, E_loss, mod3.find_layer_index(E, E_loss), target) for E in energies]
+    np.testing.assert_allclose(centers, expected, rtol=1e-12, atol=1e-9)
+
+    dense = W.toarray()
+    assert W.nnz < dense.size/2
+    for row in dense:
+        support = np.flatnonzero(row)
+        assert support.size == 0 or support[-1] - support[0] + 1 == support.size  # Consecutive depths
+    np.testing.assert_allclose(mod4.layer_masses_batch(target, X, W), mod4.layer_masses_batch(target, X, dense), rtol=1e-12, atol=1e-15)
+
+def test_broadening_batch_rejects_zero_stopping():
+    """
+    A layer without stopping power would give a depth grid that does not increase: the layer is named in the error.
+    """
+    target = make_target()
+    target["layers"][1]["stopping"] = 0.0
+    with pytest.raises(ValueError, match="layer 1 "):
+        mod3.broadening_batch([mod3.E_R + 50.0], target, 1.0, True, "Rud corr")
@@ -0,0 +1,86 @@
+import contextlib
+import io
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pytest
+
+from class_models import CalculationCancelled, Layer, Target
+import mod2
+import mod4
+
+def make_target()-> Target:
+    target = Target()
+    target["layers"] = [
+        Layer(data={"areal_density": 500.0, "elements": [{"Z": 1, "percent_at": 20.0}, {"Z": 14, "percent_at": 80.0}]}),
+        Layer(data={"areal_density": 1500.0, "elements": [{"Z": 22, "percent_at": 100.0}]}),
+    ]
+    with contextlib.redirect_stdout(io.StringIO()):
+        return mod2.assign_stopping(target, 7000.0)
+
+class BreakingPool:
+    """
+    Process pool calculating its first chunks in this process, then broken.
+    """
+    chunks_before_break = 3
+
+    def __init__(self, max_workers, initializer, initargs)->None:
+        self.target = initargs[0]
+
+    def map(self, function, chunks, *args):
+        for i, chunk in enumerate(chunks):
+            if i == self.chunks_before_break:
+                raise BrokenProcessPool("A worker process terminated abruptly.")
+            yield mod4.layer_masses_curve(self.target, chunk, 1.0, True, "Rud corr", "convolve", workers=1)
+
+    def shutdown(self, wait=True, cancel_futures=False)->None:
+        pass
+
+def test_broken_pool_calculates_only_the_missing_energies(monkeypatch):
+    target = make_target()
+    energies = np.linspace(6400, 6900, 40)
+    expected = mod4.layer_masses_curve(target, energies, 1.0, True, "Rud corr", "convolve", workers=1)
+
+    monkeypatch.setattr(mod4, "ProcessPoolExecutor", BreakingPool)
+    streamed, progress = [], []
+    with contextlib.redirect_stdout(io.StringIO()):
+        masses = mod4.layer_masses_curve(target, energies, 1.0, True, "Rud corr", "convolve", workers=2,
+                                         progress=lambda done, total: progress.append(done),
+                                         partial=lambda E, rows: streamed.extend(E))
+
+    np.testing.assert_allclose(masses, expected, rtol=1e-12)
+    assert sorted(streamed) == list(energies)  # Each energy streamed once
+    assert progress == sorted(progress) and progress[-1] == len(energies)
+
+class SerialPool(BreakingPool):
+    """
+    Process pool calculating its chunks in this process, counting the pools created.
+    """
+    chunks_before_break = None
+    created = 0
+
+    def __init__(self, max_workers, initializer, initargs)->None:
+        super().__init__(max_workers, initializer, initargs)
+        SerialPool.created += 1
+
+def test_adaptive_sampling_uses_one_pool(monkeypatch):
+    target = make_target()
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = mod4.adaptive_layer_masses(target, 6400, 6900, 1.0, True, "Rud corr", "convolve", max_points=40, workers=1)
+        monkeypatch.setattr(mod4, "ProcessPoolExecutor", SerialPool)
+        energies, masses = mod4.adaptive_layer_masses(target, 6400, 6900, 1.0, True, "Rud corr", "convolve", max_points=40, workers=2)
+
+    assert SerialPool.created == 1
+    np.testing.assert_allclose(energies, expected[0])
+    np.testing.assert_allclose(masses, expected[1], rtol=1e-12)
+
+def test_adaptive_sampling_stops_within_a_refinement():
+    seen = []
+    def progress(done: int, total: int)->None:
+        seen.append(done)
+        if done == 5:
+            raise CalculationCancelled()
+
+    with contextlib.redirect_stdout(io.StringIO()), pytest.raises(CalculationCancelled):
+        mod4.adaptive_layer_masses(make_target(), 6400, 6900, 1.0, True, "Rud corr", "convolve", max_points=40, initial_points=10, workers=1, progress=progress)
+    assert seen == [1, 2, 3, 4, 5]
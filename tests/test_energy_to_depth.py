@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from class_models import Layer, Target
+import mod3
+
+def reference_depths(x_conv, E_in: float, E_loss, index: int, center: float, target: Target)-> np.ndarray:
+    """
+    Per-sample loop that energy_to_depth replaced (mod3.broadening before vectorisation).
+    """
+    layers = target["layers"]
+    deltaE_in = E_in - mod3.E_R
+    x_conv_TFU = np.zeros(len(x_conv))
+    for l, eVal in enumerate(x_conv):
+        deltaE = mod3.E_R - eVal
+        Eloss_value = deltaE_in - deltaE
+        new_index = mod3.find_layer_index(E_in - deltaE, E_loss)
+        if new_index == -2:
+            x_value = Eloss_value/layers[0]["stopping"]
+        elif new_index == -1:
+            x_value = sum(layer["areal_density"] for layer in layers) + (Eloss_value-max(E_loss))/layers[0]["stopping"]
+        elif new_index != index and index > -1:
+            low_index = min(index, new_index)
+            high_index = max(index, new_index)
+            low_loss = min(deltaE_in, Eloss_value)
+            high_loss = max(deltaE_in, Eloss_value)
+            fullLayerThicknesses = sum(layers[i]["areal_density"] for i in range(low_index + 1, high_index)) if abs(new_index-index) >= 2 else 0.0
+            x_value = center + np.sign(new_index - index) * (fullLayerThicknesses + abs(low_loss-E_loss[low_index])/layers[low_index]["stopping"] + abs(high_loss-E_loss[high_index-1])/layers[high_index]["stopping"])
+        elif new_index > 0 and index == -2:
+            x_value = sum(layers[i]["areal_density"] for i in range(0, new_index)) + (Eloss_value-E_loss[new_index-1])/layers[new_index]["stopping"]
+        elif new_index >= 0 and index == -1:
+            x_value = center - sum(layers[i]["areal_density"] for i in range(new_index+1, len(layers))) + (Eloss_value-E_loss[new_index])/layers[new_index]["stopping"]
+        else:
+            x_value = center + (Eloss_value - deltaE_in)/layers[new_index]["stopping"]
+        x_conv_TFU[l] = x_value
+    return x_conv_TFU
+
+def make_target(layers: list[tuple[float, float]])-> Target:
+    target = Target()
+    target["layers"] = [Layer(data={"areal_density": AD, "stopping": S, "elements": [{"Z": 22, "percent_at": 100.0}]}) for AD, S in layers]
+    return target
+
+TARGETS = {
+    "single layer": [(1000.0, 0.08)],
+    "three layers": [(500.0, 0.05), (3000.0, 0.12), (2000.0, 0.07)],
+    "thin slabs": [(0.5, 0.1), (2.0, 0.09), (0.25, 0.3), (1.0, 0.11), (400.0, 0.06)],
+}
+
+@pytest.mark.parametrize("layers", TARGETS.values(), ids=TARGETS.keys())
+def test_energy_to_depth_matches_reference_loop(layers):
+    """
+    Every position of the resonance (in front of, inside, behind the target) and every sample position, layer boundaries
+    and the exit energy of the target included.
+    """
+    target = make_target(layers)
+    E_loss = list(mod3.loss_axis(target))
+    E_exit = mod3.E_R + E_loss[-1]  # Incident energy reaching the resonance at the back of the target
+    boundaries = mod3.E_R + np.array(E_loss)
+    for E_in in [mod3.E_R - 5.0, mod3.E_R, mod3.E_R + 0.3*E_loss[-1], *boundaries, E_exit + 1e-9, E_exit + 20.0]:
+        index = mod3.find_layer_index(E_in, E_loss)
+        center = mod3.find_total_thickness(E_in, E_loss, index, target)
+        # Profile samples around the resonance, plus the energies reaching it exactly at each layer boundary
+        x_conv = np.concatenate((np.linspace(mod3.E_R - 2*E_loss[-1], mod3.E_R + 30.0, 401), mod3.E_R - (E_in - boundaries)))
+        x_conv_TFU, new_index = mod3.energy_to_depth(x_conv, E_in, E_loss, index, center, target)
+        expected = reference_depths(x_conv, E_in, E_loss, index, center, target)
+        np.testing.assert_allclose(x_conv_TFU, expected, rtol=1e-12, atol=1e-9)
+        assert list(new_index) == [mod3.find_layer_index(E_in - mod3.E_R + E, E_loss) for E in x_conv]
@@ -0,0 +1,45 @@
+import contextlib
+import io
+
+import numpy as np
+import pytest
+
+from class_models import Layer, Target
+import mod5
+
+def make_target(AD_top: float, H_percent: float, AD_hydride: float)-> Target:
+    target = Target()
+    target["layers"] = [
+        Layer(data={"areal_density": AD_top, "stopping": 0.0, "elements": [{"Z": 14, "percent_at": 100.0}]}),
+        Layer(data={"areal_density": AD_hydride, "stopping": 0.0, "elements": [{"Z": 22, "percent_at": 100.0 - H_percent}, {"Z": 1, "percent_at": H_percent}]}),
+    ]
+    return target
+
+def test_fit_recovers_synthetic_profile():
+    """
+    Noise-free curve of Si 400 TFU on Ti60H40 800 TFU, fitted from 360 TFU and 30 at. % H: thicknesses and H content within 0.1 %.
+    """
+    energies = np.linspace(6400, 6800, 30)
+    K = 10.0
+    with contextlib.redirect_stdout(io.StringIO()):
+        R = mod5.response_matrix(make_target(400.0, 40.0, 800.0), energies, 1.0, True, "Rud corr", "voigt")
+        yields = K*R @ np.array([0.0, 40.0])
+        fitted, report = mod5.fit_profile(make_target(360.0, 30.0, 800.0), energies, yields, None, K, 1.0, True, "Rud corr", "voigt")
+
+    assert report["success"]
+    assert fitted["layers"][0]["areal_density"] == pytest.approx(400.0, rel=1e-3)
+    assert fitted["layers"][1]["areal_density"] == pytest.approx(800.0, rel=1e-3)
+    assert fitted["layers"][1].find_element(Z=1) == pytest.approx(40.0, rel=1e-3)
+
+def test_fit_with_fixed_thicknesses_is_self_consistent():
+    """
+    With fixed thicknesses, a single fit finds the H content whose stopping powers reproduce the curve (30 -> 40 at. % H).
+    """
+    energies = np.linspace(6400, 6800, 20)
+    K = 10.0
+    with contextlib.redirect_stdout(io.StringIO()):
+        yields = K*mod5.response_matrix(make_target(400.0, 40.0, 800.0), energies, 1.0, True, "Rud corr", "voigt") @ np.array([0.0, 40.0])
+        fitted, report = mod5.fit_profile(make_target(400.0, 30.0, 800.0), energies, yields, None, K, 1.0, True, "Rud corr", "voigt", fit_thickness=False)
+
+    assert fitted["layers"][1].find_element(Z=1) == pytest.approx(40.0, rel=1e-3)
+    assert report["chi2"] < 1e-6*np.sum(yields**2)
@@ -0,0 +1,44 @@
+import contextlib
+import copy
+import io
+
+import pytest
+
+from class_models import Layer, Target
+import mod2
+
+def make_target()-> Target:
+    target = Target()
+    target["layers"] = [
+        Layer(data={"areal_density": 500.0, "elements": [{"Z": 1, "percent_at": 20.0}, {"Z": 14, "percent_at": 80.0}]}),
+        Layer(data={"areal_density": 3000.0, "elements": [{"Z": 22, "percent_at": 100.0}]}),
+        Layer(data={"areal_density": 2000.0, "elements": [{"Z": 1, "percent_at": 5.0}, {"Z": 6, "percent_at": 95.0}]}),
+    ]
+    return target
+
+def segment(target: Target)-> tuple[Target, list[int], str]:
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        segmented, parents = mod2.segment_target(target, 7400.0)
+    return segmented, parents, output.getvalue()
+
+def test_edit_reuses_the_layers_in_front():
+    """
+    As in the GUI, the same unsegmented target is segmented at each run: after an edit of the second layer,
+    the first one comes from the memo and the result is the same as without the memo.
+    """
+    mod2.clear_segment_memo()
+    target = make_target()
+    assert "Reused 0/3 layers" in segment(target)[2]
+    assert "Reused 3/3 layers" in segment(target)[2]
+
+    target["layers"][1]["areal_density"] = 2500.0
+    segmented, parents, log = segment(target)
+    assert "Reused 1/3 layers" in log
+
+    mod2.clear_segment_memo()
+    reference, reference_parents, log = segment(copy.deepcopy(target))
+    assert parents == reference_parents
+    for slab, reference_slab in zip(segmented["layers"], reference["layers"]):
+        assert slab["areal_density"] == pytest.approx(reference_slab["areal_density"])
+        assert slab["stopping"] == pytest.approx(reference_slab["stopping"])
@@ -0,0 +1,34 @@
+import mod2
+
+def test_size_and_eviction(tmp_path):
+    """
+    Replacing an entry doesn't change the size, and the entries read recently survive the eviction
+    even though their last use is only written at the next put.
+    """
+    cache = mod2.StoppingCache(str(tmp_path / "cache.sqlite"), max_entries=3)
+    for energy in range(3):
+        cache.put("H10Ti90", "7:15.0", energy, 0.1*energy)
+    cache.put("H10Ti90", "7:15.0", 0, 0.5)
+    assert cache.stats()["entries"] == 3
+    assert cache.get("H10Ti90", "7:15.0", 0) == 0.5
+
+    cache.put("H10Ti90", "7:15.0", 3, 0.3)  # Evicts the least recently used entry: energy 1
+    assert cache.stats()["entries"] == 3
+    assert cache.get("H10Ti90", "7:15.0", 1) is None
+    assert cache.get("H10Ti90", "7:15.0", 0) == 0.5
+    cache.close()
+
+def test_last_uses_written_on_close(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = mod2.StoppingCache(path)
+    cache.put("Si100", "7:15.0", 1, 0.2)
+    cache.put("Si100", "7:15.0", 2, 0.3)
+    cache.get("Si100", "7:15.0", 1)
+    cache.close()
+
+    reopened = mod2.StoppingCache(path, max_entries=2)
+    assert reopened.stats()["entries"] == 2
+    reopened.put("Si100", "7:15.0", 3, 0.4)  # Energy 1 was used after energy 2 was written
+    assert reopened.get("Si100", "7:15.0", 2) is None
+    assert reopened.get("Si100", "7:15.0", 1) == 0.2
+    reopened.close()
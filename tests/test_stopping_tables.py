@@ -0,0 +1,43 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from class_models import Layer
+import mod2
+
+@pytest.fixture
+def srim_tables(monkeypatch):
+    """
+    SRIM backend in table mode on a single SRIM worker, the tables being computed without SRIM.
+    """
+    runs = []
+    def calc_stopping_table(layer, e_max):
+        runs.append(threading.current_thread().name)
+        E = np.geomspace(mod2.table_e_min, e_max, 50)
+        return E, 0.1*np.sqrt(E/1000)
+
+    pool = mod2.SRIMPool(os.path.join(mod2.settings["SRIM_path"], "SR Module"), 1)
+    monkeypatch.setattr(mod2, "_srim_pool", pool)
+    monkeypatch.setattr(mod2, "backend_name", "srim")
+    monkeypatch.setattr(mod2, "table_mode", True)
+    monkeypatch.setattr(mod2, "_stopping_tables", {})
+    monkeypatch.setattr(mod2, "calc_stopping_table", calc_stopping_table)
+    monkeypatch.setattr(mod2, "save_stopping_table", lambda *args: None)
+    yield runs
+    pool.close()
+
+def test_table_built_inside_a_stopping_task(srim_tables):
+    """
+    A stopping power submitted to the only SRIM worker builds its missing table on that worker instead of waiting on the pool.
+    """
+    layer = Layer(data={"areal_density": 100.0, "elements": [{"Z": 22, "percent_at": 100.0}]})
+    S = mod2.submit_stopping_power(layer, 6000.0).result(timeout=30)
+    assert S == pytest.approx(0.1*np.sqrt(6.0), rel=1e-6)
+    assert len(srim_tables) == 1 and srim_tables[0].startswith("SRIM")
+
+def test_tables_built_on_the_pool(srim_tables):
+    layers = [Layer(data={"areal_density": 100.0, "elements": [{"Z": Z, "percent_at": 100.0}]}) for Z in (6, 14, 22)]
+    mod2.prepare_stopping_tables(layers + layers[:1], 7000.0)
+    assert len(srim_tables) == 3 and all(name.startswith("SRIM") for name in srim_tables)